@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+"""
+End-to-end benchmarks of ctfd-cli against the local mock server.
+
+For every size (number of teams, each with 3 members) the mock is reset and:
+    bulk-add     BulkAdd.add() of a generated jsonl input
+    list         iter_users() and iter_teams() over everything that was added
+    membership   remove_members() + add_members() of the members of the teams
+
+Every result is printed as a json line (and appended to --output), with the
+duration, throughput, number of requests the mock served and the peak
+memory allocated by the cli (tracemalloc), so runs can be compared.
+
+Each transport of --transports runs the same workload, the mock speaking
+HTTP/2 (h2c) for the h2c one:
+
+    python benchmarks/bench.py --sizes 100,1000,10000 --output results.jsonl
+    python benchmarks/bench.py --transports requests,h2c --latency 0.02 --workers 16
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ctfd_cli.utils.logger import logger
+from ctfd_cli.utils.transport import get_transport
+
+# The mock serves plain http, where HTTP/2 can't be negotiated (http2 needs https).
+TRANSPORTS = ("requests", "h2c")
+
+class MockServer(object):
+
+    """Runs benchmarks/mock_server.py in a subprocess, so the server does not
+    compete with the cli for the GIL or show up in its memory usage.
+    Attributes:
+        url: Base url of the running server
+        transport: Transport the cli uses, and the server speaks (h2c: HTTP/2)
+    """
+
+    def __init__(self, latency: float = 0.0, throttle: float = 0.0, transport: str = "requests"):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "mock_server.py"), "--port", "0",
+             "--latency", str(latency), "--throttle", str(throttle)] + (["--http2"] if transport == "h2c" else []),
+            stdout=subprocess.PIPE, text=True
+        )
+        # First line: "Mock CTFd listening on http://host:port"
+        self.url = self.process.stdout.readline().split()[-1]
+        self.transport = transport
+        # The control endpoints are called with the same transport, the h2c server only speaks HTTP/2.
+        self.client = get_transport(transport, pool_size=1, instance=self.url)
+
+    def call(self, path: str, method: str = "GET") -> dict:
+        return self.client.request(method, f"{self.url}{path}", headers={}, timeout=(5, 30)).json()
+
+    def reset(self):
+        self.call("/_mock/reset", method="POST")
+
+    def stats(self) -> dict:
+        return self.call("/_mock/stats")
+
+    def stop(self):
+        self.client.close()
+        self.process.terminate()
+        self.process.wait()
+
+def generate(path: str, teams: int, members: int = 3):
+    """Writes a jsonl bulk-add input of `teams` teams."""
+    with open(path, "w") as f:
+        for i in range(teams):
+            f.write(json.dumps({
+                "name": f"Team {i}",
+                "email": f"team{i}@bench.local",
+                "affiliation": "Bench",
+                "members": [
+                    {"name": f"user{i}_{j}", "email": f"user{i}_{j}@bench.local"}
+                    for j in range(members)
+                ],
+            }) + "\n")
+
+def measure(server: MockServer, scenario: str, size: int, func, memory: bool = True, **extra) -> dict:
+    before = server.stats()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    ok = True
+    try:
+        items = func()
+    except SystemExit as E:
+        ok, items = E.code in (None, 0), 0
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if memory else None
+    if memory:
+        tracemalloc.stop()
+    after = server.stats()
+
+    requests = after["requests"] - before["requests"]
+    return {
+        "scenario": scenario,
+        "teams": size,
+        "ok": ok,
+        "items": items,
+        "seconds": round(elapsed, 4),
+        "items_per_second": round(items / elapsed, 2) if elapsed else None,
+        "requests": requests,
+        "throttled": after["throttled"] - before["throttled"],
+        "requests_per_second": round(requests / elapsed, 2) if elapsed else None,
+        "peak_mib": round(peak / (1 << 20), 3) if peak is not None else None,
+        **extra,
+    }
+
+def run(server: MockServer, size: int, workdir: str, args) -> list:
+    from ctfd_cli import CTFd
+    from ctfd_cli.users.user import UserHandler
+    from ctfd_cli.teams.team import TeamHandler
+    from ctfd_cli.utils.bulker import BulkAdd
+
+    server.reset()
+    ctfd = CTFd(server.url, "bench", pool_size=max(10, args.workers), index_ttl=0, refresh=True, health_ttl=0, transport=server.transport)
+    uh, th = UserHandler(ctfd), TeamHandler(ctfd)
+    results = []
+
+    input_file = os.path.join(workdir, f"teams-{size}.jsonl")
+    output_file = os.path.join(workdir, f"out-{size}.csv")
+    generate(input_file, size)
+    for path in (output_file, f"{output_file}.journal"):
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def bulk_add():
+        BulkAdd(input_file=input_file, format="jsonl", out_format="csv", output_file=output_file,
+                force=True, ctfd=ctfd, workers=args.workers).add()
+        return size
+    results.append(measure(server, "bulk-add", size, bulk_add, memory=args.memory, workers=args.workers))
+
+    def listing():
+        count = sum(1 for _ in uh.iter_users(mode=dict, per_page=args.per_page))
+        return count + sum(1 for _ in th.iter_teams(mode=dict, per_page=args.per_page))
+    results.append(measure(server, "list", size, listing, memory=args.memory, per_page=args.per_page))
+
+    members = {}
+    for user in uh.iter_users(mode=dict, per_page=args.per_page):
+        if user.get("team_id"):
+            members.setdefault(user["team_id"], []).append(user["id"])
+    teams = sorted(members.items())[:args.member_teams]
+
+    def membership():
+        count = 0
+        for team_id, user_ids in teams:
+            for func in (th.remove_members, th.add_members):
+                done = func(id=team_id, user_ids=user_ids, workers=args.member_workers)
+                count += sum(1 for ok in done.values() if ok)
+        return count
+    results.append(measure(server, "membership", size, membership, memory=args.memory, member_teams=len(teams), workers=args.member_workers))
+
+    # Written now, the cache directory is gone by the time atexit runs.
+    ctfd.user_index.save()
+    ctfd.team_index.save()
+    ctfd.handler.close()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ctfd-cli benchmarks")
+    parser.add_argument('--sizes', type=str, help='Comma separated number of teams to benchmark with', default="100,1000,10000")
+    parser.add_argument('--workers', type=int, help='bulk-add --workers', default=1)
+    parser.add_argument('--member-workers', type=int, help='add-member/del-member --workers', default=8)
+    parser.add_argument('--member-teams', type=int, help='Maximum number of teams used by the membership benchmark', default=1000)
+    parser.add_argument('--per-page', type=int, help='Page size used by the listings', default=50)
+    parser.add_argument('--latency', type=float, help='Delay (in seconds) added by the mock to every request', default=0.0)
+    parser.add_argument('--throttle', type=float, help='Fraction of the requests the mock answers with a 429', default=0.0)
+    parser.add_argument('--transports', type=str, help=f"Comma separated transports to compare ({', '.join(TRANSPORTS)})", default="requests")
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="Don't trace memory (tracemalloc slows the cli down)")
+    parser.add_argument('--output', '-o', type=str, help='File the results are appended to (json lines)', default=None)
+    args = parser.parse_args()
+
+    # Only errors, so stdout stays (mostly) machine readable; use --output for a clean file.
+    logger.setLevel(logging.ERROR)
+
+    meta = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "latency": args.latency,
+        "throttle": args.throttle,
+    }
+
+    transports = [transport.strip() for transport in args.transports.split(",") if transport.strip()]
+    for transport in transports:
+        if transport not in TRANSPORTS:
+            parser.error(f"Invalid transport {transport}. Must be one of: {', '.join(TRANSPORTS)}.")
+
+    for transport in transports:
+        server = MockServer(latency=args.latency, throttle=args.throttle, transport=transport)
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                # Keeps the name index and health check caches out of the user's cache.
+                os.environ["CTFD_CLI_CACHE"] = os.path.join(workdir, "cache")
+                for size in (int(size) for size in args.sizes.split(",") if size.strip()):
+                    for result in run(server, size, workdir, args):
+                        line = json.dumps({**meta, "transport": transport, **result})
+                        print(line, flush=True)
+                        if args.output:
+                            with open(args.output, "a") as f:
+                                f.write(line + "\n")
+        finally:
+            server.stop()
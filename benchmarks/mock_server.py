@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+
+"""
+Local stand-in for the parts of the CTFd REST API used by ctfd-cli:
+/api/v1/users and /api/v1/teams (listing with pagination, create, get,
+update, delete), /api/v1/users/me and /api/v1/teams/<id>/members.
+
+Everything is kept in memory. Latency and 429 responses can be injected
+to see how the cli behaves against a slow or throttling instance. With
+--http2 the server speaks HTTP/2 over cleartext (h2c, prior knowledge,
+needs the h2 package) instead of HTTP/1.1, for the h2c transport.
+
+Two extra endpoints are used by the benchmarks:
+    GET  /_mock/stats    Number of requests served (and throttled)
+    POST /_mock/reset    Drops every user and team, and resets the counters
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Fields that are never returned by the listings.
+PRIVATE = ("password", "members")
+
+class Store(object):
+
+    """In-memory users and teams of the mock instance.
+    Attributes:
+        users: id -> user (dict)
+        teams: id -> team (dict), members are kept as a list of user ids
+        requests: Number of requests served
+        throttled: Number of requests answered with a 429
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.users = {}
+        self.teams = {}
+        self.ids = {"users": 0, "teams": 0}
+        self.requests = 0
+        self.throttled = 0
+
+    def store(self, kind: str) -> dict:
+        return self.users if kind == "users" else self.teams
+
+    def next_id(self, kind: str) -> int:
+        self.ids[kind] += 1
+        return self.ids[kind]
+
+class API(object):
+
+    """The endpoints of the mock, independent of the HTTP version they are served over.
+    Attributes:
+        state: Users, teams and counters
+        latency: Delay (in seconds) added to every request
+        jitter: Random extra delay of up to this much
+        throttle: Fraction of the requests answered with a 429
+        retry_after: Retry-After (in seconds) sent with the 429s
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, throttle: float = 0.0, retry_after: float = 0.05):
+        self.state = Store()
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.retry_after = retry_after
+
+    def admit(self, path: str) -> tuple:
+        """Counts the request; returns (delay in seconds, throttled). The server waits out the delay."""
+        if path.startswith("/_mock/"):
+            return 0.0, False
+        with self.state.lock:
+            self.state.requests += 1
+            throttled = random.random() < self.throttle
+            if throttled:
+                self.state.throttled += 1
+        return self.latency + random.uniform(0, self.jitter), throttled
+
+    def respond(self, method: str, path: str, headers, payload: bytes, throttled: bool = False) -> tuple:
+        """Returns (status code, body, extra headers); `headers` only needs a case-insensitive get()."""
+        try:
+            data = json.loads(payload or b"{}")
+        except ValueError:
+            data = {}
+        url = urlparse(path)
+        query = parse_qs(url.query)
+
+        if url.path == "/_mock/stats":
+            with self.state.lock:
+                return 200, {"requests": self.state.requests, "throttled": self.state.throttled}, {}
+        if url.path == "/_mock/reset":
+            with self.state.lock:
+                self.state.reset()
+            return 200, {"success": True}, {}
+
+        if throttled:
+            return 429, {"success": False, "message": "Too many requests"}, {"Retry-After": str(self.retry_after)}
+
+        if not (headers.get("authorization") or "").startswith("Token "):
+            return 403, {"success": False, "message": "Forbidden"}, {}
+
+        with self.state.lock:
+            for kind in ("users", "teams"):
+                if url.path == f"/api/v1/{kind}":
+                    if method == "GET":
+                        return 200, self.listing(kind, query), {}
+                    if method == "POST":
+                        return (*self.create(kind, data), {})
+
+                match = re.fullmatch(rf"/api/v1/{kind}/(\d+|me)(/members)?", url.path)
+                if match:
+                    return (*self.entity(kind, match.group(1), bool(match.group(2)), method, data), {})
+
+        return 404, {"success": False, "message": "Not found"}, {}
+
+    def listing(self, kind: str, query: dict) -> dict:
+        page = max(1, int(query.get("page", ["1"])[0]))
+        per_page = max(1, int(query.get("per_page", ["50"])[0]))
+        entries = sorted(self.state.store(kind).values(), key=lambda entry: entry["id"])
+        pages = max(1, -(-len(entries) // per_page))
+        return {
+            "success": True,
+            "data": [
+                {key: value for key, value in entry.items() if key not in PRIVATE}
+                for entry in entries[(page - 1) * per_page: page * per_page]
+            ],
+            "meta": {"pagination": {
+                "page": page,
+                "next": page + 1 if page < pages else None,
+                "prev": page - 1 if page > 1 else None,
+                "pages": pages,
+                "per_page": per_page,
+                "total": len(entries),
+            }},
+        }
+
+    def create(self, kind: str, data: dict) -> tuple:
+        store = self.state.store(kind)
+        name, email = data.get("name"), data.get("email") or None
+        errors = {}
+        for entry in store.values():
+            if entry["name"] == name:
+                errors["name"] = [f"{kind[:-1].title()} name has already been taken"]
+            if email and entry.get("email") == email:
+                errors["email"] = ["Email address has already been used"]
+        if errors:
+            return 400, {"success": False, "errors": errors}
+
+        entry = {
+            "id": self.state.next_id(kind),
+            "name": name,
+            "email": email,
+            "affiliation": data.get("affiliation"),
+            "website": data.get("website"),
+            "country": data.get("country"),
+            "banned": bool(data.get("banned", False)),
+            "hidden": bool(data.get("hidden", False)),
+            "password": data.get("password"),
+        }
+        if kind == "users":
+            entry["team_id"] = data.get("team_id")
+            if entry["team_id"] in self.state.teams:
+                self.state.teams[entry["team_id"]]["members"].append(entry["id"])
+        else:
+            entry["members"] = []
+            entry["captain_id"] = None
+        store[entry["id"]] = entry
+        return 200, {"success": True, "data": {key: value for key, value in entry.items() if key != "password"}}
+
+    def entity(self, kind: str, _id: str, members: bool, method: str, data: dict) -> tuple:
+        store = self.state.store(kind)
+        if _id == "me":
+            return 200, {"success": True, "data": {"id": 1, "name": "admin"}}
+
+        _id = int(_id)
+        if _id not in store:
+            return 404, {"success": False, "message": "Not found"}
+        entry = store[_id]
+
+        if members:
+            if kind != "teams":
+                return 404, {"success": False, "message": "Not found"}
+            return self.members(entry, method, data)
+
+        if method == "GET":
+            return 200, {"success": True, "data": {key: value for key, value in entry.items() if key != "password"}}
+        if method == "PATCH":
+            entry.update({key: value for key, value in data.items() if key not in ("id", "members")})
+            return 200, {"success": True, "data": {key: value for key, value in entry.items() if key != "password"}}
+        if method == "DELETE":
+            del store[_id]
+            if kind == "teams":
+                for user_id in entry["members"]:
+                    self.state.users.get(user_id, {})["team_id"] = None
+            elif entry.get("team_id") in self.state.teams:
+                self.state.teams[entry["team_id"]]["members"].remove(_id)
+            return 200, {"success": True}
+        return 405, {"success": False, "message": "Method not allowed"}
+
+    def members(self, team: dict, method: str, data: dict) -> tuple:
+        if method == "GET":
+            return 200, {"success": True, "data": list(team["members"])}
+
+        user = self.state.users.get(data.get("user_id"))
+        if user is None:
+            return 404, {"success": False, "message": "Not found"}
+
+        if method == "POST":
+            if user.get("team_id"):
+                return 400, {"success": False, "errors": {"id": ["User has already joined a team"]}}
+            user["team_id"] = team["id"]
+            team["members"].append(user["id"])
+        elif method == "DELETE":
+            if user["id"] not in team["members"]:
+                return 400, {"success": False, "errors": {"id": ["User is not part of this team"]}}
+            user["team_id"] = None
+            team["members"].remove(user["id"])
+        else:
+            return 405, {"success": False, "message": "Method not allowed"}
+        return 200, {"success": True, "data": list(team["members"])}
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    """HTTP/1.1 request handler, the API is set by serve()."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which Nagle would delay.
+    disable_nagle_algorithm = True
+    api = None
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, code: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def handle_any(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = self.rfile.read(length) if length else b""
+        delay, throttled = self.api.admit(self.path)
+        if delay:
+            time.sleep(delay)
+        self.send(*self.api.respond(method, self.path, self.headers, payload, throttled))
+
+    def do_GET(self):
+        self.handle_any("GET")
+
+    def do_POST(self):
+        self.handle_any("POST")
+
+    def do_PATCH(self):
+        self.handle_any("PATCH")
+
+    def do_DELETE(self):
+        self.handle_any("DELETE")
+
+class H2Protocol(asyncio.Protocol):
+
+    """One HTTP/2 connection: every stream is answered by its own task, so
+    the (simulated) latency of concurrent requests overlaps like it does
+    with the threads of the HTTP/1.1 server."""
+
+    def __init__(self, api: API):
+        import h2.config
+        import h2.connection
+
+        self.api = api
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        # stream id -> (headers, body) of the requests being received
+        self.streams = {}
+        # stream id -> future resolved when the client opens its flow control window
+        self.waiting = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.flush()
+
+    def connection_lost(self, exc):
+        for future in self.waiting.values():
+            if not future.done():
+                future.cancel()
+        self.waiting = {}
+
+    def flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            self.transport.write(data)
+
+    def data_received(self, data: bytes):
+        import h2.events
+        import h2.exceptions
+
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError:
+            self.flush()
+            self.transport.close()
+            return
+
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                self.streams[event.stream_id] = ({key.lower(): value for key, value in event.headers}, bytearray())
+            elif isinstance(event, h2.events.DataReceived):
+                self.streams[event.stream_id][1].extend(event.data)
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                headers, body = self.streams.pop(event.stream_id)
+                asyncio.ensure_future(self.answer(event.stream_id, headers, bytes(body)))
+            elif isinstance(event, h2.events.WindowUpdated):
+                # Stream 0 is the connection window, which every stream shares.
+                for stream_id in list(self.waiting) if event.stream_id == 0 else [event.stream_id]:
+                    future = self.waiting.pop(stream_id, None)
+                    if future is not None and not future.done():
+                        future.set_result(None)
+            elif isinstance(event, h2.events.StreamReset):
+                self.streams.pop(event.stream_id, None)
+                future = self.waiting.pop(event.stream_id, None)
+                if future is not None and not future.done():
+                    future.cancel()
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.transport.close()
+        self.flush()
+
+    async def answer(self, stream_id: int, headers: dict, payload: bytes):
+        import h2.exceptions
+
+        path = headers.get(":path", "/")
+        delay, throttled = self.api.admit(path)
+        if delay:
+            await asyncio.sleep(delay)
+        code, body, extra = self.api.respond(headers.get(":method", "GET"), path, headers, payload, throttled)
+        data = json.dumps(body).encode()
+
+        try:
+            self.conn.send_headers(stream_id, [
+                (":status", str(code)),
+                ("content-type", "application/json"),
+                ("content-length", str(len(data))),
+            ] + [(key.lower(), value) for key, value in extra.items()])
+            while data:
+                window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+                if window <= 0:
+                    self.flush()
+                    self.waiting[stream_id] = asyncio.get_running_loop().create_future()
+                    await self.waiting[stream_id]
+                    continue
+                self.conn.send_data(stream_id, data[:window])
+                data = data[window:]
+            self.conn.end_stream(stream_id)
+            self.flush()
+        except (h2.exceptions.StreamClosedError, h2.exceptions.ProtocolError, asyncio.CancelledError):
+            # The client reset the stream or went away.
+            pass
+
+class H2Server(object):
+
+    """HTTP/2 (h2c) server with the interface of the HTTP/1.1 one (server_address, serve_forever, shutdown)."""
+
+    def __init__(self, host: str, port: int, api: API):
+        if importlib.util.find_spec("h2") is None:
+            raise SystemExit("The h2 package is required for --http2 (pip install h2)")
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(self.loop.create_server(lambda: H2Protocol(api), host, port))
+        self.server_address = self.server.sockets[0].getsockname()
+        self.stopped = threading.Event()
+
+    def serve_forever(self):
+        try:
+            self.loop.run_until_complete(self.server.serve_forever())
+        except asyncio.CancelledError:
+            # Stopped by shutdown().
+            pass
+        finally:
+            self.server.close()
+            self.loop.close()
+            self.stopped.set()
+
+    def shutdown(self):
+        """Stops serve_forever (running in another thread) and waits for it to return."""
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.stopped.wait()
+
+def serve(host: str = "127.0.0.1", port: int = 8000, latency: float = 0.0, jitter: float = 0.0, throttle: float = 0.0, retry_after: float = 0.05, http2: bool = False):
+    """Returns a (not yet started) mock server, `port` 0 picks a free port."""
+    api = API(latency, jitter, throttle, retry_after)
+    if http2:
+        return H2Server(host, port, api)
+    handler = type("Handler", (MockHandler,), {"api": api})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock CTFd API server")
+    parser.add_argument('--host', type=str, help='Address to listen on', default="127.0.0.1")
+    parser.add_argument('--port', type=int, help='Port to listen on', default=8000)
+    parser.add_argument('--latency', type=float, help='Delay (in seconds) added to every request', default=0.0)
+    parser.add_argument('--jitter', type=float, help='Random extra delay (in seconds) of up to this much', default=0.0)
+    parser.add_argument('--throttle', type=float, help='Fraction of the requests answered with a 429 (0 to 1)', default=0.0)
+    parser.add_argument('--retry-after', type=float, help='Retry-After (in seconds) sent with the 429s', default=0.05)
+    parser.add_argument('--http2', action='store_true', help='Speak HTTP/2 over cleartext (h2c, prior knowledge) instead of HTTP/1.1')
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency, args.jitter, args.throttle, args.retry_after, args.http2)
+    print(f"Mock CTFd listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,20 +1,38 @@
 #!/usr/bin/env python3
 
 import argparse
+import atexit
+import sys
 from pprint import pprint
 import json
+import logging
 
-from ctfd_cli import CTFd
-from ctfd_cli.utils.logger import logger
-from ctfd_cli.users.user import UserHandler
-from ctfd_cli.teams.team import TeamHandler
-from ctfd_cli.utils.parser import Parser
-from ctfd_cli.utils.bulker import BulkAdd
+from ctfd_cli.utils.logger import logger, Logger
+from ctfd_cli.utils.utils import boolean, discard_output, get_user_ids as user_ids
 
 
 parser = argparse.ArgumentParser(description='CTFd CLI')
+parser.add_argument('-v', '--verbose', action='count', help='Show debug messages', default=0)
+parser.add_argument('-q', '--quiet', action='count', help='Only show warnings (-qq: only errors)', default=0)
+parser.add_argument('--log-format', type=str, help='Format of the log messages (json: one json object per line)', default="text", choices=["text", "json"])
 parser.add_argument('--ctfd-instance', type=str, help='CTFd instance URL', default=None)
 parser.add_argument('--ctfd-token', type=str, help='CTFd admin token', default=None)
+parser.add_argument('--pool-size', type=int, help='Number of pooled keep-alive connections to the CTFd instance', default=10)
+parser.add_argument('--connect-timeout', type=float, help='Connect timeout (in seconds) for every request', default=5)
+parser.add_argument('--read-timeout', type=float, help='Read timeout (in seconds) for every request', default=30)
+parser.add_argument('--retries', type=int, help='Number of times a throttled (429) or failed (5xx) request is retried', default=5)
+parser.add_argument('--rate-limit', type=float, help='Maximum number of requests per second (0 for no limit)', default=0)
+parser.add_argument('--transport', type=str, help='HTTP client used for the requests (http2: multiplexed over a few connections, needs httpx[http2] and an https instance; h2c: HTTP/2 over plain http)', default="requests", choices=["requests", "http2", "h2c"])
+parser.add_argument('--index-ttl', type=int, help='Seconds after which the local name -> id index is rebuilt', default=300)
+parser.add_argument('--refresh', action='store_true', help='Ignore the local name -> id index and rebuild it')
+parser.add_argument('--stats', action='store_true', help='Print a summary of the requests made (per endpoint timings, status codes, retries, sizes) at exit')
+parser.add_argument('--stats-file', type=str, help='Write the request metrics to this file at exit', default=None)
+parser.add_argument('--stats-format', type=str, help='Format of --stats-file', default="json", choices=["json", "prometheus"])
+parser.add_argument('--offline', action='store_true', help='Serve user/team get and list from the local mirror (see sync) instead of the instance')
+parser.add_argument('--mirror-file', type=str, help='Location of the local mirror (SQLite) used by sync and --offline', default=None)
+parser.add_argument('--health-ttl', type=int, help='Seconds during which a successful connection check is reused (0 to always check)', default=60)
+parser.add_argument('--socket', type=str, help='Unix socket of the daemon (default: $CTFD_CLI_SOCKET, or daemon.sock in the cache directory)', default=None)
+parser.add_argument('--no-daemon', action='store_true', help='Run the command in this process even if a daemon is running')
 subparsers = parser.add_subparsers(required=True, dest='mode')
 
 user_parser = subparsers.add_parser('user', help='User mode')
@@ -26,9 +44,9 @@ user_create_parser.add_argument('--password', type=str, help='Password', require
 user_create_parser.add_argument('--email', type=str, help='Email', default="")
 user_create_parser.add_argument('--team-id', type=int, help='Team ID', default=None)
 user_create_parser.add_argument('--role', type=str, help='Role', default="user")
-user_create_parser.add_argument('--verified', type=bool, help='Verified', default=False)
-user_create_parser.add_argument('--banned', type=bool, help='Banned', default=False)
-user_create_parser.add_argument('--hidden', type=bool, help='Hidden', default=False)
+user_create_parser.add_argument('--verified', type=boolean, help='Verified (true/false)', default=False)
+user_create_parser.add_argument('--banned', type=boolean, help='Banned (true/false)', default=False)
+user_create_parser.add_argument('--hidden', type=boolean, help='Hidden (true/false)', default=False)
 user_delete_parser = user_subparsers.add_parser('delete', help='Delete user')
 user_delete_parser.add_argument('--user-id', type=int, help='User ID', required=True)
 user_update_parser = user_subparsers.add_parser('update', help='Update user')
@@ -38,6 +56,7 @@ user_update_parser.add_argument('--attributes-json', type=str, help='Attributes
 user_get_parser = user_subparsers.add_parser('get', help='Get user')
 user_get_parser.add_argument('--user-id', type=int, help='User ID', required=True)
 user_list_parser = user_subparsers.add_parser('list', help='List users')
+user_list_parser.add_argument('--per-page', type=int, help='Number of users fetched per page', default=50)
 user_ban_parser = user_subparsers.add_parser('ban', help='Ban user')
 user_ban_parser.add_argument('--user-id', type=int, help='User ID', required=True)
 user_unban_parser = user_subparsers.add_parser('unban', help='Unban user')
@@ -61,11 +80,15 @@ team_add_member_parser = team_subparsers.add_parser('add-member', help='Add memb
 team_add_member_parser.add_argument('--team-id', type=int, help='Team ID', required=True)
 team_add_member_parser.add_argument('--user-id', type=int, help='User ID')
 team_add_member_parser.add_argument('--user-ids', type=str, help='List of User IDs (comma separated)')
+team_add_member_parser.add_argument('--user-ids-file', type=str, help='File containing User IDs (one per line or comma separated)')
+team_add_member_parser.add_argument('--workers', type=int, help='Number of users to add in parallel', default=8)
 
 team_del_member_parser = team_subparsers.add_parser('del-member', help='Remove member from team')
 team_del_member_parser.add_argument('--team-id', type=int, help='Team ID', required=True)
 team_del_member_parser.add_argument('--user-id', type=int, help='User ID')
 team_del_member_parser.add_argument('--user-ids', type=str, help='List of User IDs (comma separated)')
+team_del_member_parser.add_argument('--user-ids-file', type=str, help='File containing User IDs (one per line or comma separated)')
+team_del_member_parser.add_argument('--workers', type=int, help='Number of users to remove in parallel', default=8)
 
 team_delete_parser = team_subparsers.add_parser('delete', help='Delete team')
 team_delete_parser.add_argument('--team-id', type=int, help='Team ID', required=True)
@@ -78,6 +101,7 @@ team_update_parser.add_argument('--attributes-json', type=str, help='Attributes
 team_get_parser = team_subparsers.add_parser('get', help='Get team')
 team_get_parser.add_argument('--team-id', type=int, help='Team ID', required=True)
 team_list_parser = team_subparsers.add_parser('list', help='List teams')
+team_list_parser.add_argument('--per-page', type=int, help='Number of teams fetched per page', default=50)
 
 team_ban_parser = team_subparsers.add_parser('ban', help='Ban team')
 team_ban_parser.add_argument('--team-id', type=int, help='Team ID', required=True)
@@ -86,10 +110,54 @@ team_unban_parser.add_argument('--team-id', type=int, help='Team ID', required=T
 
 bulker_parser = subparsers.add_parser('bulk-add', help="Add team and users in bulk (using csv, json and yaml files)")
 bulker_parser.add_argument('--file', '-f', type=str, help="File to add teams from (Check samples/sample.{csv,json,yaml})")
-bulker_parser.add_argument('--format', type=str, help="Format of the input file (csv, json, yaml)", default="", choices=["csv", "json", "yaml"])
+bulker_parser.add_argument('--format', type=str, help="Format of the input file (csv, json, jsonl, yaml)", default="", choices=["csv", "json", "jsonl", "yaml"])
 bulker_parser.add_argument('--output-format', type=str, help="Output format, can be json, yaml or csv", default="csv", choices=["json", "yaml", "csv"])
 bulker_parser.add_argument('--output-file', '-o', type=str, help="Output file, if not specified, will be printed to stdout")
 bulker_parser.add_argument('--force', action="store_true", help="Force overwrite output file if it exists")
+bulker_parser.add_argument('--conflicts-file', type=str, help="Save the report of the conflicts found in the input (json)", default=None)
+bulker_parser.add_argument('--workers', type=int, help="Number of teams to add in parallel", default=1)
+
+reconcile_parser = subparsers.add_parser('reconcile', help="Make the instance match a roster (same input as bulk-add): create, update, move and optionally delete")
+reconcile_parser.add_argument('--file', '-f', type=str, help="Roster file (Check samples/sample.{csv,json,yaml})")
+reconcile_parser.add_argument('--format', type=str, help="Format of the input file (default: from the extension)", default="", choices=["csv", "json", "jsonl", "yaml"])
+reconcile_parser.add_argument('--force', action="store_true", help="Apply the plan (without it, only the diff is shown)")
+reconcile_parser.add_argument('--delete', action="store_true", help="Also delete the teams and users (except admins) that aren't in the roster")
+reconcile_parser.add_argument('--output-file', '-o', type=str, help="Append the credentials of the created users to this file (json lines)", default=None)
+reconcile_parser.add_argument('--workers', type=int, help="Number of teams to reconcile in parallel", default=1)
+
+sync_parser = subparsers.add_parser('sync', help='Mirror the users and teams of the instance into a local SQLite database')
+sync_parser.add_argument('--full', action='store_true', help='Download everything again instead of only what was added since the last sync')
+sync_parser.add_argument('--only', type=str, help='Only sync users or teams', default=None, choices=["users", "teams"])
+sync_parser.add_argument('--per-page', type=int, help='Number of entries fetched per page', default=50)
+
+query_parser = subparsers.add_parser('query', aliases=['stats'], help='Filter, count and project users or teams (streamed from the instance, or from the mirror with --offline)')
+query_parser.add_argument('kind', type=str, help='What to query', choices=["users", "teams"])
+query_parser.add_argument('--where', '-w', type=str, action='append', help='Filter, e.g. team_id=null, email~@gmail, country!=PK, id>100 (can be repeated)', default=[])
+query_parser.add_argument('--group-by', '-g', type=str, help='Count the matching entries by these fields (comma separated), e.g. affiliation,country or email_domain', default=None)
+query_parser.add_argument('--fields', '-f', type=str, help='Fields to output (comma separated)', default=None)
+query_parser.add_argument('--sort', type=str, help='Output field to sort on', default=None)
+query_parser.add_argument('--desc', action='store_true', help='Sort in descending order')
+query_parser.add_argument('--limit', type=int, help='Maximum number of rows', default=None)
+query_parser.add_argument('--output-format', type=str, help='Output format', default="table", choices=["table", "csv", "jsonl"])
+query_parser.add_argument('--per-page', type=int, help='Number of entries fetched per page (when not --offline)', default=50)
+
+export_parser = subparsers.add_parser('export', help='Export every user or team to csv, json lines, parquet or arrow')
+export_parser.add_argument('kind', type=str, help='What to export', choices=["users", "teams"])
+export_parser.add_argument('--output-file', '-o', type=str, help='Output file', required=True)
+export_parser.add_argument('--format', type=str, help='Output format (parquet and arrow need pyarrow)', default="csv", choices=["csv", "jsonl", "parquet", "arrow"])
+export_parser.add_argument('--fields', '-f', type=str, help='Fields to export (comma separated), all but password/secret/oauth_id by default', default=None)
+export_parser.add_argument('--per-page', type=int, help='Number of entries fetched per page (when not --offline)', default=50)
+export_parser.add_argument('--batch-size', type=int, help='Rows per parquet row group / arrow batch', default=10000)
+
+batch_parser = subparsers.add_parser('batch', help='Run a file of user/team operations (cli-style or json lines) in one process')
+batch_parser.add_argument('--file', '-f', type=str, help='File of operations, one per line', required=True)
+batch_parser.add_argument('--output-file', '-o', type=str, help='Write the result of every line (json lines) to this file instead of stdout', default=None)
+batch_parser.add_argument('--workers', type=int, help='Number of operations run in parallel (operations on the same user/team stay in order)', default=8)
+
+shell_parser = subparsers.add_parser('shell', help='Interactive shell that keeps the connection, pool and caches across commands')
+
+daemon_parser = subparsers.add_parser('daemon', help='Serve user, team and query commands over a local Unix socket, so single commands skip startup')
+daemon_parser.add_argument('--stop', action='store_true', help='Stop the running daemon')
 
 parser_parser = subparsers.add_parser('parse', help='Parse a CSV file into a format that CTFD-CLI will understand (currently works only with Google Forms csv sheets)')
 parser_parser.add_argument('--csv-file', type=str, help="CSV File to parse (Check samples/sample.csv)")
@@ -98,244 +166,499 @@ parser_parser.add_argument('--output-file', type=str, help="Output file, if not
 parser_parser.add_argument('--format', type=str, help="The format that the input csv file is in. Please run --help-format for more information", default="")
 parser_parser.add_argument('--help-format', action="store_true", help="Prints the format that the input csv file should be in")
 
-args = parser.parse_args()
-
-ctfd = CTFd(args.ctfd_instance, args.ctfd_token)
-
-if args.mode == "user":
-    uh = UserHandler(ctfd)
-    if args.user_mode == "create":
-        user = uh.create_user(
-            name=args.name,
-            password=args.password,
-            email=args.email,
-            team_id=args.team_id,
-            role=args.role,
-            verified=args.verified,
-            banned=args.banned,
-            hidden=args.hidden
+def get_user_ids(args) -> list:
+    """Returns the (unique) user ids given with --user-id, --user-ids or --user-ids-file."""
+    try:
+        return user_ids(args)
+    except FileNotFoundError:
+        logger.error(f"File {args.user_ids_file} not found")
+        exit(1)
+    except ValueError as E:
+        logger.error(f"Invalid user id: {E}")
+        exit(1)
+
+# Commands that are sent to the daemon when one is running.
+FORWARDED = ("user", "team", "query", "stats")
+
+# Global options, and their defaults (see execute).
+GLOBALS = {action.dest: action.default for action in parser._actions if action.option_strings and action.dest != "help"}
+
+# Set by the shell and the daemon: connection settings -> CTFd, shared by every command.
+sessions = None
+# Stats to report at the end of the current shell/daemon command.
+reports = []
+
+def connect(args):
+    """Connects to the CTFd instance; only done by the commands that need it."""
+    from ctfd_cli import CTFd
+    from ctfd_cli.utils.transport import TransportError
+
+    # Every bulk-add worker needs its own pooled connection.
+    pool_size = max(args.pool_size, getattr(args, "workers", 1))
+
+    def create():
+        try:
+            return CTFd(args.ctfd_instance, args.ctfd_token, pool_size=pool_size, connect_timeout=args.connect_timeout, read_timeout=args.read_timeout, index_ttl=args.index_ttl, refresh=args.refresh, retries=args.retries, rate_limit=args.rate_limit, health_ttl=args.health_ttl, offline=args.offline, mirror_file=args.mirror_file, transport=args.transport)
+        except TransportError as E:
+            # --transport can't be used here (missing dependency, plain http instance).
+            logger.error(str(E))
+            exit(1)
+
+    if sessions is not None:
+        from ctfd_cli.utils.utils import get_env
+        key = (
+            get_env("CTFD_INSTANCE", curr=args.ctfd_instance, default=""), get_env("CTFD_ADMIN_TOKEN", curr=args.ctfd_token, default=""),
+            pool_size, args.connect_timeout, args.read_timeout, args.index_ttl, args.retries, args.rate_limit, args.offline, args.mirror_file, args.transport,
         )
-        if user == None:
-            logger.error(f"Failed to create user {args.name}")
+        if key not in sessions:
+            sessions[key] = create()
+        ctfd = sessions[key]
+        if args.stats or args.stats_file:
+            # Only the requests of this command are reported.
+            ctfd.handler.metrics.reset()
+            reports.append((args, ctfd.handler.metrics))
+        return ctfd
+
+    ctfd = create()
+    if args.stats or args.stats_file:
+        atexit.register(report_stats, args, ctfd.handler.metrics)
+    return ctfd
+
+def report_stats(args, metrics):
+    """Prints and/or saves the request metrics; runs at exit, so failed commands are reported too."""
+    if args.stats:
+        print(metrics.summary(), file=sys.stderr)
+    if args.stats_file:
+        try:
+            with open(args.stats_file, "w") as f:
+                f.write(metrics.to_prometheus() if args.stats_format == "prometheus" else metrics.to_json())
+        except OSError as E:
+            logger.error(f"Unable to write the stats to {args.stats_file}: {E}")
+
+def get_records(args):
+    """Streams the users/teams (raw dicts) from the instance, or from the mirror with --offline.
+    A page that can't be fetched raises, the listing is never silently cut short."""
+    ctfd = connect(args)
+    if args.offline:
+        return ctfd.mirror.iter(args.kind)
+    if args.kind == "users":
+        from ctfd_cli.users.user import UserHandler
+        return UserHandler(ctfd).iter_users(mode=dict, per_page=args.per_page)
+    from ctfd_cli.teams.team import TeamHandler
+    return TeamHandler(ctfd).iter_teams(mode=dict, per_page=args.per_page)
+
+def execute(argv: list, defaults: dict = None) -> int:
+    """
+    Runs a single command inside the shell or the daemon, and returns its
+    exit code. Global options the command doesn't set are taken from
+    `defaults` (those of the shell/daemon). Failures, `exit()` included,
+    only end the command, never the session.
+    """
+    reports.clear()
+    try:
+        args = parser.parse_args(argv)
+        for key, value in (defaults or {}).items():
+            if getattr(args, key) == GLOBALS[key]:
+                setattr(args, key, value)
+        if args.mode in ("shell", "daemon"):
+            logger.error(f"{args.mode} can't be started from a shell or the daemon.")
             exit(1)
-        logger.info(f"Created user {user}")
-    elif args.user_mode == "delete":
-        if uh.delete_user(id=args.user_id):
-            logger.info(f"Deleted user {args.user_id}")
+        run(prepare(args))
+        code = 0
+    except SystemExit as E:
+        code = E.code if isinstance(E.code, int) else (0 if E.code is None else 1)
+    except KeyboardInterrupt:
+        logger.error("Interrupted.")
+        code = 130
+    except Exception as E:
+        logger.error(f"{E.__class__.__name__}: {E}")
+        code = 1
+
+    for args, metrics in reports:
+        report_stats(args, metrics)
+    # Writes out the records of this command before returning.
+    Logger.configure(logger, stream=sys.__stdout__)
+    return code
+
+def start_session(args) -> dict:
+    """Makes the connections outlive the commands (shell/daemon); returns the global options the commands inherit."""
+    global sessions
+    import builtins
+    # The builtin exit() also closes stdin, which would end the shell.
+    builtins.exit = builtins.quit = sys.exit
+    sessions = {}
+
+    # Connects (health check, pool) before the first command, when the settings allow it.
+    try:
+        connect(args)
+    except SystemExit:
+        pass
+    except Exception as E:
+        logger.warning(f"Not connected yet: {E}")
+    return {key: getattr(args, key) for key in GLOBALS}
+
+def prepare(args):
+    """Applies the global options that don't need a connection, and returns the args."""
+    if args.mode == "stats":
+        args.mode = "query"
+
+    if args.offline and not (args.mode in ("query", "export") or (args.mode in ("user", "team") and getattr(args, f"{args.mode}_mode") in ("get", "list"))):
+        parser.error("--offline can only be used with query and user/team get and list")
+
+    levels = [logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR]
+    Logger.configure(logger, level=levels[max(0, min(len(levels) - 1, 1 + args.quiet - args.verbose))], json_lines=args.log_format == "json", stream=sys.stdout)
+    return args
+
+def run(args):
+    """Runs a parsed command."""
+    if args.mode == "user":
+        from ctfd_cli.users.user import UserHandler
+        uh = UserHandler(connect(args))
+        if args.user_mode == "create":
+            user = uh.create_user(
+                name=args.name,
+                password=args.password,
+                email=args.email,
+                team_id=args.team_id,
+                role=args.role,
+                verified=args.verified,
+                banned=args.banned,
+                hidden=args.hidden
+            )
+            if user == None:
+                logger.error(f"Failed to create user {args.name}")
+                exit(1)
+            logger.info(f"Created user {user}")
+        elif args.user_mode == "delete":
+            if uh.delete_user(id=args.user_id):
+                logger.info(f"Deleted user {args.user_id}")
+            else:
+                logger.error(f"Failed to delete user {args.user_id}")
+                exit(1)
+        elif args.user_mode == "update":
+
+            if args.attributes == None and args.attributes_json == None:
+                logger.error(f"No attributes were set to update.")
+                exit(1)
+
+            if args.attributes_json != None:
+                try:
+                    with open(args.attributes_json, "r") as f:
+                        args.attributes = f.read()
+                except FileNotFoundError:
+                    logger.error(f"File {args.attributes_json} not found")
+                    exit(1)
+
+            if args.attributes == None:
+                logger.error(f"No attributes were set to update.")
+                exit(1)
+
+            try:
+                attr = json.loads(args.attributes)
+            except json.decoder.JSONDecodeError:
+                logger.error(f"Invalid attributes {args.attributes}")
+                exit(1)
+            user = uh.update_user_attribute(id=args.user_id, attributes=attr, mode=dict)
+            if user == None:
+                logger.error(f"Failed to update user {args.user_id}")
+                exit(1)
+            logger.info(f"Updated user {user}")
+        elif args.user_mode == "get":
+            user = uh.get_user_by_id(id=args.user_id, mode=dict)
+            if user == None:
+                logger.error(f"Failed to get user {args.user_id}")
+                exit(1)
+            logger.info(f"Got user {user}")
+        elif args.user_mode == "list":
+            # Printed as the pages arrive instead of after the whole listing.
+            try:
+                for user in uh.iter_users(mode=dict, per_page=args.per_page):
+                    pprint(user)
+            except BrokenPipeError:
+                # The reader went away (e.g. `| head`).
+                discard_output()
+                exit(1)
+            except Exception as E:
+                logger.error(f"Failed to list the users: {E}")
+                exit(1)
+        elif args.user_mode == "ban":
+            if uh.ban_user(id=args.user_id):
+                logger.info(f"Banned user {args.user_id}")
+            else:
+                logger.error(f"Failed to ban user {args.user_id}")
+                exit(1)
+        elif args.user_mode == "unban":
+            if uh.unban_user(id=args.user_id):
+                logger.info(f"Unbanned user {args.user_id}")
+            else:
+                logger.error(f"Failed to unban user {args.user_id}")
+                exit(1)
+        elif args.user_mode == "hide":
+            if uh.hide_user(id=args.user_id):
+                logger.info(f"Hid user {args.user_id}")
+            else:
+                logger.error(f"Failed to hide user {args.user_id}")
+                exit(1)
+        elif args.user_mode == "unhide":
+            if uh.unhide_user(id=args.user_id):
+                logger.info(f"Unhid user {args.user_id}")
+            else:
+                logger.error(f"Failed to unhide user {args.user_id}")
+                exit(1)
         else:
-            logger.error(f"Failed to delete user {args.user_id}")
+            logger.error(f"Invalid user mode {args.user_mode}")
             exit(1)
-    elif args.user_mode == "update":
 
-        if args.attributes == None and args.attributes_json == None:
-            logger.error(f"No attributes were set to update.")
-            exit(1)
+    elif args.mode == "team":
+        from ctfd_cli.teams.team import TeamHandler
+        th = TeamHandler(connect(args))
+        if args.team_mode == "create":
+            team = th.create_team(
+                name=args.name,
+                password=args.password,
+                email=args.email,
+                affiliation=args.affiliation,
+                country=args.country,
+            )
+            if team == None:
+                logger.error(f"Failed to create team {args.name}")
+                exit(1)
+            logger.info(f"Created team {team}")
+        elif args.team_mode == "delete":
+            if th.delete_team(id=args.team_id):
+                logger.info(f"Deleted team {args.team_id}")
+            else:
+                logger.error(f"Failed to delete team {args.team_id}")
+                exit(1)
+        elif args.team_mode == "update":
+
+            if args.attributes == None and args.attributes_json == None:
+                logger.error(f"No attributes were set to update.")
+                exit(1)
+
+            if args.attributes_json != None:
+                try:
+                    with open(args.attributes_json, "r") as f:
+                        args.attributes = f.read()
+                except FileNotFoundError:
+                    logger.error(f"File {args.attributes_json} not found")
+                    exit(1)
+
+            if args.attributes == None:
+                logger.error(f"No attributes were set to update.")
+                exit(1)
 
-        if args.attributes_json != None:
             try:
-                with open(args.attributes_json, "r") as f:
-                    args.attributes = f.read()
-            except FileNotFoundError:
-                logger.error(f"File {args.attributes_json} not found")
+                attr = json.loads(args.attributes)
+            except json.decoder.JSONDecodeError:
+                logger.error(f"Invalid attributes {args.attributes}")
+                exit(1)
+            team = th.update_team_attribute(id=args.team_id, attributes=attr, mode=dict)
+            if team == None:
+                logger.error(f"Failed to update team {args.team_id}")
+                exit(1)
+            logger.info(f"Updated team {team}")
+        elif args.team_mode == "get":
+            team = th.get_team_by_id(id=args.team_id, mode=dict)
+            if team == None:
+                logger.error(f"Failed to get team {args.team_id}")
+                exit(1)
+            logger.info(f"Got team {team}")
+        elif args.team_mode == "list":
+            # Printed as the pages arrive instead of after the whole listing.
+            try:
+                for team in th.iter_teams(mode=dict, per_page=args.per_page):
+                    pprint(team)
+            except BrokenPipeError:
+                # The reader went away (e.g. `| head`).
+                discard_output()
+                exit(1)
+            except Exception as E:
+                logger.error(f"Failed to list the teams: {E}")
+                exit(1)
+        elif args.team_mode in ("add-member", "del-member"):
+            user_ids = get_user_ids(args)
+            if user_ids == None:
+                logger.error(f"Please specify either --user-id, --user-ids or --user-ids-file")
                 exit(1)
 
-        if args.attributes == None:
-            logger.error(f"No attributes were set to update.")
-            exit(1)
+            if args.team_mode == "add-member":
+                results = th.add_members(id=args.team_id, user_ids=user_ids, workers=args.workers)
+                done, failed = "Added user {} to team {}", "Failed to add user {} to team {}"
+            else:
+                results = th.remove_members(id=args.team_id, user_ids=user_ids, workers=args.workers)
+                done, failed = "Removed user {} from team {}", "Failed to remove user {} from team {}"
 
-        try:
-            attr = json.loads(args.attributes)
-        except json.decoder.JSONDecodeError:
-            logger.error(f"Invalid attributes {args.attributes}")
-            exit(1)
-        user = uh.update_user_attribute(id=args.user_id, attributes=attr, mode=dict)
-        if user == None:
-            logger.error(f"Failed to update user {args.user_id}")
-            exit(1)
-        logger.info(f"Updated user {user}")
-    elif args.user_mode == "get":
-        user = uh.get_user_by_id(id=args.user_id, mode=dict)
-        if user == None:
-            logger.error(f"Failed to get user {args.user_id}")
-            exit(1)
-        logger.info(f"Got user {user}")
-    elif args.user_mode == "list":
-        users = uh.get_all_users(mode=dict)
-        if users == None:
-            logger.error(f"Failed to get users")
-            exit(1)
-        pprint(users)
-    elif args.user_mode == "ban":
-        if uh.ban_user(id=args.user_id):
-            logger.info(f"Banned user {args.user_id}")
-        else:
-            logger.error(f"Failed to ban user {args.user_id}")
-            exit(1)
-    elif args.user_mode == "unban":
-        if uh.unban_user(id=args.user_id):
-            logger.info(f"Unbanned user {args.user_id}")
-        else:
-            logger.error(f"Failed to unban user {args.user_id}")
-            exit(1)
-    elif args.user_mode == "hide":
-        if uh.hide_user(id=args.user_id):
-            logger.info(f"Hid user {args.user_id}")
+            for user_id in user_ids:
+                if results.get(user_id):
+                    logger.info(done.format(user_id, args.team_id))
+                else:
+                    logger.error(failed.format(user_id, args.team_id))
+
+            if not all(results.get(user_id) for user_id in user_ids):
+                exit(1)
+        elif args.team_mode == "ban":
+            if th.ban_team(id=args.team_id):
+                logger.info(f"Banned team {args.team_id}")
+            else:
+                logger.error(f"Failed to ban team {args.team_id}")
+                exit(1)
+        elif args.team_mode == "unban":
+            if th.unban_team(id=args.team_id):
+                logger.info(f"Unbanned team {args.team_id}")
+            else:
+                logger.error(f"Failed to unban team {args.team_id}")
+                exit(1)
         else:
-            logger.error(f"Failed to hide user {args.user_id}")
+            logger.error(f"Invalid team mode {args.team_mode}")
             exit(1)
-    elif args.user_mode == "unhide":
-        if uh.unhide_user(id=args.user_id):
-            logger.info(f"Unhid user {args.user_id}")
-        else:
-            logger.error(f"Failed to unhide user {args.user_id}")
+
+    elif args.mode == "bulk-add":
+        """
+            Check if csv-file, json-file or yaml-file is set
+            If none is set, give error:
+        """
+        if not args.file:
+            logger.error(f"Please specify a csv-file, json-file or yaml-file")
             exit(1)
-    else:
-        logger.error(f"Invalid user mode {args.user_mode}")
-        exit(1)
 
-elif args.mode == "team":
-    th = TeamHandler(ctfd)
-    if args.team_mode == "create":
-        team = th.create_team(
-            name=args.name,
-            password=args.password,
-            email=args.email,
-            affiliation=args.affiliation,
-            country=args.country,
-        )
-        if team == None:
-            logger.error(f"Failed to create team {args.name}")
+        if args.output_format == None:
+            logger.error(f"Please specify an output format")
             exit(1)
-        logger.info(f"Created team {team}")
-    elif args.team_mode == "delete":
-        if th.delete_team(id=args.team_id):
-            logger.info(f"Deleted team {args.team_id}")
-        else:
-            logger.error(f"Failed to delete team {args.team_id}")
+
+        if args.output_file == None:
+            logger.error(f"Please specify an output file")
             exit(1)
-    elif args.team_mode == "update":
 
-        if args.attributes == None and args.attributes_json == None:
-            logger.error(f"No attributes were set to update.")
+        from ctfd_cli.utils.bulker import BulkAdd
+        # Without --force it is a dry run, which never talks to the instance.
+        bulker = BulkAdd(input_file=args.file, format=args.format, out_format=args.output_format, output_file=args.output_file, force=args.force, ctfd=connect(args) if args.force else None, workers=args.workers, conflicts_file=args.conflicts_file)
+        bulker.add()
+
+    elif args.mode == "reconcile":
+        if not args.file:
+            logger.error(f"Please specify a csv-file, json-file or yaml-file")
             exit(1)
 
-        if args.attributes_json != None:
+        from ctfd_cli.utils.reconcile import Reconcile
+        # The plan is computed against the live instance, so even a dry run connects.
+        reconciler = Reconcile(input_file=args.file, format=args.format, ctfd=connect(args), force=args.force, delete=args.delete, workers=args.workers, output_file=args.output_file)
+        reconciler.reconcile()
+
+    elif args.mode == "sync":
+        ctfd = connect(args)
+        for kind in [args.only] if args.only else ["users", "teams"]:
+            logger.info(f"Syncing {kind}...")
             try:
-                with open(args.attributes_json, "r") as f:
-                    args.attributes = f.read()
-            except FileNotFoundError:
-                logger.error(f"File {args.attributes_json} not found")
+                stats = ctfd.mirror.sync(
+                    kind,
+                    lambda start: ctfd.handler.Paginate(
+                        url=f"{ctfd.ctfd_instance}/api/v1/{kind}?view=admin",
+                        token=ctfd.ctfd_token,
+                        per_page=args.per_page,
+                        start=start,
+                        strict=True
+                    ),
+                    per_page=args.per_page,
+                    full=args.full
+                )
+            except Exception as E:
+                logger.error(f"Failed to sync {kind}, the mirror was left unchanged: {E}")
                 exit(1)
+            logger.info(
+                f"Synced {kind} ({stats['mode']}): fetched {stats['fetched']} in {stats['pages']} pages, "
+                f"removed {stats['deleted']}, {stats['total']} in the mirror."
+            )
+        logger.info(f"Mirror saved to {ctfd.mirror_file}")
 
-        if args.attributes == None:
-            logger.error(f"No attributes were set to update.")
-            exit(1)
+    elif args.mode == "query":
+        from ctfd_cli.utils.query import Query, write
+
+        # The results go to stdout, the logs to stderr.
+        Logger.configure(logger, stream=sys.stderr)
 
+        split = lambda value: [field.strip() for field in value.split(",") if field.strip()] if value else None
         try:
-            attr = json.loads(args.attributes)
-        except json.decoder.JSONDecodeError:
-            logger.error(f"Invalid attributes {args.attributes}")
-            exit(1)
-        team = th.update_team_attribute(id=args.team_id, attributes=attr, mode=dict)
-        if team == None:
-            logger.error(f"Failed to update team {args.team_id}")
-            exit(1)
-        logger.info(f"Updated team {team}")
-    elif args.team_mode == "get":
-        team = th.get_team_by_id(id=args.team_id, mode=dict)
-        if team == None:
-            logger.error(f"Failed to get team {args.team_id}")
-            exit(1)
-        logger.info(f"Got team {team}")
-    elif args.team_mode == "list":
-        teams = th.get_all_teams(mode=dict)
-        if teams == None:
-            logger.error(f"Failed to get teams")
-            exit(1)
-        pprint(teams)
-    elif args.team_mode == "add-member":
-        if args.user_id != None:
-            user_ids = [args.user_id]
-        elif args.user_ids != None:
-            user_ids = args.user_ids.split(",")
-        else:
-            logger.error(f"Please specify either --user-id or --user-ids")
+            query = Query(args.kind, where=args.where, group_by=split(args.group_by), fields=split(args.fields), sort=args.sort, descending=args.desc, limit=args.limit)
+        except ValueError as E:
+            logger.error(E)
             exit(1)
 
-        for user_id in user_ids:
-            if th.add_member(id=args.team_id, user_id=user_id):
-                logger.info(f"Added user {user_id} to team {args.team_id}")
-            else:
-                logger.error(f"Failed to add user {user_id} to team {args.team_id}")
-                exit(1)
-    elif args.team_mode == "del-member":
-        if args.user_id != None:
-            user_ids = [args.user_id]
-        elif args.user_ids != None:
-            user_ids = args.user_ids.split(",")
-        else:
-            logger.error(f"Please specify either --user-id or --user-ids")
+        try:
+            write(query.run(get_records(args)), query.fields, out_format=args.output_format)
+        except Exception as E:
+            # csv/jsonl rows are streamed, some may already be out: the exit code tells the result is incomplete.
+            logger.error(f"Failed to query {args.kind}: {E}")
             exit(1)
 
-        for user_id in user_ids:
-            if th.remove_member(id=args.team_id, user_id=user_id):
-                logger.info(f"Removed user {user_id} from team {args.team_id}")
-            else:
-                logger.error(f"Failed to remove user {user_id} from team {args.team_id}")
-                exit(1)
-    elif args.team_mode == "ban":
-        if th.ban_team(id=args.team_id):
-            logger.info(f"Banned team {args.team_id}")
-        else:
-            logger.error(f"Failed to ban team {args.team_id}")
-            exit(1)
-    elif args.team_mode == "unban":
-        if th.unban_team(id=args.team_id):
-            logger.info(f"Unbanned team {args.team_id}")
-        else:
-            logger.error(f"Failed to unban team {args.team_id}")
-            exit(1)
-    else:
-        logger.error(f"Invalid team mode {args.team_mode}")
-        exit(1)
+    elif args.mode == "export":
+        from ctfd_cli.utils.exporter import export
 
-elif args.mode == "bulk-add":
-    """
-        Check if csv-file, json-file or yaml-file is set
-        If none is set, give error:
-    """
-    if not args.file:
-        logger.error(f"Please specify a csv-file, json-file or yaml-file")
-        exit(1)
+        fields = [field.strip() for field in args.fields.split(",") if field.strip()] if args.fields else None
+        try:
+            count = export(get_records(args), args.output_file, out_format=args.format, fields=fields, kind=args.kind, batch_size=args.batch_size)
+        except Exception as E:
+            logger.error(f"Failed to export {args.kind}: {E}")
+            exit(1)
+        logger.info(f"Exported {count} {args.kind} to {args.output_file}")
 
-    if args.output_format == None:
-        logger.error(f"Please specify an output format")
-        exit(1)
+    elif args.mode == "parse":
 
-    if args.output_file == None:
-        logger.error(f"Please specify an output file")
-        exit(1)
+        if args.csv_file == None:
+            logger.error(f"Please specify a csv file to parse")
+            exit(1)
 
-    bulker = BulkAdd(input_file=args.file, format=args.format, out_format=args.output_format, output_file=args.output_file, force=args.force, ctfd=ctfd)
-    bulker.add()
+        from ctfd_cli.utils.parser import Parser
 
-elif args.mode == "parse":
+        if args.help_format:
+            Parser.__help__()
+            exit(0)
 
-    if args.csv_file == None:
-        logger.error(f"Please specify a csv file to parse")
-        exit(1)
+        try:
+            _out = args.output_file
+            store = (_out != "")
+        except:
+            _out = ""
+        p = Parser(file=args.csv_file, out_file=_out, out_mode=args.output_format, format=args.format)
+        _teams = p.google_forms(store=store)
+        if not store:
+            logger.info("Teams are: ")
+            pprint(_teams)
+
+    elif args.mode == "batch":
+        from ctfd_cli.utils.batch import Batch
+
+        if not args.output_file:
+            # The results go to stdout, the logs to stderr.
+            Logger.configure(logger, stream=sys.stderr)
+        batch = Batch(input_file=args.file, ctfd=connect(args), parse=parser.parse_args, output_file=args.output_file, workers=args.workers)
+        if not batch.run():
+            exit(1)
 
-    if args.help_format:
-        Parser.__help__()
-        exit(0)
+    elif args.mode == "shell":
+        from ctfd_cli.utils.shell import Shell
+        defaults = start_session(args)
+        Shell(parser, lambda argv: execute(argv, defaults)).run()
 
-    try:
-        _out = args.output_file
-        store = (_out != "")
-    except:
-        _out = ""
-    p = Parser(file=args.csv_file, out_file=_out, out_mode=args.output_format, format=args.format)
-    _teams = p.google_forms(store=store)
-    if not store:
-        logger.info("Teams are: ")
-        pprint(_teams)
\ No newline at end of file
+    elif args.mode == "daemon":
+        from ctfd_cli.utils.daemon import Daemon, stop
+        if args.stop:
+            if not stop(args.socket):
+                logger.error("No daemon is running.")
+                exit(1)
+            logger.info("Daemon stopped.")
+            return
+        defaults = start_session(args)
+        Daemon(args.socket, execute, defaults).serve()
+
+def main():
+    args = parser.parse_args()
+    if args.mode in FORWARDED and not args.no_daemon:
+        from ctfd_cli.utils.daemon import forward
+        code = forward(sys.argv[1:], args.socket)
+        if code is not None:
+            exit(code)
+    run(prepare(args))
+
+if __name__ == "__main__":
+    main()
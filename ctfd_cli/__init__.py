@@ -1 +1,7 @@
-from .ctfd import CTFd
\ No newline at end of file
+def __getattr__(name):
+    # CTFd (and the request stack behind it) is only imported when used, so
+    # importing a utility module, e.g. to forward a command to the daemon, stays cheap.
+    if name == "CTFd":
+        from .ctfd import CTFd
+        return CTFd
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,31 +1,99 @@
+import hashlib
+import json
+import os
+import time
+
 from .utils.logger import logger
 from .utils.handler import RequestHandler, Mode
-from .utils.utils import get_env
+from .utils.utils import get_env, cache_dir
+from .utils.index import NameIndex
+from .utils.mirror import Mirror
 
 class CTFd:
-    def __init__(self, instance: str = "", token: str = ""):
-        
+    def __init__(self, instance: str = "", token: str = "", pool_size: int = 10, connect_timeout: float = 5, read_timeout: float = 30, index_ttl: int = 300, refresh: bool = False, retries: int = 5, rate_limit: float = 0, health_ttl: int = 60, offline: bool = False, mirror_file: str = None, transport: str = "requests"):
+
         self.ctfd_instance = get_env(key="CTFD_INSTANCE", curr=instance, err_msg="CTFD_INSTANCE URL is not set")
-        self.ctfd_token    = get_env(key="CTFD_ADMIN_TOKEN", curr=token, err_msg="CTFD_ADMIN_TOKEN is not set")
+        # The token is not needed to read from the local mirror.
+        self.ctfd_token    = get_env(key="CTFD_ADMIN_TOKEN", curr=token, default="" if offline else None, err_msg="CTFD_ADMIN_TOKEN is not set")
 
         if self.ctfd_instance[-1] == "/":
             self.ctfd_instance = self.ctfd_instance[:-1]
-        
+
         if self.ctfd_instance[:7] != "http://" and self.ctfd_instance[:8] != "https://":
             self.ctfd_instance = "http://" + self.ctfd_instance
 
+        # Reads are served from the local mirror (see `sync`) instead of the instance.
+        self.offline = offline
+        self.mirror_file = mirror_file or Mirror.default_path(self.ctfd_instance)
+        self._mirror = None
+
+        # One pooled transport per instance, shared by every handler.
+        self.handler = RequestHandler(pool_size=pool_size, timeout=(connect_timeout, read_timeout), retries=retries, rate=rate_limit, transport=transport, instance=self.ctfd_instance)
+
+        # name/email -> id lookups, persisted between runs.
+        self.user_index = NameIndex(self.ctfd_instance, "users", ttl=index_ttl, refresh=refresh)
+        self.team_index = NameIndex(self.ctfd_instance, "teams", ttl=index_ttl, refresh=refresh)
+
+        # Seconds during which a successful health check is reused (0 to always check).
+        self.health_ttl = health_ttl
+
+        if offline:
+            if not os.path.isfile(self.mirror_file):
+                logger.error(f"No local mirror of {self.ctfd_instance} found ({self.mirror_file}), run `sync` first.")
+                exit(1)
+            logger.info(f"Reading from the local mirror {self.mirror_file}")
+            return
+
         logger.info(f"CTFd instance: {self.ctfd_instance}")
-        logger.info(f"Checking connection to CTFd version.")
+        logger.info("Checking connection to CTFd version.")
         if not self.is_working():
             logger.error("CTFd instance is not working.")
             exit(1)
         else:
             logger.info("CTFd instance is working.")
 
+    @property
+    def mirror(self) -> Mirror:
+        """Local SQLite mirror of the users and teams, opened on first use."""
+        if self._mirror is None:
+            self._mirror = Mirror(self.mirror_file)
+        return self._mirror
+
+    def health_file(self) -> str:
+        """Cache file of the last successful health check, keyed by instance and token."""
+        key = hashlib.sha1(f"{self.ctfd_instance}\0{self.ctfd_token}".encode()).hexdigest()[:12]
+        return os.path.join(cache_dir(), f"health-{key}.json")
+
     def is_working(self):
-        r = RequestHandler.MakeRequest(
+        """
+        Checks that the instance is reachable and the token is valid, using
+        the (small) /users/me endpoint. A successful check is cached for
+        `health_ttl` seconds, so back to back commands skip the round trip.
+        """
+        path = self.health_file() if self.health_ttl > 0 else None
+        if path:
+            try:
+                with open(path, "r") as f:
+                    if time.time() - json.load(f).get("checked", 0) < self.health_ttl:
+                        logger.debug("Using cached health check.")
+                        return True
+            except (OSError, ValueError, AttributeError):
+                pass
+
+        r = self.handler.MakeRequest(
             mode=Mode.GET,
-            url=f"{self.ctfd_instance}/api/v1/users",
+            url=f"{self.ctfd_instance}/api/v1/users/me",
             token=self.ctfd_token
         )
-        return r.status_code == 200
\ No newline at end of file
+        if r is None or r.status_code != 200:
+            return False
+
+        if path:
+            try:
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump({"instance": self.ctfd_instance, "checked": time.time()}, f)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+        return True
@@ -3,22 +3,92 @@ def random_string(length: int = 10) -> str:
     import string
     return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
 
-class UserObject:
-    def __set_val__(self, value, default=None):
-        if not hasattr(self, value):
-            setattr(self, value, default)
+# Fields normalised with titled() when a record is created.
+TITLED = ("name", "affiliation")
+
+def titled(value: str) -> str:
+    """How names and affiliations are normalised ("red team " -> "Red Team")."""
+    return value.strip().title()
+
+class Record(object):
+
+    """Base of the CTFd records.
+    Known CTFd fields are stored in __slots__ (no per-instance __dict__),
+    anything else ends up in a small overflow dict that is only allocated
+    when needed. Fields that were never set behave like missing attributes,
+    the same way they did when everything lived in __dict__.
+    """
+
+    __slots__ = ("_extra",)
+    known = ()
+    slots = frozenset()
+    strip = False # Whether string values are stripped.
 
     def __init__(self, **kwargs):
+        slots, strip = self.slots, self.strip
+        extra = None
         for key, value in kwargs.items():
-            setattr(self, key, value.strip() if isinstance(value, str) else value)
+            if strip and value.__class__ is str:
+                value = value.strip()
+            if key in slots:
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self._extra = extra
+        self.__normalize__()
+
+    def set(self, key, value):
+        """Sets any field, unknown ones going to the overflow dict."""
+        if key in self.slots or key == "members":
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __getattr__(self, key):
+        # Only called when the normal lookup failed (unknown or unset field).
+        if key != "_extra" and self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise AttributeError(key)
+
+    def __set_val__(self, value, default=None):
+        if not hasattr(self, value):
+            self.set(value, default)
+
+    def __normalize__(self):
+        for elem in TITLED:
+            _ = getattr(self, elem, None)
+            if _ and _ is not None:
+                setattr(self, elem, titled(_))
 
-        for elem in ["name", "affiliation"]:
-            if hasattr(self, elem):
-                _ = getattr(self, elem)
-                if _ and _ is not None:
-                    setattr(self, elem, _.strip().title())
+        # Existing records (with an id) are never given a random password.
+        if getattr(self, "id", None) is None:
+            self.__set_val__("password", random_string())
 
-        self.__set_val__("password", random_string())
+    def to_dict(self) -> dict:
+        data = {}
+        for key in self.known:
+            try:
+                data[key] = getattr(self, key)
+            except AttributeError:
+                pass
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+class UserObject(Record):
+
+    known = (
+        "id", "oauth_id", "name", "password", "email", "type", "role", "secret",
+        "website", "affiliation", "country", "bracket", "bracket_id", "hidden",
+        "banned", "verified", "language", "team_id", "created", "fields",
+    )
+    __slots__ = known
+    slots = frozenset(known)
+    strip = True
 
     def __str__(self):
         try:
@@ -31,37 +101,65 @@ class UserObject:
             team_id = getattr(self, "team_id", None)
 
             extras = ", ".join([
-                f"{key}={value}" for key, value in self.__dict__.items()
+                f"{key}={value}" for key, value in self.to_dict().items()
                 if key not in ["id", "name", "team_id", "banned", "hidden"] and value is not None
             ])
-                
+
             return ''
             # return f"CTFd-User({f'[HIDDEN] ' if self.hidden else ''}{f'[BANNED] ' if self.banned else ''}{f'id={_id}, ' if _id else ""}name={self.name}{f', team_id={team_id}, ' if team_id else ", "}{extras})"
         except Exception as E:
             return f"CTFd-User(?, Error: {E})"
-    
+
     def __repr__(self):
         return self.__str__()
 
-class TeamObject:
-    def __set_val__(self, value, default=None):
-        if not hasattr(self, value):
-            setattr(self, value, default)
+class TeamObject(Record):
 
-    def __init__(self, **kwargs):
-        for key, value in kwargs.items():
-            setattr(self, key, value)
+    known = (
+        "id", "oauth_id", "name", "password", "email", "secret", "website",
+        "affiliation", "country", "bracket", "bracket_id", "hidden", "banned",
+        "captain_id", "created", "fields",
+    )
+    __slots__ = known + ("_members", "_hydrated")
+    slots = frozenset(known)
+
+    def __init__(self, members: list = None, **kwargs):
+        self._members = members
+        self._hydrated = False
+        super().__init__(**kwargs)
 
-        for elem in ["name", "affiliation"]:
-            if hasattr(self, elem):
-                _ = getattr(self, elem)
-                if _ and _ is not None:
-                    setattr(self, elem, _.strip().title())
+    @property
+    def members(self) -> list:
+        """
+        Members are only turned into UserObjects when they are first used.
+        Server records list members by id (kept as ints), input files by
+        their details (a dict, or just a name).
+        """
+        if self._members is None:
+            raise AttributeError("members")
+        if not self._hydrated:
+            self._members = [
+                UserObject(**member) if isinstance(member, dict)
+                else UserObject(name=member) if isinstance(member, str)
+                else member
+                for member in self._members
+            ]
+            self._hydrated = True
+        return self._members
 
-        self.__set_val__("password", random_string())
+    @members.setter
+    def members(self, value: list):
+        self._members = value
+        self._hydrated = False
 
-        if hasattr(self, "members"):
-            self.members = [UserObject(**member) for member in self.members]
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        if self._members is not None:
+            data["members"] = [
+                member.to_dict() if isinstance(member, UserObject) else member
+                for member in self._members
+            ]
+        return data
 
     def __str__(self):
         try:
@@ -70,15 +168,15 @@ class TeamObject:
             _id = getattr(self, "id", None)
 
             extras = ", ".join([
-                f"{key}={value}" for key, value in self.__dict__.items()
+                f"{key}={value}" for key, value in self.to_dict().items()
                 if key not in ["id", "name", "members", "banned", "hidden"] and value is not None
             ])
 
             return ''
             # return f"CTFd-Team({f'[HIDDEN] ' if self.hidden else ''}{f'[BANNED] ' if self.banned else ''}{f'id={_id}, ' if _id else ""}name={self.name}, 'members={self.members}, {extras})"
-        
+
         except Exception as E:
             return f"CTFd-Team(?, Error: {E})"
-    
+
     def __repr__(self):
-        return self.__str__()
\ No newline at end of file
+        return self.__str__()
@@ -1,9 +1,10 @@
 from ..utils.logger import logger
 from ..schemas import TeamObject
-from ..utils.handler import RequestHandler, Mode
+from ..utils.handler import Mode
 from ..ctfd import CTFd
 
-from typing import List, Dict
+from typing import List, Dict, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pprint import pprint
 
 class TeamHandler:
@@ -12,6 +13,8 @@ class TeamHandler:
         self.ctfd = ctfd
 
     def __request__(self, req, default_ret_val=None, default_status_code = 200):
+        if req == None:
+            return default_ret_val
         if req.status_code != default_status_code:
             return default_ret_val
         try:
@@ -21,32 +24,57 @@ class TeamHandler:
             return default_ret_val
         return data
 
-    def get_all_teams(self, mode=TeamObject) -> List:
+    def __build_index__(self):
+        index = self.ctfd.team_index
+        with index.lock:
+            if index.rebuilt and index.is_fresh():
+                return # Another caller already did the sweep.
+            logger.info("Indexing all teams...")
+            # strict: a listing cut short must not be stored as the complete index.
+            index.rebuild(
+                team for page in self.ctfd.handler.Paginate(
+                    url=f"{self.ctfd.ctfd_instance}/api/v1/teams?view=admin",
+                    token=self.ctfd.ctfd_token,
+                    strict=True
+                ) for team in page
+            )
+
+    def __lookup__(self, name: str = None, email: str = None) -> int:
+        index = self.ctfd.team_index
+        if not index.is_fresh():
+            self.__build_index__()
+        _id = index.get(name=name, email=email)
+        if _id is None and not index.rebuilt:
+            # It might have been created since the index was last built.
+            self.__build_index__()
+            _id = index.get(name=name, email=email)
+        return _id
+
+    def iter_teams(self, mode=TeamObject, per_page: int = 50) -> Iterator:
 
         if mode != TeamObject and mode != dict:
             logger.error(f"Invalid mode {mode}")
-            return []
+            return
+
+        if self.ctfd.offline:
+            for team in self.ctfd.mirror.iter("teams"):
+                yield TeamObject(**team) if mode == TeamObject else team
+            return
 
         logger.info("Getting the list of all teams...")
-        r = RequestHandler.MakeRequest(
-            mode=Mode.GET,
+        # strict: a page that can't be fetched raises, instead of silently ending the listing.
+        for page in self.ctfd.handler.Paginate(
             url=f"{self.ctfd.ctfd_instance}/api/v1/teams?view=admin",
-            token=self.ctfd.ctfd_token
-        )
-
-        data = self.__request__(r, [])
-        if data == []:
-            return []
-        
-        teams = []
-
-        for team in data:
-            teams.append(TeamObject(**team))
+            token=self.ctfd.ctfd_token,
+            per_page=per_page,
+            strict=True
+        ):
+            for team in page:
+                # dicts are the records as the API returned them, like the ones of the mirror.
+                yield TeamObject(**team) if mode == TeamObject else team
 
-        if mode == TeamObject:
-            return teams
-        
-        return [team.__dict__ for team in teams]
+    def get_all_teams(self, mode=TeamObject, per_page: int = 50) -> List:
+        return list(self.iter_teams(mode=mode, per_page=per_page))
     
     def get_team_by_id(self, id: int, mode=TeamObject) -> TeamObject:
             
@@ -58,13 +86,21 @@ class TeamHandler:
                 return None
     
             logger.info(f"Getting info of team {id}")
-            r = RequestHandler.MakeRequest(
-                mode=Mode.GET,
-                url=f"{self.ctfd.ctfd_instance}/api/v1/teams/{id}?view=admin",
-                token=self.ctfd.ctfd_token
-            )
-    
-            data = self.__request__(r, None)
+            if self.ctfd.offline:
+                data = self.ctfd.mirror.get("teams", id)
+                if data == None:
+                    logger.error(f"Team with id {id} doesn't exist in the local mirror.")
+                    return None
+                # The listing doesn't include the members, the users do.
+                data["members"] = self.ctfd.mirror.members(id)
+            else:
+                r = self.ctfd.handler.MakeRequest(
+                    mode=Mode.GET,
+                    url=f"{self.ctfd.ctfd_instance}/api/v1/teams/{id}?view=admin",
+                    token=self.ctfd.ctfd_token
+                )
+                data = self.__request__(r, None)
+
             if data == None:
                 return None
             
@@ -73,7 +109,7 @@ class TeamHandler:
             if mode == TeamObject:
                 return team
             
-            return team.__dict__
+            return team.to_dict()
     
     def get_team_by_name(self, name: str, mode=TeamObject) -> TeamObject:
                 
@@ -85,26 +121,25 @@ class TeamHandler:
             return None
 
         logger.info(f"Getting info of team {name}")
-        r = RequestHandler.MakeRequest(
-            mode=Mode.GET,
-            url=f"{self.ctfd.ctfd_instance}/api/v1/teams?view=admin",
-            token=self.ctfd.ctfd_token
-        )
+        if self.ctfd.offline:
+            team = self.ctfd.mirror.find("teams", name=name)
+            if team == None:
+                return None
+            return self.get_team_by_id(team["id"], mode=mode)
 
-        data = self.__request__(r, None)
-        if data == None:
+        _id = self.__lookup__(name=name)
+        if _id == None:
+            return None
+
+        team = self.get_team_by_id(_id, mode=dict)
+        if team == None or team['name'] != name:
+            # Stale index entry (renamed or deleted elsewhere).
+            self.ctfd.team_index.remove(_id)
             return None
-        
-        for team in data:
-            if team['name'] == name:
-                team = TeamObject(**team)
-                if mode == TeamObject:
-                    return team
-                return team.__dict__
-        
-        return None
-        
-        return team.__dict__
+
+        if mode == dict:
+            return team
+        return TeamObject(**team)
 
     def update_team_attribute(self, id: int = None, attributes : Dict[str, str] = {}, req_mode: Mode = Mode.PATCH, endpoint: str = "", mode = TeamObject) -> TeamObject:
 
@@ -116,7 +151,7 @@ class TeamHandler:
             return None
 
         logger.info(f"Updating team {id} with attributes {attributes}")
-        r = RequestHandler.MakeRequest(
+        r = self.ctfd.handler.MakeRequest(
             mode=req_mode,
             url=f"{self.ctfd.ctfd_instance}/api/v1/teams/{id}{endpoint}",
             token=self.ctfd.ctfd_token,
@@ -127,13 +162,15 @@ class TeamHandler:
         if data == None:
             return None
         
+        if endpoint == "":
+            self.ctfd.team_index.add(data)
         try:
             team = TeamObject(**data)
 
             if mode == TeamObject:
                 return team
             
-            return team.__dict__
+            return team.to_dict()
         except:
             return data
     
@@ -157,7 +194,7 @@ class TeamHandler:
         if email: data['email'] = email
 
         logger.info(f"Creating team {name}...")
-        r = RequestHandler.MakeRequest(
+        r = self.ctfd.handler.MakeRequest(
             mode=Mode.POST,
             url=f"{self.ctfd.ctfd_instance}/api/v1/teams",
             token=self.ctfd.ctfd_token,
@@ -166,19 +203,22 @@ class TeamHandler:
 
         data = self.__request__(r, None, 200)
 
+        if r == None:
+            return None
         if r.status_code == 400:
             logger.error(f"Team with name {name} might already exists. [Error: {r.json()['errors']}]")
-            return self.get_team_by_name(name) if return_if_exists else None
+            return self.get_team_by_name(name, mode=mode) if return_if_exists else None
 
         if data == None:
             return None
         
+        self.ctfd.team_index.add(data)
         team = TeamObject(**data)
 
         if mode == TeamObject:
             return team
         
-        return team.__dict__
+        return team.to_dict()
     
     def create_team_from_dict(self, team_dict: dict, return_if_exists: bool = True, mode: object = TeamObject) -> TeamObject:
         # get all args as dict and pass it to create_team
@@ -186,40 +226,38 @@ class TeamHandler:
     
     def delete_team(self, id: int) -> bool:
         logger.info(f"Deleting team {id}...")
-        r = RequestHandler.MakeRequest(
+        r = self.ctfd.handler.MakeRequest(
             mode=Mode.DELETE,
             url=f"{self.ctfd.ctfd_instance}/api/v1/teams/{id}",
             token=self.ctfd.ctfd_token
         )
+        if r == None:
+            return False
         if r.status_code == 404:
             logger.error(f"Team with id {id} doesn't exist.")
             return False        
+        self.ctfd.team_index.remove(id)
         return True
     
-    def add_member(self, id: int, user_id: int, mode=TeamObject) -> TeamObject:
-            
-        r = RequestHandler.MakeRequest(
-            mode=Mode.GET,
-            url=f"{self.ctfd.ctfd_instance}/api/v1/teams/{id}",
-            token=self.ctfd.ctfd_token
-        )
-
-        data = self.__request__(r, None)
-        if data == None:
-            return None
+    def add_member(self, id: int, user_id: int, mode=TeamObject, members: List = None) -> TeamObject:
+        # `members` can be passed when the caller already knows them, to skip the lookup.
+        if members == None:
+            members = self.get_team_members(id)
+            if members == None:
+                return None
         
-        members = data.get("members", [])
         if user_id in members:
             logger.error(f"User {user_id} is already in team {id}")
             return None
         
         return self.update_team_attribute(id, attributes={"user_id": user_id}, req_mode=Mode.POST, endpoint="/members", mode=mode)
     
-    def remove_member(self, id: int, user_id: int, mode=TeamObject) -> bool:
+    def remove_member(self, id: int, user_id: int, mode=TeamObject, members: List = None) -> bool:
 
-        members = self.get_team_members(id)
         if members == None:
-            return None
+            members = self.get_team_members(id)
+            if members == None:
+                return None
         
         if user_id not in members:
             logger.error(f"User {user_id} is not in team {id}")
@@ -227,9 +265,32 @@ class TeamHandler:
 
         return self.update_team_attribute(id, attributes={"user_id": user_id}, req_mode=Mode.DELETE, endpoint="/members", mode=mode) != None
     
+    def __batch__(self, id: int, user_ids: List[int], func, workers: int = 8) -> Dict[int, bool]:
+        # Membership is fetched once and shared by all the (parallel) requests.
+        members = self.get_team_members(id)
+        if members == None:
+            return {user_id: False for user_id in user_ids}
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(func, id, user_id, members=members): user_id for user_id in user_ids}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = bool(future.result())
+                except Exception as E:
+                    logger.error(f"An error occurred for user {futures[future]}: {E}")
+                    results[futures[future]] = False
+        return results
+
+    def add_members(self, id: int, user_ids: List[int], workers: int = 8) -> Dict[int, bool]:
+        return self.__batch__(id, user_ids, self.add_member, workers=workers)
+
+    def remove_members(self, id: int, user_ids: List[int], workers: int = 8) -> Dict[int, bool]:
+        return self.__batch__(id, user_ids, self.remove_member, workers=workers)
+
     def get_team_members(self, id: int) -> List:
                     
-        r = RequestHandler.MakeRequest(
+        r = self.ctfd.handler.MakeRequest(
             mode=Mode.GET,
             url=f"{self.ctfd.ctfd_instance}/api/v1/teams/{id}",
             token=self.ctfd.ctfd_token
@@ -1,9 +1,9 @@
 from ..utils.logger import logger
 from ..schemas import UserObject
-from ..utils.handler import RequestHandler, Mode
+from ..utils.handler import Mode
 from ..ctfd import CTFd
 
-from typing import List, Dict
+from typing import List, Dict, Iterator
 from pprint import pprint
 
 class UserHandler:
@@ -12,6 +12,8 @@ class UserHandler:
         self.ctfd = ctfd
 
     def __request__(self, req, default_ret_val=None, default_status_code = 200):
+        if req == None:
+            return default_ret_val
         if req.status_code != default_status_code and req.status_code != 200: # Just a hard-coded check.
             return default_ret_val
         try:
@@ -21,31 +23,57 @@ class UserHandler:
             return default_ret_val
         return data
 
-    def get_all_users(self, mode=UserObject) -> List:
+    def __build_index__(self):
+        index = self.ctfd.user_index
+        with index.lock:
+            if index.rebuilt and index.is_fresh():
+                return # Another caller already did the sweep.
+            logger.info("Indexing all users...")
+            # strict: a listing cut short must not be stored as the complete index.
+            index.rebuild(
+                user for page in self.ctfd.handler.Paginate(
+                    url=f"{self.ctfd.ctfd_instance}/api/v1/users?view=admin",
+                    token=self.ctfd.ctfd_token,
+                    strict=True
+                ) for user in page
+            )
+
+    def __lookup__(self, name: str = None, email: str = None) -> int:
+        index = self.ctfd.user_index
+        if not index.is_fresh():
+            self.__build_index__()
+        _id = index.get(name=name, email=email)
+        if _id is None and not index.rebuilt:
+            # It might have been created since the index was last built.
+            self.__build_index__()
+            _id = index.get(name=name, email=email)
+        return _id
+
+    def iter_users(self, mode=UserObject, per_page: int = 50) -> Iterator:
 
         if mode != UserObject and mode != dict:
             logger.error(f"Invalid mode {mode}")
-            return []
+            return
+
+        if self.ctfd.offline:
+            for user in self.ctfd.mirror.iter("users"):
+                yield UserObject(**user) if mode == UserObject else user
+            return
 
         logger.info("Getting the list of all users...")
-        r = RequestHandler.MakeRequest(
-            mode=Mode.GET,
+        # strict: a page that can't be fetched raises, instead of silently ending the listing.
+        for page in self.ctfd.handler.Paginate(
             url=f"{self.ctfd.ctfd_instance}/api/v1/users?view=admin",
-            token=self.ctfd.ctfd_token
-        )
-
-        data = self.__request__(r, [])
-        if data == []:
-            return []
-        
-        users = []
-        for user in data:
-            users.append(UserObject(**user))
+            token=self.ctfd.ctfd_token,
+            per_page=per_page,
+            strict=True
+        ):
+            for user in page:
+                # dicts are the records as the API returned them, like the ones of the mirror.
+                yield UserObject(**user) if mode == UserObject else user
 
-        if mode == UserObject:
-            return users
-        
-        return [user.__dict__ for user in users]
+    def get_all_users(self, mode=UserObject, per_page: int = 50) -> List:
+        return list(self.iter_users(mode=mode, per_page=per_page))
       
     def get_user_by_id(self, id: int, mode=UserObject) -> UserObject:
 
@@ -57,12 +85,21 @@ class UserHandler:
             return None
 
         logger.info(f"Getting info of user {id}")
-        r = RequestHandler.MakeRequest(
+        if self.ctfd.offline:
+            data = self.ctfd.mirror.get("users", id)
+            if data == None:
+                logger.error(f"User with id {id} doesn't exist in the local mirror.")
+                return None
+            return data if mode == dict else UserObject(**data)
+
+        r = self.ctfd.handler.MakeRequest(
             mode=Mode.GET,
             url=f"{self.ctfd.ctfd_instance}/api/v1/users/{id}",
             token=self.ctfd.ctfd_token
         )
 
+        if r == None:
+            return None
         if r.status_code == 404:
             logger.error(f"User with id {id} doesn't exist.")
             return None
@@ -79,21 +116,26 @@ class UserHandler:
     def get_user_by_name(self, name : str, mode = UserObject) -> UserObject:
 
         logger.info(f"Getting info of user {name}")
-        r = RequestHandler.MakeRequest(
-            mode=Mode.GET,
-            url=f"{self.ctfd.ctfd_instance}/api/v1/users?view=admin",
-            token=self.ctfd.ctfd_token
-        )
+        if self.ctfd.offline:
+            user = self.ctfd.mirror.find("users", name=name)
+            if user == None:
+                return None
+            return user if mode == dict else UserObject(**user)
 
-        data = self.__request__(r, None, 200)
-        if data == None:
+        _id = self.__lookup__(name=name)
+        if _id == None:
             return None
-        
-        for user in data:
-            if user['name'] == name:
-                logger.info(f"User {name} has the ID {user['id']}")
-                return self.get_user_by_id(user['id'], mode=mode)
-        return None
+
+        logger.info(f"User {name} has the ID {_id}")
+        user = self.get_user_by_id(_id, mode=dict)
+        if user == None or user['name'] != name:
+            # Stale index entry (renamed or deleted elsewhere).
+            self.ctfd.user_index.remove(_id)
+            return None
+
+        if mode == dict:
+            return user
+        return UserObject(**user)
     
     def update_user_attribute(self, id : int = None, attributes : Dict[str, str] = {}, mode=UserObject) -> UserObject:
 
@@ -107,13 +149,15 @@ class UserHandler:
         
         logger.info(f"Updating user {id}...")
 
-        r = RequestHandler.MakeRequest(
+        r = self.ctfd.handler.MakeRequest(
             mode=Mode.PATCH,
             url=f"{self.ctfd.ctfd_instance}/api/v1/users/{id}",
             token=self.ctfd.ctfd_token,
             json=attributes
         )
 
+        if r == None:
+            return None
         if r.status_code == 404:
             logger.error(f"User with id {id} doesn't exist.")
             return None
@@ -121,7 +165,8 @@ class UserHandler:
         data = self.__request__(r, None, 200)
         if data == None:
             return None
-        
+
+        self.ctfd.user_index.add(data)
         if mode == dict:
             return data
         return UserObject(**data)
@@ -140,14 +185,17 @@ class UserHandler:
     
     def delete_user(self, id: int) -> bool:
         logger.info(f"Deleting user {id}...")
-        r = RequestHandler.MakeRequest(
+        r = self.ctfd.handler.MakeRequest(
             mode=Mode.DELETE,
             url=f"{self.ctfd.ctfd_instance}/api/v1/users/{id}",
             token=self.ctfd.ctfd_token
         )
+        if r == None:
+            return False
         if r.status_code == 404:
             logger.error(f"User with id {id} doesn't exist.")
             return False        
+        self.ctfd.user_index.remove(id)
         return True
     
     def create_user(self, name: str, password: str, email: str = "", team_id: int = None, role: str = "user", verified: bool = False, banned: bool = False, hidden: bool = False, mode=UserObject, return_if_exists=True, **kwargs) -> UserObject:
@@ -171,20 +219,23 @@ class UserHandler:
             data["email"] = email
 
         logger.info(f"Creating user {name}...")
-        r = RequestHandler.MakeRequest(
+        r = self.ctfd.handler.MakeRequest(
             mode=Mode.POST,
             url=f"{self.ctfd.ctfd_instance}/api/v1/users",
             token=self.ctfd.ctfd_token,
             json=data
         )
+        if r == None:
+            return None
         if r.status_code == 400:
             logger.error(f"User with name {name} might already exists. [Error: {r.json()['errors']}]")
-            return self.get_user_by_name(name) if return_if_exists else None
+            return self.get_user_by_name(name, mode=mode) if return_if_exists else None
         
         data = self.__request__(r, None, 201)
         if data == None:
             return None
-        
+
+        self.ctfd.user_index.add(data)
         if mode == dict:
             return data
 
@@ -195,11 +246,13 @@ class UserHandler:
     
     def add_user_to_team(self, id: int, team_id: int) -> UserObject:
 
-        r = RequestHandler.MakeRequest(
+        r = self.ctfd.handler.MakeRequest(
             mode=Mode.GET,
             url=f"{self.ctfd.ctfd_instance}/api/v1/teams/{team_id}",
             token=self.ctfd.ctfd_token
         )
+        if r == None:
+            return None
         if r.status_code == 404:
             logger.error(f"Team with id {team_id} doesn't exist.")
             return None
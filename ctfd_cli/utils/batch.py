@@ -0,0 +1,274 @@
+import contextlib
+import io
+import json
+import os
+import shlex
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .logger import logger
+from ..ctfd import CTFd
+from ..teams.team import TeamHandler
+from ..users.user import UserHandler
+from .utils import get_user_ids
+
+"""
+Runs a file of user/team operations in one process, on one connection.
+
+Each line is either a command as it would be given to ctfd-cli (without
+the global options), or a json object with the command in "op" and its
+options as keys (dashes or underscores), e.g.:
+    user ban --user-id 3
+    {"op": "user update", "user_id": 3, "attributes": {"country": "PK"}}
+    {"op": "team add-member", "team_id": 1, "user_ids": [3, 4]}
+Empty lines and lines starting with # are skipped.
+"""
+
+OPERATIONS = {
+    "user": ("create", "delete", "update", "get", "ban", "unban", "hide", "unhide"),
+    "team": ("create", "delete", "update", "get", "ban", "unban", "add-member", "del-member"),
+}
+
+def to_argv(line: str) -> list:
+    """Turns a line (cli-style or json) into the arguments of the command."""
+    if not line.startswith("{"):
+        return shlex.split(line)
+
+    entry = json.loads(line)
+    argv = str(entry.pop("op", "")).split()
+    for key, value in entry.items():
+        option = "--" + key.replace("_", "-")
+        # The boolean options (--banned, --hidden, ...) take an explicit true/false value.
+        if value is None:
+            continue
+        elif isinstance(value, bool):
+            argv += [option, "true" if value else "false"]
+        elif isinstance(value, list) and key.endswith("_ids"):
+            argv += [option, ",".join(str(item) for item in value)]
+        elif isinstance(value, (dict, list)):
+            argv += [option, json.dumps(value)]
+        else:
+            argv += [option, str(value)]
+    return argv
+
+class Operation(object):
+
+    """A line of the batch, and its place in the per-entity ordering.
+    Attributes:
+        line: Line number in the file
+        args: Parsed command
+        keys: Entities it touches, e.g. ("user", 3)
+        waiting: Number of earlier operations on the same entities still running
+        successors: Operations waiting for this one
+    """
+
+    __slots__ = ("line", "text", "args", "keys", "waiting", "successors", "done")
+
+    def __init__(self, line: int, text: str, args):
+        self.line = line
+        self.text = text
+        self.args = args
+        self.keys = self.__keys__(args)
+        self.waiting = 0
+        self.successors = []
+        self.done = False
+
+    @staticmethod
+    def __keys__(args) -> set:
+        if args.mode == "user":
+            return {("user", args.user_id if args.user_mode != "create" else f"name:{args.name}")}
+
+        if args.team_mode == "create":
+            return {("team", f"name:{args.name}")}
+        keys = {("team", args.team_id)}
+        if args.team_mode in ("add-member", "del-member"):
+            # The members change teams, so they are ordered with their own operations too.
+            keys |= {("user", user_id) for user_id in get_user_ids(args) or []}
+        return keys
+
+def _attributes(args) -> dict:
+    if args.attributes_json is not None:
+        with open(args.attributes_json, "r") as f:
+            return json.load(f)
+    if args.attributes is None:
+        raise ValueError("No attributes were set to update.")
+    return json.loads(args.attributes)
+
+def _result(value):
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    return value if isinstance(value, (dict, list)) else None
+
+class Batch(object):
+
+    """Runs the operations of a file concurrently, keeping the operations on the same entity in order.
+    Attributes:
+        input_file: File of operations (cli-style or json lines)
+        parse: Callable(argv) returning the parsed command (raises SystemExit when invalid)
+        output_file: Where the results are written as json lines (stdout if None)
+        workers: Number of operations run in parallel
+        stats: Number of operations that succeeded and failed
+    """
+
+    def __init__(self, input_file: str, ctfd: CTFd, parse, output_file: str = None, workers: int = 8):
+        self.input_file = input_file
+        self.ctfd = ctfd
+        self.parse = parse
+        self.output_file = output_file
+        self.workers = workers
+        self.stats = {"ok": 0, "failed": 0}
+
+        self.uh = UserHandler(ctfd)
+        self.th = TeamHandler(ctfd)
+
+        # Scheduling state: entity -> last operation on it, and the operations in flight.
+        self.lock = threading.Lock()
+        self.last = {}
+        self.running = 0
+        self.idle = threading.Condition(self.lock)
+        # Bounds how far the reader gets ahead of the workers.
+        self.slots = threading.Semaphore(workers * 4)
+
+        if not os.path.isfile(input_file):
+            logger.error(f"Input file {input_file} does not exist.")
+            exit(1)
+
+        if self.workers < 1:
+            logger.error(f"Invalid number of workers {workers}. Must be at least 1.")
+            exit(1)
+
+    def operations(self):
+        """Streams the operations of the file; invalid lines are reported right away."""
+        with open(self.input_file, "r") as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+
+                error = io.StringIO()
+                try:
+                    argv = to_argv(line)
+                    # argparse reports errors on stderr before exiting.
+                    with contextlib.redirect_stderr(error):
+                        args = self.parse(argv)
+                    if args.mode not in OPERATIONS or getattr(args, f"{args.mode}_mode") not in OPERATIONS[args.mode]:
+                        raise ValueError(f"{' '.join(argv[:2])} can't be used in a batch")
+                    yield Operation(number, line, args)
+                except SystemExit:
+                    message = error.getvalue().strip().splitlines()
+                    self.report(number, line, False, error=message[-1] if message else "Invalid command")
+                except (ValueError, OSError) as E:
+                    self.report(number, line, False, error=str(E))
+
+    def run(self):
+        out = open(self.output_file, "w") if self.output_file else sys.stdout
+        self.out = out
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as self.pool:
+                for op in self.operations():
+                    self.slots.acquire()
+                    self.schedule(op)
+                with self.idle:
+                    while self.running:
+                        self.idle.wait()
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        logger.info(f"{self.stats['ok']} operations succeeded, {self.stats['failed']} failed.")
+        return self.stats["failed"] == 0
+
+    def schedule(self, op: Operation):
+        with self.lock:
+            self.running += 1
+            for key in op.keys:
+                previous = self.last.get(key)
+                if previous is not None and not previous.done and op not in previous.successors:
+                    previous.successors.append(op)
+                    op.waiting += 1
+                self.last[key] = op
+            ready = op.waiting == 0
+        if ready:
+            self.pool.submit(self.execute, op)
+
+    def execute(self, op: Operation):
+        start = time.perf_counter()
+        try:
+            try:
+                ok, result, error = self.dispatch(op.args)
+            except Exception as E:
+                ok, result, error = False, None, f"{E.__class__.__name__}: {E}"
+            self.report(op.line, op.text, ok, result=result, error=error, seconds=time.perf_counter() - start)
+        finally:
+            # Releases the operations that were waiting on this one.
+            with self.lock:
+                op.done = True
+                for key in op.keys:
+                    if self.last.get(key) is op:
+                        del self.last[key]
+                ready = []
+                for successor in op.successors:
+                    successor.waiting -= 1
+                    if successor.waiting == 0:
+                        ready.append(successor)
+                self.running -= 1
+                if not self.running:
+                    self.idle.notify_all()
+            self.slots.release()
+        for successor in ready:
+            self.pool.submit(self.execute, successor)
+
+    def report(self, line: int, text: str, ok: bool, result = None, error: str = None, seconds: float = 0):
+        entry = {"line": line, "op": text, "ok": ok}
+        if result is not None:
+            entry["result"] = result
+        if error:
+            entry["error"] = error
+            logger.error(f"Line {line}: {error}")
+        entry["seconds"] = round(seconds, 6)
+        with self.lock:
+            self.stats["ok" if ok else "failed"] += 1
+            self.out.write(json.dumps(entry) + "\n")
+            self.out.flush()
+
+    def dispatch(self, args) -> tuple:
+        """Runs one operation; returns (ok, result, error)."""
+        uh, th = self.uh, self.th
+
+        if args.mode == "user":
+            mode, _id = args.user_mode, getattr(args, "user_id", None)
+            if mode == "create":
+                value = uh.create_user(name=args.name, password=args.password, email=args.email, team_id=args.team_id, role=args.role, verified=args.verified, banned=args.banned, hidden=args.hidden, mode=dict, return_if_exists=False)
+            elif mode == "delete":
+                value = uh.delete_user(id=_id)
+            elif mode == "update":
+                value = uh.update_user_attribute(id=_id, attributes=_attributes(args), mode=dict)
+            elif mode == "get":
+                value = uh.get_user_by_id(id=_id, mode=dict)
+            else:
+                value = getattr(uh, f"{mode}_user")(id=_id)
+            return (bool(value), _result(value), None if value else f"Failed to {mode} user {_id if _id is not None else args.name}")
+
+        mode, _id = args.team_mode, getattr(args, "team_id", None)
+        if mode in ("add-member", "del-member"):
+            user_ids = get_user_ids(args)
+            if not user_ids:
+                raise ValueError("Please specify either --user-id, --user-ids or --user-ids-file")
+            func = th.add_members if mode == "add-member" else th.remove_members
+            results = func(id=_id, user_ids=user_ids, workers=args.workers)
+            failed = [user_id for user_id in user_ids if not results.get(user_id)]
+            return (not failed, {str(user_id): bool(results.get(user_id)) for user_id in user_ids}, f"Failed for users {failed}" if failed else None)
+
+        if mode == "create":
+            value = th.create_team(name=args.name, password=args.password, email=args.email, affiliation=args.affiliation, country=args.country, mode=dict, return_if_exists=False)
+        elif mode == "delete":
+            value = th.delete_team(id=_id)
+        elif mode == "update":
+            value = th.update_team_attribute(id=_id, attributes=_attributes(args), mode=dict)
+        elif mode == "get":
+            value = th.get_team_by_id(id=_id, mode=dict)
+        else:
+            value = getattr(th, f"{mode}_team")(id=_id)
+        return (bool(value), _result(value), None if value else f"Failed to {mode} team {_id if _id is not None else args.name}")
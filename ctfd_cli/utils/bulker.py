@@ -1,25 +1,35 @@
 import json
 import csv
-import yaml
 import os
+import queue
+import threading
 
 from .logger import logger
+from .journal import Journal
+from .readers import READERS
+from .conflicts import ConflictIndex
 from ..ctfd import CTFd
 from ..teams.team import TeamObject, TeamHandler
-from ..users.user import UserObject, UserHandler
+from ..users.user import UserHandler
 
 class BulkAdd(object):
     csv_fields = ["Name", "Email", "Member-1", "Member-2", "Member-3"]
     allowed_formats = ["json", "csv", "yaml"]
+    input_formats = ["json", "jsonl", "csv", "yaml"]
 
-    def __init__(self, input_file: str, format: str, out_format, output_file: str, force=False, ctfd: CTFd = None):
+    def __init__(self, input_file: str, format: str, out_format, output_file: str, force=False, ctfd: CTFd = None, workers: int = 1, conflicts_file: str = None):
 
         self.ctfd = ctfd
+        self.workers = workers
+        self.conflicts_file = conflicts_file
+        self.stats = {"create": 0, "exists": 0, "rename": 0, "skip": 0, "saved": 0}
+        self.lock = threading.Lock()
         self.force = force
         self.format = format
         self.input_file = input_file
         self.out_format = out_format
         self.output_file = output_file
+        self.journal = Journal(f"{output_file}.journal")
 
         if not os.path.isfile(input_file):
             logger.error(f"Input file {input_file} does not exist.")
@@ -34,143 +44,388 @@ class BulkAdd(object):
             logger.error(f"Invalid output format {out_format}. Must be one of: json, csv, yaml.")
             exit(1)
 
-        if self.format not in self.allowed_formats:
-            logger.error(f"Invalid format {format}. Must be one of: json, csv, yaml.")
+        if self.workers < 1:
+            logger.error(f"Invalid number of workers {workers}. Must be at least 1.")
             exit(1)
 
-        if self.format == "json":
-            self.data = json.load(open(input_file))
+        if self.format not in self.input_formats:
+            logger.error(f"Invalid format {format}. Must be one of: json, jsonl, csv, yaml.")
+            exit(1)
 
-        elif self.format == "csv":
-            self.data = []
-            with open(input_file, "r") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    self.data.append(row)
+        self.reader = READERS[self.format]
 
-        elif self.format == "yaml":
-            self.data = yaml.safe_load(open(input_file))
+    @staticmethod
+    def normalise(entry: dict) -> TeamObject:
+        """Turns an input entry into a TeamObject (shared with reconcile)."""
+        team = TeamObject(**entry)
 
-    def add(self):
+        """
+        There was this one edge case where a person entered
+        multiple emails in a single email field separated by a ,:
+        """
+        team.email = (getattr(team, "email", None) or "").strip()
+        if "," in team.email:
+            team.email = team.email.split(",")[0]
+
+        return team
+
+    @staticmethod
+    def resolve(conflicts: ConflictIndex, position: int, team: TeamObject) -> TeamObject:
+        """
+        Applies the decisions of the conflict index to the team found at
+        `position`: None if it is dropped, else the team without its dropped
+        members and with the renamed ones renamed (shared with reconcile).
+        """
+        if position in conflicts.dropped_teams:
+            return None
+
+        members = []
+        for i, member in enumerate(getattr(team, "members", None) or []):
+            if (position, i) in conflicts.dropped_members:
+                continue
+            if (position, i) in conflicts.renames:
+                member.name = conflicts.renames[(position, i)]
+            members.append(member)
+        team.members = members
+        return team
+
+    def entries(self):
+        """Streams the normalised teams of the input file, with their position in it."""
+        for position, entry in enumerate(self.reader(self.input_file)):
+            yield position, self.normalise(entry)
+
+    def index_input(self):
+        """
+        First pass over the input, reading it in full: finds duplicate team
+        names/emails and members shared between teams, and decides the
+        renames, before any request is made. The ConflictIndex keeps every
+        team and member name and email of the input for the whole run.
+        """
+        self.conflicts = ConflictIndex()
+        for position, team in self.entries():
+            self.conflicts.add(position, team)
+        self.conflicts.report()
 
-        teams = []
-        team_names = []
-        team_emails = []
-        logged = []
-        
+        if self.conflicts_file:
+            with open(self.conflicts_file, "w") as f:
+                json.dump(self.conflicts.conflicts, f, indent=4)
+            logger.info(f"Conflict report saved to {self.conflicts_file}")
 
-        for entry in self.data:
-            team = TeamObject(**entry)
+    def teams(self):
+        """
+        Second pass over the input file, yielding the teams that still have
+        to be added, with the conflicts found by index_input resolved. The
+        teams aren't kept once yielded, but the ConflictIndex and the
+        snapshot of the instance are, so memory grows with the size of the
+        input and of the instance.
+        """
+        self.logged = 0
 
-            if team.name in team_names:
-                logger.error(f"Duplicate team name found: {team.name}")
+        for position, team in self.entries():
+            if (team := self.resolve(self.conflicts, position, team)) is None:
                 continue
 
-            if team.email in team_emails:
-                logger.error(f"Duplicate team email found: {team.email}")
+            if self.journal.done(team.name):
+                self.logged += 1
                 continue
+            yield team
+
+    def add(self):
 
-            team_names.append(team.name)
-            team_emails.append(team.email)
-            teams.append(team)
-
-        if os.path.isfile(self.output_file):
-            with open(self.output_file, "r") as f:
-                if self.out_format == "json":
-                    for line in f:
-                        data = json.loads(line)
-                        logged.append(data["Name"])
-                elif self.out_format == "csv":
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        logged.append(row["Name"])
-                elif self.out_format == "yaml":
-                    for line in f:
-                        data = yaml.safe_load(line)
-                        logged.append(data["Name"])
-        
-        teams = [team for team in teams if team.name not in logged]
-        logger.info(f"Found {len(teams)} teams to add (already wrote: {len(logged)} teams).")
+        self.index_input()
 
         if not self.force:
+            count = sum(1 for _ in self.teams())
+            logger.info(f"Found {count} teams to add (already wrote: {self.logged} teams).")
             logger.error("Use --force to force add teams and discard duplicates.")
             exit(0)
-            
-        """
-        To-DO:
-        
-        Check for duplicate members across teams.
-        If there are any, modify the name as:
-        <name>_<team_name>
-
-        This is to avoid conflicts.
-        """
 
         if not self.ctfd:
             logger.error("CTFd instance is not set.")
+            exit(1)
 
         th = TeamHandler(self.ctfd)
         uh = UserHandler(self.ctfd)
 
+        self.snapshot()
+
         if self.out_format == "csv":
             if not os.path.isfile(self.output_file):
                 with open(self.output_file, "w") as f:
                     writer = csv.DictWriter(f, fieldnames=self.csv_fields)
                     writer.writeheader()
 
-        for team in teams:
-            info = {}
+        self.journal.open()
+        try:
+            self.run(th, uh)
+        finally:
+            self.journal.close()
+
+        logger.info(f"Skipped {self.logged} teams that were already written.")
+        logger.info(
+            f"Plan: {self.stats['create']} created, {self.stats['exists']} already existed, "
+            f"{self.stats['rename']} renamed, {self.stats['skip']} skipped."
+        )
+        logger.info(f"Saved {self.stats['saved']} requests when adding members.")
+
+    def run(self, th: TeamHandler, uh: UserHandler):
+        if self.workers <= 1:
+            for team in self.teams():
+                if (info := self.add_team(team, self.plan_team(team), th, uh)):
+                    self.write_row(info)
+            return
 
-            """
-            There was this one edge case where a person entered
-            multiple emails in a single email field separated by a ,:
-            """
-            team.email = team.email.strip()
-            team.name = team.name.strip().title()
+        """
+        Teams are independent of each other, so they are added in parallel.
+        By now the input has been read once in full (index_input) and the
+        whole instance loaded (snapshot). A producer thread reads the input a
+        second time and plans it into a bounded queue, so the planned teams
+        aren't all held at once. Each team's own create -> create members ->
+        add members chain still runs in order inside a single worker, and
+        rows are only written from this thread as the teams complete.
+        """
+        logger.info(f"Adding teams using {self.workers} workers.")
+        tasks = queue.Queue(maxsize=self.workers * 2)
+        results = queue.Queue()
+        done = object()
+
+        def produce():
+            try:
+                for team in self.teams():
+                    tasks.put((team, self.plan_team(team)))
+            except Exception as E:
+                logger.error(f"An error occurred when reading {self.input_file}: {E}")
+            finally:
+                for _ in range(self.workers):
+                    tasks.put(None)
+
+        def work():
+            while (task := tasks.get()) is not None:
+                try:
+                    results.put(self.add_team(*task, th, uh))
+                except Exception as E:
+                    logger.error(f"An error occurred when adding a team: {E}")
+            results.put(done)
+
+        threads = [threading.Thread(target=produce, daemon=True)]
+        threads += [threading.Thread(target=work, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        running = self.workers
+        while running:
+            info = results.get()
+            if info is done:
+                running -= 1
+            elif info:
+                self.write_row(info)
+
+    def snapshot(self):
+        """
+        Takes a single paginated snapshot of the existing users and teams,
+        so conflicts are resolved locally instead of by a failed POST
+        followed by a lookup. The name -> id indexes are refreshed from it.
+        A page that can't be fetched aborts the run.
+        """
+        self.existing_users = {}
+        self.existing_user_emails = set()
+        self.existing_teams = {}
+        self.existing_team_emails = set()
+
+        for kind, names, emails, index in (
+            ("users", self.existing_users, self.existing_user_emails, self.ctfd.user_index),
+            ("teams", self.existing_teams, self.existing_team_emails, self.ctfd.team_index),
+        ):
+            logger.info(f"Taking a snapshot of existing {kind}...")
+            try:
+                entries = [
+                    entry for page in self.ctfd.handler.Paginate(
+                        url=f"{self.ctfd.ctfd_instance}/api/v1/{kind}?view=admin",
+                        token=self.ctfd.ctfd_token,
+                        # CTFd's maximum page size, the whole instance is read.
+                        per_page=100,
+                        strict=True
+                    ) for entry in page
+                ]
+            except Exception as E:
+                # A partial snapshot would re-create what exists, and be stored as the index.
+                logger.error(f"Failed to take a snapshot of the {kind}, nothing was added: {E}")
+                exit(1)
+            for entry in entries:
+                names[entry["name"]] = {"id": entry["id"], "team_id": entry.get("team_id")}
+                if entry.get("email"):
+                    emails.add(entry["email"].lower())
+            index.rebuild(entries)
+            logger.info(f"Found {len(names)} existing {kind}.")
+
+    def plan_team(self, team: TeamObject) -> dict:
+        """
+        Splits a team (and its members) into what has to be created, what
+        already exists and what needs to be renamed. Names that are going to
+        be created are reserved in the snapshot, so later teams see them.
+        """
+        plan = {"team": None, "members": []}
+
+        if (existing := self.existing_teams.get(team.name)):
+            plan["team"] = ("exists", existing["id"])
+            self.stats["exists"] += 1
+        elif team.email and team.email.lower() in self.existing_team_emails:
+            logger.error(f"Team email {team.email} is already in use, skipping team {team.name}")
+            plan["team"] = ("skip", None)
+            self.stats["skip"] += 1
+            return plan
+        else:
+            plan["team"] = ("create", None)
+            self.existing_teams[team.name] = {"id": None, "team_id": None}
+            if team.email:
+                self.existing_team_emails.add(team.email.lower())
+            self.stats["create"] += 1
+
+        team_id = plan["team"][1]
+        state = self.journal.state(team.name)
+        for member in team.members:
+            email = (getattr(member, "email", None) or "").lower()
+
+            if (user := state["users"].get(member.name)):
+                # Created by an interrupted run, reuse it as-is.
+                plan["members"].append((member, "journal", user))
+                self.stats["exists"] += 1
+                continue
 
-            if "," in team.email:
-                team.email = team.email.split(",")[0]
+            for name in (member.name, ConflictIndex.rename(member.name, team.name)):
+                if (user := self.existing_users.get(name)) is None:
+                    if email and email in self.existing_user_emails:
+                        logger.error(f"Email {email} is already in use, skipping user {name}")
+                        plan["members"].append((member, "skip", None))
+                        self.stats["skip"] += 1
+                    else:
+                        action = "create" if name == member.name else "rename"
+                        plan["members"].append((member, action, name))
+                        self.existing_users[name] = {"id": None, "team_id": team_id}
+                        if email:
+                            self.existing_user_emails.add(email)
+                        self.stats[action] += 1
+                    break
+
+                if team_id is not None and user["team_id"] == team_id:
+                    plan["members"].append((member, "exists", user["id"]))
+                    self.stats["exists"] += 1
+                    break
+            else:
+                logger.error(f"User {member.name} already exists in another team, skipping.")
+                plan["members"].append((member, "skip", None))
+                self.stats["skip"] += 1
+
+        return plan
+
+    def add_team(self, team: TeamObject, plan: dict, th: TeamHandler, uh: UserHandler) -> dict:
+        info = {}
+        info["Name"] = team.name
+        info["Email"] = team.email
+        info["members"] = []
+
+        action, team_id = plan["team"]
+        if action == "skip":
+            return None
 
-            info["Name"] = team.name
-            info["Email"] = team.email
-            info["members"] = []
+        """
+        A team created by this run has no members yet, so new users can be
+        created straight into it (team_id) and no membership check is
+        needed. For an existing team the member list is fetched at most once
+        and kept up to date locally for the rest of the team.
+        """
+        fresh = action == "create"
+        members = [] if fresh else None
+        saved = 0
 
+        if action == "exists":
+            logger.debug(f"Team {team.name} already exists with id {team_id}")
+        else:
             logger.debug("Adding team: " + team.name)
-            if not (_team := th.create_team_from_dict(team.__dict__, return_if_exists = False, mode = TeamObject)):
+            if not (_team := th.create_team_from_dict(team.to_dict(), return_if_exists = False, mode = TeamObject)):
                 logger.error(f"Failed to create team {team.name}")
-
+                return None
             logger.debug(f"Got team: {_team}")
-            for i, member in enumerate(team.members):
-                member.name = member.name.strip().title()
-                logger.debug(f"Adding user: {member.name}")
-                if not (_member := uh.create_user_from_dict(member.__dict__, return_if_exists=False)):
-                    logger.error(f"Failed to create user {member.name}")
-                    member.name = f"{member.name}_{team.name.replace(' ', '-')}"
+            team_id = _team.id
+            self.journal.record("team", team.name, id=team_id)
 
-                    if not (_member := uh.create_user_from_dict(member.__dict__, return_if_exists=False)):
-                        logger.error(f"Failed to create user {member.name}")
-                        continue
-                
-                logger.debug(f"Adding {member.name} to {_team.name}")
-                th.add_member(_team.id, _member.id)
+        state = self.journal.state(team.name)
+
+        for member, action, target in plan["members"]:
+            if action == "skip":
+                continue
 
-                info[f"members"].append({
+            if action == "exists":
+                logger.debug(f"User {member.name} is already in {team.name}")
+                info["members"].append({
                     "name": member.name,
-                    "password": member.password
+                    "password": ""
                 })
+                continue
 
-            # We'll store info in output file.
-            with open(self.output_file, "a") as f:
-                if self.out_format == "json":
-                    f.write(json.dumps(info) + "\n")
-                elif self.out_format == "csv":
-                    writer = csv.DictWriter(f, fieldnames=self.csv_fields)
-                    member = info["members"]
-                    for i in range(len(member)):
-                        _member = member[i]
-                        info[f"Member-{i+1}"] = f"{_member['name']}:{_member['password']}"
-                    del info["members"]
-                    writer.writerow(info)
-                elif self.out_format == "yaml":
-                    f.write(yaml.dump(info) + "\n")
-            logger.info(f"Team {team.name} added successfully.")
\ No newline at end of file
+            if action == "journal":
+                user = target
+            else:
+                if action == "rename":
+                    logger.warning(f"User {member.name} already exists, renaming to {target}")
+                key, member.name = member.name, target
+
+                logger.debug(f"Adding user: {member.name}")
+                data = member.to_dict() if not fresh else {**member.to_dict(), "team_id": team_id}
+                if not (_member := uh.create_user_from_dict(data, return_if_exists=False)):
+                    logger.error(f"Failed to create user {member.name}")
+                    continue
+
+                user = {"id": _member.id, "name": member.name, "password": member.password}
+                self.journal.record("user", team.name, key=key, **user)
+
+                if fresh and getattr(_member, "team_id", None) == team_id:
+                    # Created inside the team: no GET /teams/{id} + POST /members.
+                    self.journal.record("member", team.name, user=user["id"])
+                    members.append(user["id"])
+                    saved += 2
+
+            if user["id"] not in state["members"]:
+                if members is None:
+                    members = th.get_team_members(team_id) or []
+                    saved -= 1
+
+                if user["id"] in members:
+                    logger.debug(f"{user['name']} is already in {team.name}")
+                    self.journal.record("member", team.name, user=user["id"])
+                else:
+                    logger.debug(f"Adding {user['name']} to {team.name}")
+                    if th.add_member(team_id, user["id"], members=members) == None:
+                        logger.error(f"Failed to add {user['name']} to {team.name}")
+                    else:
+                        self.journal.record("member", team.name, user=user["id"])
+                        members.append(user["id"])
+                        saved += 1
+
+            info["members"].append({
+                "name": user["name"],
+                "password": user["password"]
+            })
+
+        with self.lock:
+            self.stats["saved"] += saved
+        return info
+
+    def write_row(self, info: dict):
+        # We'll store info in output file.
+        with open(self.output_file, "a") as f:
+            if self.out_format == "json":
+                f.write(json.dumps(info) + "\n")
+            elif self.out_format == "csv":
+                writer = csv.DictWriter(f, fieldnames=self.csv_fields)
+                member = info["members"]
+                for i in range(len(member)):
+                    _member = member[i]
+                    info[f"Member-{i+1}"] = f"{_member['name']}:{_member['password']}"
+                del info["members"]
+                writer.writerow(info)
+            elif self.out_format == "yaml":
+                import yaml
+                f.write(yaml.dump(info) + "\n")
+        self.journal.record("row", info["Name"])
+        logger.info(f"Team {info['Name']} added successfully.")
@@ -0,0 +1,86 @@
+from .logger import logger
+
+class ConflictIndex(object):
+
+    """Single-pass index of a bulk-add input, used to find conflicts before any request is made.
+    Teams are identified by their position in the input, members by
+    (team position, member position), so the resulting plan is
+    deterministic for a given input: the first occurrence of a name or
+    email keeps it.
+    Attributes:
+        conflicts: List of the conflicts found (dicts)
+        dropped_teams: Positions of the teams that will not be added
+        dropped_members: Positions of the members that will not be added
+        renames: (team, member) position -> new member name
+    """
+
+    def __init__(self):
+        self.team_names = {}
+        self.team_emails = {}
+        self.member_names = {}
+        self.member_emails = {}
+
+        self.conflicts = []
+        self.dropped_teams = set()
+        self.dropped_members = set()
+        self.renames = {}
+
+    @staticmethod
+    def rename(name: str, team: str) -> str:
+        return f"{name}_{team.replace(' ', '-')}"
+
+    def conflict(self, kind: str, value: str, team: str, first: str, action: str):
+        self.conflicts.append({"type": kind, "value": value, "team": team, "first": first, "action": action})
+
+    def add(self, position: int, team):
+        """Indexes a normalised TeamObject found at `position` in the input."""
+        email = (team.email or "").lower()
+
+        if team.name in self.team_names:
+            self.conflict("team_name", team.name, team.name, self.team_names[team.name], "skip")
+            self.dropped_teams.add(position)
+            return
+
+        if email and email in self.team_emails:
+            self.conflict("team_email", email, team.name, self.team_emails[email], "skip")
+            self.dropped_teams.add(position)
+            return
+
+        self.team_names[team.name] = team.name
+        if email:
+            self.team_emails[email] = team.name
+
+        for i, member in enumerate(getattr(team, "members", None) or []):
+            name = member.name
+            email = (getattr(member, "email", None) or "").strip().lower()
+
+            if email and email in self.member_emails:
+                self.conflict("member_email", email, team.name, self.member_emails[email], "skip")
+                self.dropped_members.add((position, i))
+                continue
+
+            if name in self.member_names:
+                renamed = self.rename(name, team.name)
+                if renamed in self.member_names:
+                    self.conflict("member_name", name, team.name, self.member_names[name], "skip")
+                    self.dropped_members.add((position, i))
+                    continue
+                self.conflict("member_name", name, team.name, self.member_names[name], f"rename:{renamed}")
+                self.renames[(position, i)] = renamed
+                name = renamed
+
+            self.member_names[name] = team.name
+            if email:
+                self.member_emails[email] = team.name
+
+    def report(self):
+        if not self.conflicts:
+            logger.info("No conflicts found in the input.")
+            return
+
+        logger.warning(f"Found {len(self.conflicts)} conflicts in the input:")
+        for conflict in self.conflicts:
+            logger.warning(
+                f"  {conflict['type']} {conflict['value']!r} in team {conflict['team']!r} "
+                f"(first used by {conflict['first']!r}) -> {conflict['action']}"
+            )
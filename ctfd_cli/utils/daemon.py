@@ -0,0 +1,188 @@
+import contextlib
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+
+from .logger import logger
+from .utils import cache_dir, discard_output
+
+"""
+Local daemon that runs ctfd-cli commands in one long-lived process, so a
+command forwarded to it skips the interpreter startup, the .env load and
+the health check, and reuses warm connections and indexes.
+
+The client sends a single json line: {"argv", "cwd", "env"}. The daemon
+answers with json lines as the command writes its output, {"out": text}
+or {"err": text}, and a last {"exit": code}. Commands are run one at a
+time. The socket is only accessible by its owner (it holds the token).
+"""
+
+# Client settings that take precedence over the daemon's own.
+ENV = {"CTFD_INSTANCE": "ctfd_instance", "CTFD_ADMIN_TOKEN": "ctfd_token"}
+
+def socket_path(path: str = None) -> str:
+    return path or os.getenv("CTFD_CLI_SOCKET") or os.path.join(cache_dir(), "daemon.sock")
+
+def _connect(path: str) -> socket.socket:
+    """Connected client socket, or None when no daemon is listening."""
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+def _send(sock: socket.socket, message: dict):
+    sock.sendall((json.dumps(message) + "\n").encode())
+
+def forward(argv: list, path: str = None) -> int:
+    """
+    Runs a command in the daemon, writing its output here as it arrives.
+    Returns:
+        The exit code of the command, or None when no daemon is running
+        (the command should then run in this process)
+    """
+    sock = _connect(socket_path(path))
+    if sock is None:
+        return None
+
+    with sock:
+        _send(sock, {
+            "argv": argv,
+            "cwd": os.getcwd(),
+            "env": {key: os.environ[key] for key in ENV if key in os.environ},
+        })
+        for line in sock.makefile("r", encoding="utf-8"):
+            message = json.loads(line)
+            if "exit" in message:
+                return message["exit"]
+            stream = sys.stdout if "out" in message else sys.stderr
+            try:
+                stream.write(message.get("out", message.get("err", "")))
+                stream.flush()
+            except BrokenPipeError:
+                # The reader went away (e.g. `| head`); the daemon finishes the command on its own.
+                discard_output(stream)
+                return 1
+
+    logger.error("The daemon stopped before the command finished.")
+    return 1
+
+def stop(path: str = None) -> bool:
+    """Asks the running daemon to stop; False if there is none."""
+    sock = _connect(socket_path(path))
+    if sock is None:
+        return False
+    with sock:
+        _send(sock, {"stop": True})
+        sock.makefile("r").readline()
+    return True
+
+class Stream(object):
+
+    """File-like object sending what is written to the client, as {key: text} lines."""
+
+    def __init__(self, conn: socket.socket, key: str, lock: threading.Lock):
+        self.conn = conn
+        self.key = key
+        self.lock = lock
+        self.closed = False
+
+    def write(self, text: str) -> int:
+        if text and not self.closed:
+            with self.lock:
+                try:
+                    _send(self.conn, {self.key: text})
+                except OSError:
+                    # The client went away, the command still runs to completion.
+                    self.closed = True
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+class Daemon(object):
+
+    """Serves commands over a Unix socket.
+    Attributes:
+        path: Location of the socket
+        execute: Callable(argv, defaults) running a command, returning its exit code
+        defaults: Global options of the daemon, used by the commands that don't set them
+    """
+
+    def __init__(self, path: str, execute, defaults: dict = None):
+        self.path = socket_path(path)
+        self.execute = execute
+        self.defaults = defaults or {}
+        self.running = False
+
+    def serve(self):
+        if os.path.exists(self.path):
+            if (sock := _connect(self.path)) is not None:
+                sock.close()
+                logger.error(f"A daemon is already listening on {self.path}")
+                exit(1)
+            # Left behind by a daemon that didn't exit cleanly.
+            os.remove(self.path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(umask)
+        server.listen(16)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+        logger.info(f"Listening on {self.path}")
+        self.running = True
+        try:
+            while self.running:
+                conn, _ = server.accept()
+                with conn:
+                    try:
+                        self.handle(conn)
+                    except (OSError, ValueError) as E:
+                        logger.error(f"Invalid request: {E}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            logger.info("Daemon stopped.")
+
+    def handle(self, conn: socket.socket):
+        request = json.loads(conn.makefile("r", encoding="utf-8").readline() or "{}")
+        if request.get("stop"):
+            self.running = False
+            _send(conn, {"exit": 0})
+            return
+
+        defaults = dict(self.defaults)
+        for key, option in ENV.items():
+            if key in request.get("env", {}):
+                defaults[option] = request["env"][key]
+
+        lock = threading.Lock()
+        cwd = os.getcwd()
+        try:
+            # Relative paths in the command are the client's.
+            os.chdir(request.get("cwd") or cwd)
+            with contextlib.redirect_stdout(Stream(conn, "out", lock)), contextlib.redirect_stderr(Stream(conn, "err", lock)):
+                code = self.execute(list(request.get("argv", [])), defaults)
+        finally:
+            os.chdir(cwd)
+
+        logger.debug(f"Command finished with exit code {code}")
+        with lock:
+            _send(conn, {"exit": code})
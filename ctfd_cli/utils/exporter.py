@@ -0,0 +1,130 @@
+import csv
+import json
+
+from .logger import logger
+from .utils import atomic_write
+from ..schemas import UserObject, TeamObject
+
+"""
+Streaming writers used by `export`. Rows are written as they arrive, so
+memory use doesn't depend on the size of the instance (parquet/arrow keep
+a single batch of rows). pyarrow is only needed for parquet and arrow.
+"""
+
+# Never exported unless asked for explicitly.
+PRIVATE = ("password", "secret", "oauth_id")
+
+DEFAULT_FIELDS = {
+    "users": [field for field in UserObject.known if field not in PRIVATE],
+    "teams": [field for field in TeamObject.known if field not in PRIVATE],
+}
+
+INTEGERS = ("id", "team_id", "captain_id", "bracket_id")
+BOOLEANS = ("banned", "hidden", "verified")
+
+FORMATS = ("csv", "jsonl", "parquet", "arrow")
+
+def _scalar(value):
+    # Lists/dicts (members, custom fields) are kept as json in flat formats.
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+class CSVWriter(object):
+
+    def __init__(self, f, fields: list):
+        self.f = f
+        self.fields = fields
+        self.writer = csv.writer(f)
+        self.writer.writerow(fields)
+
+    def write(self, row: dict):
+        self.writer.writerow(["" if row.get(field) is None else _scalar(row.get(field)) for field in self.fields])
+
+    def close(self):
+        pass
+
+class JSONLWriter(object):
+
+    def __init__(self, f, fields: list):
+        self.f = f
+        self.fields = fields
+
+    def write(self, row: dict):
+        self.f.write(json.dumps({field: row.get(field) for field in self.fields}) + "\n")
+
+    def close(self):
+        pass
+
+class ArrowWriter(object):
+
+    """Writes parquet (or arrow IPC) files in batches of `batch_size` rows."""
+
+    def __init__(self, f, fields: list, out_format: str = "parquet", batch_size: int = 10000):
+        try:
+            import pyarrow
+        except ImportError:
+            raise Exception(f"pyarrow is required for {out_format} exports (pip install pyarrow)")
+        self.pa = pyarrow
+        self.fields = fields
+        self.batch_size = batch_size
+        self.columns = {field: [] for field in fields}
+        self.size = 0
+        self.schema = pyarrow.schema([
+            (field, pyarrow.int64() if field in INTEGERS else pyarrow.bool_() if field in BOOLEANS else pyarrow.string())
+            for field in fields
+        ])
+        if out_format == "parquet":
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(f, self.schema)
+        else:
+            import pyarrow.ipc
+            self.writer = pyarrow.ipc.new_file(f, self.schema)
+
+    def write(self, row: dict):
+        for field in self.fields:
+            value = row.get(field)
+            if value is not None and field not in INTEGERS and field not in BOOLEANS:
+                value = value if isinstance(value, str) else str(_scalar(value))
+            self.columns[field].append(value)
+        self.size += 1
+        if self.size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.size:
+            return
+        self.writer.write_table(self.pa.Table.from_pydict(self.columns, schema=self.schema))
+        self.columns = {field: [] for field in self.fields}
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def export(records, out_file: str, out_format: str = "csv", fields: list = None, kind: str = "users", batch_size: int = 10000) -> int:
+    """
+    Writes the records (dicts) to `out_file`, keeping only `fields`.
+    The file is written next to the output and renamed over it once
+    complete, so a failed export never leaves a truncated file behind.
+    Returns:
+        The number of rows written
+    """
+    if out_format not in FORMATS:
+        raise ValueError(f"Invalid format {out_format}. Must be one of: {', '.join(FORMATS)}.")
+
+    fields = fields or DEFAULT_FIELDS[kind]
+    count = 0
+    binary = out_format in ("parquet", "arrow")
+    with atomic_write(out_file, "wb" if binary else "w", newline=None if binary else "") as f:
+        if binary:
+            writer = ArrowWriter(f, fields, out_format=out_format, batch_size=batch_size)
+        else:
+            writer = (CSVWriter if out_format == "csv" else JSONLWriter)(f, fields)
+        for record in records:
+            writer.write(record)
+            count += 1
+            if count % 10000 == 0:
+                logger.info(f"Exported {count} {kind}...")
+        writer.close()
+    return count
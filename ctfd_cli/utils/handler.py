@@ -1,25 +1,152 @@
-import requests
 from .logger import logger
+from .scheduler import TokenBucket, AdaptiveLimiter, backoff, retry_after
+from .metrics import Metrics
+from .transport import get_transport
+import time
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
 
 class Mode(Enum):
-    GET = requests.get
-    POST = requests.post
-    PUT = requests.put
-    DELETE = requests.delete
-    PATCH = requests.patch
+    GET = "GET"
+    POST = "POST"
+    PUT = "PUT"
+    DELETE = "DELETE"
+    PATCH = "PATCH"
 
 class RequestHandler:
-    def MakeRequest(mode : Mode, url: str, token, headers: dict = {}, **kwargs):
+
+    """Sends the requests of every handler of a CTFd instance, through a shared transport.
+    Attributes:
+        transport: Backend sending the requests (see transport.py), pooled and kept alive
+        timeout: (connect, read) timeout applied to every request
+        retries: Number of times a throttled or failed request is retried
+        bucket: Token bucket limiting the request rate
+        limiter: Adaptive limit on the number of in-flight requests
+        metrics: Per endpoint latency, status, retry and size metrics
+        hooks: Called after every attempt with (method, url, status, seconds,
+            sent, received, retry); status is None when no response was received
+    """
+
+    # Retried for every method; the server did not process the request.
+    RETRY_ALWAYS = (429, 503)
+    # Only retried for idempotent methods; the request might have been processed.
+    RETRY_IDEMPOTENT = (502, 504)
+    IDEMPOTENT = ("GET", "PUT", "PATCH", "DELETE")
+
+    def __init__(self, pool_size: int = 10, timeout: tuple = (5, 30), retries: int = 5, rate: float = 0, transport: str = "requests", instance: str = ""):
+        self.transport = get_transport(transport, pool_size=pool_size, instance=instance, headers={
+            "Content-Type": "application/json",
+            "User-Agent": "CTFd-CLI-v0.1" # Cuz why not..
+        })
+        self.network_errors = self.transport.network_errors
+        self.timeout = timeout
+        self.retries = retries
+        self.bucket = TokenBucket(rate=rate, burst=pool_size)
+        self.limiter = AdaptiveLimiter(limit=pool_size)
+        self.metrics = Metrics()
+        self.hooks = [self.metrics.record]
+
+    def MakeRequest(self, mode : Mode, url: str, token, headers: dict = None, **kwargs):
 
         if token == None:
             raise Exception("Token is not set. Required for requests.")
 
-        headers["Authorization"] = f"Token {token}"
-        headers["Content-Type"] = "application/json"
-        headers["User-Agent"] = "CTFd-CLI-v0.1" # Cuz why not..
+        _headers = {"Authorization": f"Token {token}"}
+        if headers:
+            _headers.update(headers)
+
+        timeout = kwargs.pop("timeout", self.timeout)
+
+        for attempt in range(self.retries + 1):
+            wait = None
+            success = False
+            self.bucket.acquire()
+            self.limiter.acquire()
+            # The slot is given back whatever happens (Ctrl-C in the shell included).
+            try:
+                start = time.perf_counter()
+                try:
+                    r = self.transport.request(mode.value, url, headers=_headers, timeout=timeout, **kwargs)
+                except self.network_errors as E:
+                    self.__record__(mode, url, None, start, attempt)
+                    # Once sent, a non-idempotent request might have been processed (connection
+                    # dropped before the response, read timeout...), sending it again could duplicate it.
+                    if mode.value not in self.IDEMPOTENT and not self.transport.unsent(E):
+                        logger.error(f"An error occurred when making a request to {url}: {E.__str__()}")
+                        return None
+                    if attempt == self.retries:
+                        logger.error(f"An error occurred when making a request to {url}: {E.__str__()}")
+                        return None
+                    wait = backoff(attempt)
+                    logger.warning(f"Request to {url} failed ({E.__class__.__name__}), retrying in {wait:.2f}s")
+                except Exception as E:
+                    self.__record__(mode, url, None, start, attempt)
+                    logger.error(f"An error occurred when making a request to {url}: {E.__str__()}")
+                    return None
+                else:
+                    self.__record__(mode, url, r, start, attempt)
+                    retry = r.status_code in self.RETRY_ALWAYS or (
+                        r.status_code in self.RETRY_IDEMPOTENT and mode.value in self.IDEMPOTENT)
+                    success = not retry and r.status_code < 500
+                    if not retry or attempt == self.retries:
+                        return r
+                    wait = max(backoff(attempt), retry_after(r.headers.get("Retry-After")))
+                    logger.warning(f"Got {r.status_code} from {url}, retrying in {wait:.2f}s")
+            finally:
+                self.limiter.release(success=success)
+            time.sleep(wait)
+
+    def __record__(self, mode: Mode, url: str, r, start: float, attempt: int):
+        seconds = time.perf_counter() - start
+        if r is None:
+            status, sent, received = None, 0, 0
+        else:
+            status, sent, received = r.status_code, self.transport.sent(r), len(r.content)
+        for hook in self.hooks:
+            hook(mode.value, url, status, seconds, sent, received, attempt > 0)
+
+    def Paginate(self, url: str, token, per_page: int = 50, start: int = 1, strict: bool = False):
+        """Walks every page of a paginated CTFd listing.
+        Args:
+            url: Listing endpoint (may already contain a query string)
+            token: CTFd admin token
+            per_page: Number of entries requested per page
+            start: First page to fetch
+            strict: Raise an exception when a page can't be fetched, instead
+                of logging it and stopping (the caller can't tell the listing was cut short)
+        Yields:
+            The `data` list of each page. The next page is fetched in the
+            background while the caller consumes the current one.
+        """
+        sep = "&" if "?" in url else "?"
+
+        def fetch(page):
+            return self.MakeRequest(
+                mode=Mode.GET,
+                url=f"{url}{sep}page={page}&per_page={per_page}",
+                token=token
+            )
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(fetch, start)
+            while future is not None:
+                r = future.result()
+                if r is None or r.status_code != 200:
+                    if strict:
+                        raise Exception(f"Failed to fetch {url} [Status: {getattr(r, 'status_code', None)}]")
+                    logger.error(f"Failed to fetch {url} [Status: {getattr(r, 'status_code', None)}]")
+                    return
+                try:
+                    body = r.json()
+                except ValueError:
+                    if strict:
+                        raise Exception(f"An error occurred when parsing response from {url}")
+                    logger.error(f"An error occurred when parsing response from {url}")
+                    return
+
+                next_page = (body.get("meta") or {}).get("pagination", {}).get("next")
+                future = pool.submit(fetch, next_page) if next_page else None
+                yield body.get("data", [])
 
-        try:
-            return mode(url, headers=headers, **kwargs)
-        except Exception as E:
-            logger.error(f"An error occurred when making a request to {url}: {E.__str__()}")
\ No newline at end of file
+    def close(self):
+        self.transport.close()
@@ -0,0 +1,119 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .logger import logger
+from .utils import cache_dir
+
+class NameIndex(object):
+
+    """Persistent name/email -> id index of the users (or teams) of a CTFd instance.
+    Attributes:
+        kind: "users" or "teams"
+        ttl: Seconds after which the index is considered stale
+        path: Location of the index on disk
+    Methods:
+        is_fresh: Whether the index can be trusted without a rebuild
+        rebuild: Replaces the index with the given entries
+        add / remove: Incremental updates from create/update/delete responses
+        get: Looks up an id by name or email
+    """
+
+    def __init__(self, instance: str, kind: str, ttl: int = 300, refresh: bool = False):
+        self.kind = kind
+        self.ttl = ttl
+        self.path = os.path.join(
+            cache_dir(), f"{kind}-{hashlib.sha1(instance.encode()).hexdigest()[:12]}.json")
+
+        self.names = {}
+        self.emails = {}
+        self.entries = {} # id -> (name, email), to make removals O(1)
+        self.built = 0
+        self.rebuilt = False # Whether this process has already done a full sweep.
+        self.dirty = False
+        self.lock = threading.RLock()
+
+        if not refresh:
+            self.load()
+        atexit.register(self.save)
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.built = data.get("built", 0)
+        for _id, name, email in data.get("entries", []):
+            self.__put__(_id, name, email)
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = f"{self.path}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump({
+                        "built": self.built,
+                        "entries": [[_id, name, email] for _id, (name, email) in self.entries.items()]
+                    }, f)
+                os.replace(tmp, self.path)
+                self.dirty = False
+            except OSError as E:
+                logger.warning(f"Unable to save the {self.kind} index: {E}")
+
+    def is_fresh(self) -> bool:
+        return self.built != 0 and time.time() - self.built < self.ttl
+
+    def __put__(self, _id: int, name: str, email: str = None):
+        self.__pop__(_id)
+        self.entries[_id] = (name, email)
+        if name:
+            self.names[name] = _id
+        if email:
+            self.emails[email.lower()] = _id
+
+    def __pop__(self, _id: int):
+        if _id not in self.entries:
+            return
+        name, email = self.entries.pop(_id)
+        if self.names.get(name) == _id:
+            del self.names[name]
+        if email and self.emails.get(email.lower()) == _id:
+            del self.emails[email.lower()]
+
+    def rebuild(self, entries):
+        # Consumed before anything is replaced, so the index is left as it was if the listing fails.
+        entries = [(entry["id"], entry.get("name"), entry.get("email")) for entry in entries]
+        with self.lock:
+            self.names, self.emails, self.entries = {}, {}, {}
+            for _id, name, email in entries:
+                self.__put__(_id, name, email)
+            self.built = time.time()
+            self.rebuilt = True
+            self.dirty = True
+            self.save()
+        logger.debug(f"Indexed {len(self.entries)} {self.kind}.")
+
+    def add(self, entry: dict):
+        if not isinstance(entry, dict) or entry.get("id") is None:
+            return
+        with self.lock:
+            self.__put__(entry["id"], entry.get("name"), entry.get("email"))
+            self.dirty = True
+
+    def remove(self, _id: int):
+        with self.lock:
+            self.__pop__(_id)
+            self.dirty = True
+
+    def get(self, name: str = None, email: str = None) -> int:
+        if name is not None and name in self.names:
+            return self.names[name]
+        if email:
+            return self.emails.get(email.lower())
+        return None
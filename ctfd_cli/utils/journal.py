@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+
+from .logger import logger
+
+class Journal(object):
+
+    """Append-only journal of the steps taken by a bulk-add run.
+    Every step (team created, user created, member attached, row written)
+    is appended as a json line and fsync'd, so an interrupted run can resume
+    exactly where it stopped.
+    Attributes:
+        path: Location of the journal
+        teams: Replayed state, team name -> {"id", "users", "members", "done"}
+    Methods:
+        open: Checkpoints the journal and opens it for appending
+        record: Appends (and applies) a single step
+        state: Returns the replayed state of a team
+        done: Whether the row of a team has already been written
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.teams = {}
+        self.file = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash can leave a partially written last line.
+                    logger.warning(f"Ignoring truncated entry in journal {self.path}")
+                    break
+                self.apply(entry)
+        logger.debug(f"Replayed journal {self.path} ({len(self.teams)} teams).")
+
+    def apply(self, entry: dict):
+        state = self.state(entry["team"])
+        event = entry["event"]
+        if event == "team":
+            state["id"] = entry["id"]
+        elif event == "user":
+            state["users"][entry["key"]] = {
+                "id": entry["id"],
+                "name": entry["name"],
+                "password": entry["password"]
+            }
+        elif event == "member":
+            state["members"].add(entry["user"])
+        elif event == "row":
+            state["done"] = True
+
+    def state(self, team: str) -> dict:
+        if team not in self.teams:
+            self.teams[team] = {"id": None, "users": {}, "members": set(), "done": False}
+        return self.teams[team]
+
+    def done(self, team: str) -> bool:
+        return team in self.teams and self.teams[team]["done"]
+
+    def entries(self):
+        for team, state in self.teams.items():
+            if state["id"] is not None:
+                yield {"event": "team", "team": team, "id": state["id"]}
+            for key, user in state["users"].items():
+                yield {"event": "user", "team": team, "key": key, **user}
+            for user_id in state["members"]:
+                yield {"event": "member", "team": team, "user": user_id}
+            if state["done"]:
+                yield {"event": "row", "team": team}
+
+    def checkpoint(self):
+        """Rewrites the journal as one compact entry per step (drops any truncated tail)."""
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            for entry in self.entries():
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def open(self):
+        with self.lock:
+            if self.teams:
+                self.checkpoint()
+            self.file = open(self.path, "a")
+
+    def record(self, event: str, team: str, **kwargs):
+        entry = {"event": event, "team": team, **kwargs}
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.apply(entry)
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
@@ -1,4 +1,8 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import sys
 
 class Logger(object):
@@ -9,10 +13,15 @@ class Logger(object):
         level: Level of the logger
     Methods:
         get_logger: Returns a logger object
+        configure: Changes the level and output format of a logger
     
     Classes:
         Formatter: Logging Formatter to add colors and count warning / errors
+        JSONFormatter: Formats records as json lines
     
+    Records are only put on a queue by the calling thread; a background
+    listener thread formats and writes them, so slow terminals or pipes
+    don't hold up the requests.
     """
 
     class Formatter(logging.Formatter):
@@ -43,6 +52,10 @@ class Logger(object):
                 logging.ERROR: f"[{red}{format.split()[1]}{reset}] {format.split()[2]}",
                 logging.CRITICAL: f"[{bold_red}{format.split()[1]}{reset}] {format.split()[2]}",
             }
+
+            # One formatter per level, instead of one per record.
+            formatters = {level: logging.Formatter(fmt) for level, fmt in FORMATS.items()}
+            fallback = logging.Formatter(f"[{format.split()[1]}] {format.split()[2]}")
     
             def format(self, record : logging.LogRecord) -> str:
 
@@ -53,26 +66,101 @@ class Logger(object):
                 Returns:
                     Formatted log record
                 """
-                log_fmt = self.FORMATS.get(record.levelno)
-                formatter = logging.Formatter(log_fmt)
-                return formatter.format(record)
+                return self.formatters.get(record.levelno, self.fallback).format(record)
+
+    class JSONFormatter(logging.Formatter):
+
+            """Formats each record as a single json object (json lines)."""
+
+            def format(self, record : logging.LogRecord) -> str:
+                entry = {
+                    "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+                    "level": record.levelname,
+                    "message": record.getMessage(),
+                    "thread": record.threadName,
+                }
+                if record.exc_info:
+                    entry["exception"] = self.formatException(record.exc_info)
+                return json.dumps(entry)
+
+    class StreamHandler(logging.StreamHandler):
+
+            """Drops the records, instead of printing a traceback for each, once the reader of the stream went away (e.g. `| head`)."""
+
+            def handleError(self, record : logging.LogRecord):
+                if isinstance(sys.exc_info()[1], BrokenPipeError):
+                    return
+                super().handleError(record)
+
+    class QueueHandler(logging.handlers.QueueHandler):
+
+            """Queues the records as they are; formatting is left to the listener thread."""
+
+            def prepare(self, record : logging.LogRecord) -> logging.LogRecord:
+                # The arguments are merged now, in case they change before the record is written.
+                if record.args:
+                    record.msg, record.args = record.getMessage(), None
+                return record
+
+    listeners = {}
     
     @staticmethod
-    def get_logger(name: str, level: int = logging.DEBUG) -> logging.Logger:
+    def get_logger(name: str, level: int = logging.INFO, json_lines: bool = False) -> logging.Logger:
         """Returns a logger object.
         Args:
             name: Name of the logger
             level: Level of the logger
+            json_lines: Whether records are written as json lines
         Returns:
             A logger object.
         """
         logger = logging.getLogger(name)
-        logger.setLevel(level)
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(level)
-        formatter = Logger.Formatter()
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        logger.propagate = False
+        Logger.configure(logger, level=level, json_lines=json_lines)
         return logger
 
-logger = Logger.get_logger(__name__, level=logging.DEBUG)
\ No newline at end of file
+    @staticmethod
+    def configure(logger: logging.Logger, level: int = None, json_lines: bool = None, stream = None):
+        """Changes the level and/or the output of a logger (None keeps the current value).
+        Args:
+            logger: Logger returned by get_logger
+            level: Level of the logger
+            json_lines: Whether records are written as json lines
+            stream: Stream the records are written to (stdout by default)
+        """
+        if level is not None:
+            logger.setLevel(level)
+
+        current = Logger.listeners.get(logger.name)
+        if current is not None and json_lines is None and stream is None:
+            return
+
+        if current is not None:
+            listener, handler = current
+            listener.stop()
+            logger.removeHandler(handler)
+            if json_lines is None:
+                json_lines = isinstance(listener.handlers[0].formatter, Logger.JSONFormatter)
+            if stream is None:
+                stream = listener.handlers[0].stream
+
+        output = Logger.StreamHandler(stream or sys.stdout)
+        output.setFormatter(Logger.JSONFormatter() if json_lines else Logger.Formatter())
+
+        records = queue.SimpleQueue()
+        handler = Logger.QueueHandler(records)
+        listener = logging.handlers.QueueListener(records, output)
+        listener.start()
+        logger.addHandler(handler)
+        Logger.listeners[logger.name] = (listener, handler)
+
+    @staticmethod
+    def flush():
+        """Writes out every queued record; called at exit."""
+        for listener, _ in list(Logger.listeners.values()):
+            listener.stop()
+        Logger.listeners.clear()
+
+atexit.register(Logger.flush)
+
+logger = Logger.get_logger(__name__, level=logging.INFO)
\ No newline at end of file
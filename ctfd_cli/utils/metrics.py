@@ -0,0 +1,190 @@
+import json
+import re
+import threading
+from urllib.parse import urlparse
+
+# Upper bounds (in seconds) of the latency histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Ids in the path are folded, so /teams/1 and /teams/2 share an endpoint.
+_ID = re.compile(r"/\d+(?=/|$)")
+
+def endpoint(url: str) -> str:
+    """Returns the path of a request url, without the query string and ids."""
+    return _ID.sub("/{id}", urlparse(url).path) or "/"
+
+class Series(object):
+
+    """Metrics of a single (method, endpoint) pair.
+    Attributes:
+        count: Number of attempts (retries included)
+        retries: Number of attempts that were retries
+        errors: Number of attempts that got no response (connection errors, timeouts)
+        statuses: Status code -> count
+        buckets: Attempts per latency bucket (the last one is +Inf)
+        total: Sum of the latencies (in seconds)
+        max: Slowest attempt (in seconds)
+        sent: Request body bytes
+        received: Response body bytes
+    """
+
+    __slots__ = ("count", "retries", "errors", "statuses", "buckets", "total", "max", "sent", "received")
+
+    def __init__(self):
+        self.count = 0
+        self.retries = 0
+        self.errors = 0
+        self.statuses = {}
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+        self.sent = 0
+        self.received = 0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (max for +Inf)."""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "retries": self.retries,
+            "errors": self.errors,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "seconds": {
+                "total": round(self.total, 6),
+                "mean": round(self.total / self.count, 6) if self.count else 0,
+                "p50": round(self.quantile(0.5), 6),
+                "p95": round(self.quantile(0.95), 6),
+                "max": round(self.max, 6),
+            },
+            "buckets": {str(bound): count for bound, count in zip(BUCKETS + ("+Inf",), self.buckets)},
+            "bytes": {"sent": self.sent, "received": self.received},
+        }
+
+class Metrics(object):
+
+    """Thread-safe per-request metrics, recorded by RequestHandler.MakeRequest.
+    Attributes:
+        series: (method, endpoint) -> Series
+    """
+
+    def __init__(self):
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def record(self, method: str, url: str, status, seconds: float, sent: int = 0, received: int = 0, retry: bool = False):
+        """Records a single attempt; `status` is None when no response was received."""
+        key = (method, endpoint(url))
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series()
+            series.count += 1
+            series.total += seconds
+            series.max = max(series.max, seconds)
+            series.sent += sent
+            series.received += received
+            if retry:
+                series.retries += 1
+            if status is None:
+                series.errors += 1
+            else:
+                series.statuses[status] = series.statuses.get(status, 0) + 1
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series.buckets[i] += 1
+                    break
+            else:
+                series.buckets[-1] += 1
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            endpoints = [
+                {"method": method, "endpoint": path, **series.to_dict()}
+                for (method, path), series in sorted(self.series.items(), key=lambda item: item[0][1])
+            ]
+        return {
+            "requests": sum(entry["count"] for entry in endpoints),
+            "retries": sum(entry["retries"] for entry in endpoints),
+            "errors": sum(entry["errors"] for entry in endpoints),
+            "seconds": round(sum(entry["seconds"]["total"] for entry in endpoints), 6),
+            "bytes": {
+                "sent": sum(entry["bytes"]["sent"] for entry in endpoints),
+                "received": sum(entry["bytes"]["received"] for entry in endpoints),
+            },
+            "endpoints": endpoints,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=4)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        lines = [
+            "# HELP ctfd_cli_request_duration_seconds Duration of the requests made to the CTFd API.",
+            "# TYPE ctfd_cli_request_duration_seconds histogram",
+        ]
+        with self.lock:
+            items = sorted(self.series.items(), key=lambda item: (item[0][1], item[0][0]))
+            for (method, path), series in items:
+                labels = f'method="{method}",endpoint="{path}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), series.buckets):
+                    cumulative += count
+                    lines.append(f'ctfd_cli_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"ctfd_cli_request_duration_seconds_sum{{{labels}}} {series.total:.6f}")
+                lines.append(f"ctfd_cli_request_duration_seconds_count{{{labels}}} {series.count}")
+
+            for name, kind, help, values in (
+                ("requests_total", "counter", "Responses received from the CTFd API, by status code.", lambda series: [
+                    (f',status="{status}"', count) for status, count in sorted(series.statuses.items())]),
+                ("request_retries_total", "counter", "Attempts that were retries.", lambda series: [("", series.retries)]),
+                ("request_errors_total", "counter", "Attempts that got no response.", lambda series: [("", series.errors)]),
+                ("request_sent_bytes_total", "counter", "Request body bytes sent.", lambda series: [("", series.sent)]),
+                ("response_received_bytes_total", "counter", "Response body bytes received.", lambda series: [("", series.received)]),
+            ):
+                lines.append(f"# HELP ctfd_cli_{name} {help}")
+                lines.append(f"# TYPE ctfd_cli_{name} {kind}")
+                for (method, path), series in items:
+                    for extra, value in values(series):
+                        lines.append(f'ctfd_cli_{name}{{method="{method}",endpoint="{path}"{extra}}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Human readable table of the metrics, slowest endpoints (by total time) first."""
+        data = self.to_dict()
+        rows = [("METHOD", "ENDPOINT", "COUNT", "RETRY", "ERR", "STATUS", "TOTAL", "MEAN", "P95", "MAX", "SENT", "RECV")]
+        for entry in sorted(data["endpoints"], key=lambda entry: -entry["seconds"]["total"]):
+            seconds = entry["seconds"]
+            rows.append((
+                entry["method"], entry["endpoint"], str(entry["count"]), str(entry["retries"]), str(entry["errors"]),
+                " ".join(f"{status}:{count}" for status, count in entry["statuses"].items()),
+                f"{seconds['total']:.2f}s", f"{seconds['mean'] * 1000:.1f}ms",
+                f"{seconds['p95'] * 1000:.0f}ms", f"{seconds['max'] * 1000:.1f}ms",
+                _size(entry["bytes"]["sent"]), _size(entry["bytes"]["received"]),
+            ))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = ["  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
+        lines.append(
+            f"{data['requests']} requests ({data['retries']} retries, {data['errors']} errors) "
+            f"in {data['seconds']:.2f}s of request time, "
+            f"{_size(data['bytes']['sent'])} sent, {_size(data['bytes']['received'])} received."
+        )
+        return "\n".join(lines)
+
+def _size(value: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if value < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}GiB"
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .logger import logger
+from .utils import cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    email TEXT,
+    team_id INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_name ON users (name);
+CREATE INDEX IF NOT EXISTS users_email ON users (email COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS users_team_id ON users (team_id);
+
+CREATE TABLE IF NOT EXISTS teams (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    email TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS teams_name ON teams (name);
+CREATE INDEX IF NOT EXISTS teams_email ON teams (email COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+KINDS = ("users", "teams")
+
+class Mirror(object):
+
+    """Local SQLite copy of the users and teams of a CTFd instance.
+    The indexed columns (id, name, email, team_id) are used for lookups,
+    the full record is kept as json in `data`.
+    Attributes:
+        path: Location of the database
+    Methods:
+        sync: Pulls the users or teams of the instance into the mirror
+        get / find / iter / members: Reads served from the mirror
+        synced: When a kind was last synced (0 if never)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    @staticmethod
+    def default_path(instance: str) -> str:
+        return os.path.join(cache_dir(), f"mirror-{hashlib.sha1(instance.encode()).hexdigest()[:12]}.db")
+
+    @staticmethod
+    def __row__(kind: str, entry: dict) -> tuple:
+        if kind == "users":
+            return (entry["id"], entry.get("name"), entry.get("email"), entry.get("team_id"), json.dumps(entry))
+        return (entry["id"], entry.get("name"), entry.get("email"), json.dumps(entry))
+
+    def __upsert__(self, kind: str, entries: list):
+        columns = "id, name, email, team_id, data" if kind == "users" else "id, name, email, data"
+        self.db.executemany(
+            f"INSERT OR REPLACE INTO {kind} ({columns}) VALUES ({', '.join('?' * len(columns.split(',')))})",
+            [self.__row__(kind, entry) for entry in entries]
+        )
+
+    def synced(self, kind: str) -> float:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (f"{kind}_synced",)).fetchone()
+        return float(row[0]) if row else 0
+
+    def count(self, kind: str) -> int:
+        return self.db.execute(f"SELECT COUNT(*) FROM {kind}").fetchone()[0]
+
+    def sync(self, kind: str, pages, per_page: int = 50, full: bool = False) -> dict:
+        """
+        Pulls the `kind` entities into the mirror, in a single transaction.
+        Args:
+            kind: "users" or "teams"
+            pages: Callable(start_page) returning an iterator over the pages
+                (lists of entries) of the listing, starting at `start_page`
+            per_page: Page size used by `pages`
+            full: Re-download everything instead of refreshing incrementally
+        Returns:
+            {"mode", "pages", "fetched", "deleted", "total"}
+
+        The listing is ordered by id and new entities always get a higher id,
+        so an incremental sync only fetches the pages from where the mirror
+        ends (including one page of overlap) onwards. When the overlap shows
+        that entities were deleted before that point, it falls back to a full
+        sync. Changes to older entities are only seen by a full sync.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Invalid kind {kind}")
+
+        with self.lock:
+            known = self.count(kind)
+            last = self.db.execute(f"SELECT MAX(id) FROM {kind}").fetchone()[0] or 0
+            # The page holding the last mirrored entity.
+            start = 1 if full or not known else (known - 1) // per_page + 1
+            stats = {"mode": "full" if start == 1 else "incremental", "pages": 0, "fetched": 0, "deleted": 0}
+
+            fetched = []
+            for page in pages(start):
+                if stats["pages"] == 0 and start > 1:
+                    # Everything before the first entry must already be mirrored,
+                    # and unchanged (no deletions), for the offsets to line up.
+                    first = page[0]["id"] if page else None
+                    before = self.db.execute(f"SELECT COUNT(*) FROM {kind} WHERE id < ?", (first,)).fetchone()[0] if first else None
+                    if first is None or first > last or before != (start - 1) * per_page:
+                        logger.info(f"The {kind} changed since the last sync, doing a full sync.")
+                        return self.sync(kind, pages, per_page=per_page, full=True)
+                stats["pages"] += 1
+                fetched.extend(page)
+
+            # Mirrored entities (inside the fetched range) that are gone.
+            seen = {entry["id"] for entry in fetched}
+            lowest = 0 if stats["mode"] == "full" or not fetched else fetched[0]["id"]
+            stale = [
+                (_id,) for (_id,) in self.db.execute(f"SELECT id FROM {kind} WHERE id >= ?", (lowest,))
+                if _id not in seen
+            ]
+
+            with self.db:
+                self.db.executemany(f"DELETE FROM {kind} WHERE id = ?", stale)
+                self.__upsert__(kind, fetched)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"{kind}_synced", str(time.time())))
+
+            stats["fetched"] = len(fetched)
+            stats["deleted"] = len(stale)
+            stats["total"] = self.count(kind)
+            return stats
+
+    def get(self, kind: str, _id: int) -> dict:
+        row = self.db.execute(f"SELECT data FROM {kind} WHERE id = ?", (_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, kind: str, name: str = None, email: str = None) -> dict:
+        row = None
+        if name is not None:
+            row = self.db.execute(f"SELECT data FROM {kind} WHERE name = ?", (name,)).fetchone()
+        if row is None and email:
+            row = self.db.execute(f"SELECT data FROM {kind} WHERE email = ? COLLATE NOCASE", (email,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter(self, kind: str):
+        for (data,) in self.db.execute(f"SELECT data FROM {kind} ORDER BY id"):
+            yield json.loads(data)
+
+    def members(self, team_id: int) -> list:
+        return [_id for (_id,) in self.db.execute("SELECT id FROM users WHERE team_id = ? ORDER BY id", (team_id,))]
+
+    def close(self):
+        self.db.close()
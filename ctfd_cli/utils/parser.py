@@ -1,25 +1,27 @@
 import json
-import yaml
 import csv
+import os
 from .logger import logger
+from .utils import atomic_write
 from pprint import pprint
 
 class Parser:
 
     def __file__(self):
-        _i = False
-        try:
-            if not self.in_file:
-                raise Exception("No file provided.")
-            with open(self.in_file, "r") as f:
-                if f.read() != "":
-                    _i = True
-            if not self.out_file:
-                return True
-            with open(self.out_file, "w") as f:
-                return (True and _i)
-        except Exception as E:
-            raise E
+        """Cheap validation of the input/output files.
+        The input is only stat'd (not read) and the output is left untouched,
+        it is written atomically once parsing has succeeded.
+        """
+        if not self.in_file:
+            raise Exception("No file provided.")
+        if os.stat(self.in_file).st_size == 0:
+            raise Exception(f"{self.in_file} is empty.")
+        if not self.out_file:
+            return True
+        directory = os.path.dirname(os.path.abspath(self.out_file))
+        if not os.access(directory, os.W_OK):
+            raise Exception(f"Cannot write to {directory}.")
+        return True
 
     def __init__(self, file, out_file = "output.csv", out_mode="csv", format=""):
         self.in_file = file
@@ -50,6 +52,45 @@ This will be:
 team_name,user_name,user_email
 """)
 
+    @staticmethod
+    def __compile__(fields: list) -> dict:
+        """Compiles the field spec once into the row indexes to read.
+        The first column (timestamp) is skipped, team fields are read once
+        per row and the user fields repeat every `step` columns from `start`
+        until the end of the row.
+        """
+        user_idxs = [i for i, field in enumerate(fields) if field.startswith("user_")]
+        start = min(user_idxs)
+        return {
+            "name": fields.index("team_name") + 1,
+            "team": [(field.replace("team_", ''), i + 1) for i, field in enumerate(fields)
+                     if field.startswith("team_") and field != "team_name"],
+            "user": [(field.replace("user_", ''), i - start) for i, field in enumerate(fields)
+                     if field.startswith("user_")],
+            "start": start + 1,
+            "step": max(user_idxs) - start + 1,
+        }
+
+    @staticmethod
+    def __extract__(plan: dict, row: list) -> dict:
+        """Applies a compiled plan to a single csv row."""
+        size = len(row)
+        # Prevent empty team names.
+        if plan["name"] >= size or not row[plan["name"]]:
+            return None
+
+        team = {"name": row[plan["name"]]}
+        for key, idx in plan["team"]:
+            if idx < size:
+                team[key] = row[idx]
+
+        members = team["members"] = []
+        for base in range(plan["start"], size, plan["step"]):
+            user = {key: row[base + idx].strip() for key, idx in plan["user"] if base + idx < size}
+            if user.get("name"):
+                members.append(user)
+        return team
+
     def google_forms(self, store=True) -> dict:
 
         valid_fields = [
@@ -97,100 +138,49 @@ team_name,user_name,user_email
             logger.error("Duplicate fields found.")
             return False
         
-        with open(self.in_file, "r") as f:
+        plan = self.__compile__(fields)
+        teams = []
+
+        with open(self.in_file, "r", newline='') as f:
             reader = csv.reader(f)
-            self.data = list(reader)
-            self.data = [i[1:] for i in self.data[1:]]
+            next(reader, None) # header
+            for row in reader:
+                if (team := self.__extract__(plan, row)):
+                    teams.append(team)
 
-        teamname_idx = fields.index("team_name")
-        teams = [{} for i in range(len(self.data))]
-        
-        iter = 0
-        for i in self.data:
-            # Prevent empty team names.
-            if not i[teamname_idx]:
-                continue
-
-            teams[iter] = {
-                "name": i[teamname_idx]
-            }
-
-            for j in fields:
-                if j.startswith("team_") and j != "team_name":
-                    teams[iter][j.replace("team_", '')] = i[fields.index(j)]
-            
-            user_fields = {}
-            for j in fields:
-                if j.startswith("user_"):
-                    user_fields[j] = fields.index(j)
-
-            teams[iter]["members"] = []
-
-            idxs = []
-            for j in user_fields:
-                idxs.append(user_fields[j] - 1)
-
-            start = min(idxs) + 1
-            diff  = (max(idxs) - start) + 2
-
-            for j in range(start, len(i), diff):
-                user = i[j:j+diff]
-                user_fields = {}
-                for k in fields:
-                    if k.startswith("user_"):
-                        try:
-                            user_fields[
-                                k.replace("user_",'')] = user[
-                                    fields.index(k) - start]
-                        except IndexError:
-                            pass
-
-                if user_fields["name"]:
-                    teams[iter]["members"].append(
-                        {k: user_fields[k].strip() for k in user_fields})
-            iter += 1
-
-        teams = [i for i in teams if i != {}] # remove empty objects.
-        
         if store:
-            if self.out_mode == "json":
-                with open(self.out_file, "w") as f:
-                    f.write(json.dumps(teams, indent=4))
-
-            elif self.out_mode == "yaml":
-                with open(self.out_file, "w") as f:
-                    f.write(yaml.dump(teams, indent=4))
-            
-            elif self.out_mode == "csv":
-                with open(self.out_file, "w", newline='') as f:
-                    writer = csv.writer(f)
-                    for i in teams:
-                        team_str = i
-                        members = []
-                        for j in teams[i]:
-                            if j != "members":
-                                team_str += f":{j}={teams[i][j]}"
-                            else:
-                                for member in teams[i][j]:
-                                    if type(member) == str:
-                                        members.append(member)
-                                    else:
-                                        for name, items in member.items():
-                                            member_str = name
-                                            for k in items:
-                                                member_str += f":{k}={items[k]}"
-                                            members.append(member_str)
-                                    
-                        csv_str = f"{team_str},{','.join(members)}"
-                        # writer.writerow adds an extra newline
-                        writer.writerow(csv_str.split(","))
-            else:
+            if self.out_mode not in ("json", "yaml", "csv"):
                 logger.error(f"Invalid output mode {self.out_mode}")
                 return False
-            
+
+            self.__write__(teams)
             logger.info(f"Output saved to {self.out_file}")
         return teams
+
+    def __write__(self, teams: list):
+        # A failed run never leaves a truncated output behind.
+        with atomic_write(self.out_file, "w", newline='') as f:
+            if self.out_mode == "json":
+                f.write(json.dumps(teams, indent=4))
+
+            elif self.out_mode == "yaml":
+                import yaml
+                f.write(yaml.dump(teams, indent=4))
+
+            elif self.out_mode == "csv":
+                writer = csv.writer(f)
+                for team in teams:
+                    team_str = team["name"] + "".join(
+                        f":{k}={v}" for k, v in team.items() if k not in ("name", "members"))
+                    members = []
+                    for member in team.get("members", []):
+                        if type(member) == str:
+                            members.append(member)
+                        else:
+                            members.append(member["name"] + "".join(
+                                f":{k}={v}" for k, v in member.items() if k != "name"))
+                    writer.writerow([team_str] + members)
     
     def parse(self, store=True) -> dict:
         return self.google_forms(
-            store=store)
\ No newline at end of file
+            store=store)
\ No newline at end of file
@@ -0,0 +1,166 @@
+import csv
+import json
+import re
+import sys
+
+"""
+Filters, group-by counts and projections over user/team records (dicts),
+computed in a single streaming pass.
+
+Filter expressions (several --where are AND-ed):
+    field=value     equal (case-insensitive), `null` matches missing/empty values
+    field!=value    not equal
+    field~regex     matches the regex (case-insensitive)
+    field!~regex    doesn't match the regex
+    field>n, field>=n, field<n, field<=n
+                    numeric comparisons
+
+Besides the record fields, `email_domain` (the part after the @) can be
+used anywhere a field can.
+"""
+
+OPERATORS = ("!=", "!~", ">=", "<=", "=", "~", ">", "<")
+_EXPR = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*(" + "|".join(re.escape(op) for op in OPERATORS) + r")(.*)$")
+
+DEFAULT_FIELDS = {
+    "users": ["id", "name", "email", "team_id", "affiliation", "country", "banned", "hidden"],
+    "teams": ["id", "name", "email", "affiliation", "country", "banned", "hidden"],
+}
+
+def value(record: dict, field: str):
+    if field == "email_domain":
+        email = record.get("email") or ""
+        return email.rsplit("@", 1)[1].lower() if "@" in email else None
+    return record.get(field)
+
+def _text(val) -> str:
+    if val is None:
+        return ""
+    if isinstance(val, bool):
+        return "true" if val else "false"
+    return str(val)
+
+def _sort_key(val) -> tuple:
+    if isinstance(val, (int, float)) and not isinstance(val, bool):
+        return (0, val, "")
+    return (1, 0, _text(val).lower())
+
+def compile_filter(expr: str):
+    """Returns a predicate (record -> bool) for a filter expression; raises ValueError if it is invalid."""
+    match = _EXPR.match(expr)
+    if not match:
+        raise ValueError(f"Invalid filter {expr!r} (expected <field><op><value>, op one of {' '.join(OPERATORS)})")
+    field, op, target = match.group(1), match.group(2), match.group(3).strip()
+
+    if op in ("=", "!="):
+        null = target.lower() == "null"
+        target = target.lower()
+        def equal(record):
+            text = _text(value(record, field))
+            return text == "" if null else text.lower() == target
+        return equal if op == "=" else (lambda record: not equal(record))
+
+    if op in ("~", "!~"):
+        try:
+            pattern = re.compile(target, re.IGNORECASE)
+        except re.error as E:
+            raise ValueError(f"Invalid regex in filter {expr!r}: {E}")
+        search = lambda record: pattern.search(_text(value(record, field))) is not None
+        return search if op == "~" else (lambda record: not search(record))
+
+    try:
+        number = float(target)
+    except ValueError:
+        raise ValueError(f"Invalid number in filter {expr!r}")
+    compare = {
+        ">": lambda a: a > number, ">=": lambda a: a >= number,
+        "<": lambda a: a < number, "<=": lambda a: a <= number,
+    }[op]
+    def numeric(record):
+        try:
+            return compare(float(value(record, field)))
+        except (TypeError, ValueError):
+            return False
+    return numeric
+
+class Query(object):
+
+    """A compiled query over user/team records.
+    Attributes:
+        filters: Predicates every record must satisfy
+        group_by: Fields the records are counted by (None to list them)
+        fields: Projected fields (or the group-by fields followed by `count`)
+        sort: Field to sort on
+        descending: Whether the sort is descending
+        limit: Maximum number of rows
+    """
+
+    def __init__(self, kind: str, where: list = None, group_by: list = None, fields: list = None, sort: str = None, descending: bool = False, limit: int = None):
+        self.filters = [compile_filter(expr) for expr in where or []]
+        self.group_by = group_by or None
+        if self.group_by:
+            self.fields = self.group_by + ["count"]
+        else:
+            self.fields = fields or DEFAULT_FIELDS[kind]
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+
+    def matches(self, record: dict) -> bool:
+        for predicate in self.filters:
+            if not predicate(record):
+                return False
+        return True
+
+    def run(self, records):
+        """Yields the result rows (dicts) for an iterable of records."""
+        if self.group_by:
+            counts = {}
+            for record in records:
+                if self.matches(record):
+                    key = tuple(value(record, field) for field in self.group_by)
+                    counts[key] = counts.get(key, 0) + 1
+            rows = [dict(zip(self.group_by, key), count=count) for key, count in counts.items()]
+            if not self.sort:
+                rows.sort(key=lambda row: -row["count"])
+        else:
+            rows = (
+                {field: value(record, field) for field in self.fields}
+                for record in records if self.matches(record)
+            )
+
+        if self.sort:
+            field = self.sort
+            rows = list(rows)
+            # Numbers before text, missing values always last.
+            present = [row for row in rows if row.get(field) is not None]
+            missing = [row for row in rows if row.get(field) is None]
+            present.sort(key=lambda row: _sort_key(row[field]), reverse=self.descending)
+            rows = present + missing
+
+        for i, row in enumerate(rows):
+            if self.limit is not None and i >= self.limit:
+                return
+            yield row
+
+def write(rows, fields: list, out_format: str = "table", out = None):
+    """Writes the rows as an aligned table, csv or json lines (the last two are streamed)."""
+    out = out or sys.stdout
+    if out_format == "jsonl":
+        for row in rows:
+            out.write(json.dumps(row) + "\n")
+        return
+
+    if out_format == "csv":
+        writer = csv.DictWriter(out, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({field: _text(row.get(field)) for field in fields})
+        return
+
+    table = [[field.upper() for field in fields]]
+    table += [[_text(row.get(field)) for field in fields] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(fields))]
+    for line in table:
+        out.write("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() + "\n")
+    out.write(f"({len(table) - 1} rows)\n")
@@ -0,0 +1,76 @@
+import csv
+import json
+
+"""
+Streaming readers for the bulk-add input files.
+Every reader is a generator yielding one team (dict) at a time, so only
+the entries that are currently being processed are kept in memory.
+"""
+
+def read_csv(path: str):
+    with open(path, "r", newline="") as f:
+        yield from csv.DictReader(f)
+
+def read_jsonl(path: str):
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def read_json(path: str, chunk_size: int = 1 << 16):
+    """Incrementally decodes a top-level json array (a single object is yielded as-is)."""
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        # Skip the leading whitespace, which can be longer than a chunk.
+        buf = ""
+        while not buf and (chunk := f.read(chunk_size)):
+            buf = chunk.lstrip()
+        if not buf.startswith("["):
+            buf += f.read()
+            if buf.strip():
+                yield json.loads(buf)
+            return
+
+        pos, eof = 1, False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos < len(buf) and buf[pos] == "]":
+                return
+
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                obj, end = None, None
+
+            # A value ending exactly at the end of the buffer might be cut off.
+            if end is None or (end == len(buf) and not eof):
+                if eof:
+                    raise ValueError(f"Invalid or truncated json array in {path}")
+                chunk = f.read(chunk_size)
+                eof = chunk == ""
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+
+            yield obj
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
+
+def read_yaml(path: str):
+    """Reads every document of a (multi-document) yaml file."""
+    import yaml
+    with open(path, "r") as f:
+        for document in yaml.safe_load_all(f):
+            if isinstance(document, list):
+                yield from document
+            elif document is not None:
+                yield document
+
+READERS = {
+    "csv": read_csv,
+    "json": read_json,
+    "jsonl": read_jsonl,
+    "yaml": read_yaml,
+}
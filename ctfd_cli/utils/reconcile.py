@@ -0,0 +1,363 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .logger import logger
+from .readers import READERS
+from .conflicts import ConflictIndex
+from .bulker import BulkAdd
+from ..ctfd import CTFd
+from ..schemas import TITLED, titled
+from ..teams.team import TeamObject, TeamHandler
+from ..users.user import UserHandler
+
+"""
+Declarative counterpart of bulk-add: the input is the roster the instance
+should end up with. A snapshot of the instance is diffed against it and
+only the differences are sent, so re-running an unchanged roster costs the
+snapshot and nothing else.
+"""
+
+# Fields compared with the instance (and PATCHed when they differ) when set in the input.
+TEAM_FIELDS = ("email", "affiliation", "website", "country", "hidden", "banned")
+USER_FIELDS = ("email", "affiliation", "website", "country", "hidden", "banned", "verified")
+BOOLEANS = ("hidden", "banned", "verified")
+
+def desired(record, fields: tuple) -> dict:
+    """The fields set in an input record (csv and yaml booleans may be strings)."""
+    values = {}
+    for field in fields:
+        value = getattr(record, field, None)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            continue
+        if field in BOOLEANS and isinstance(value, str):
+            value = value.lower() in ("1", "true", "yes", "y")
+        values[field] = value
+    return values
+
+def _same(field: str, old, new) -> bool:
+    if field == "email" and isinstance(old, str) and isinstance(new, str):
+        return old.lower() == new.lower()
+    # The roster's are title-cased when read, the live ones go through the same function.
+    if field in TITLED and isinstance(old, str) and isinstance(new, str):
+        return titled(old) == titled(new)
+    if field in BOOLEANS:
+        return bool(old) == bool(new)
+    return old == new
+
+def diff(live: dict, values: dict) -> dict:
+    """field -> (live, wanted) for the fields the live record differs on."""
+    return {
+        field: (live.get(field), value)
+        for field, value in values.items() if not _same(field, live.get(field), value)
+    }
+
+class Reconcile(object):
+
+    """Brings the users and teams of an instance in line with a roster (any bulk-add input).
+    Teams are matched by name (or email), members by name, by the name
+    bulk-add would have renamed them to, or by email. Names are compared
+    once normalised with titled(), like the roster's are when it is read,
+    so "red team" on the instance is the roster's "Red Team".
+    Attributes:
+        changes: Per team plan (see plan_team), filled by plan()
+        deletions: Live teams and users that aren't in the roster (admins are never listed)
+        stats: Number of changes of each kind, for teams and users
+    Methods:
+        plan: Snapshot the instance and diff it against the roster
+        show: Print the plan as a diff
+        apply: Send the changes (teams in parallel, deletions last)
+    """
+
+    def __init__(self, input_file: str, format: str, ctfd: CTFd, force: bool = False, delete: bool = False, workers: int = 1, output_file: str = None):
+        self.ctfd = ctfd
+        self.force = force
+        self.delete = delete
+        self.workers = workers
+        self.input_file = input_file
+        self.output_file = output_file
+        self.lock = threading.Lock()
+        self.failed = 0
+
+        if not os.path.isfile(input_file):
+            logger.error(f"Input file {input_file} does not exist.")
+            exit(1)
+
+        if not format:
+            format = os.path.splitext(input_file)[1].lstrip(".").lower().replace("yml", "yaml")
+        if format not in BulkAdd.input_formats:
+            logger.error(f"Invalid format {format}. Must be one of: json, jsonl, csv, yaml.")
+            exit(1)
+
+        if self.workers < 1:
+            logger.error(f"Invalid number of workers {workers}. Must be at least 1.")
+            exit(1)
+
+        self.reader = READERS[format]
+
+    def roster(self) -> list:
+        """Reads the input, resolving the conflicts inside it the same way bulk-add does."""
+        conflicts = ConflictIndex()
+        teams = []
+        for position, entry in enumerate(self.reader(self.input_file)):
+            team = BulkAdd.normalise(entry)
+            conflicts.add(position, team)
+            teams.append((position, team))
+        conflicts.report()
+
+        roster = []
+        for position, team in teams:
+            if (team := BulkAdd.resolve(conflicts, position, team)) is not None:
+                roster.append(team)
+        return roster
+
+    def snapshot(self):
+        """Single paginated snapshot of the users and teams; a failed page aborts (a partial one would plan deletions)."""
+        self.live = {}
+        for kind, index in (("users", self.ctfd.user_index), ("teams", self.ctfd.team_index)):
+            logger.info(f"Taking a snapshot of existing {kind}...")
+            try:
+                entries = [
+                    entry for page in self.ctfd.handler.Paginate(
+                        url=f"{self.ctfd.ctfd_instance}/api/v1/{kind}?view=admin",
+                        token=self.ctfd.ctfd_token,
+                        strict=True
+                    ) for entry in page
+                ]
+            except Exception as E:
+                logger.error(f"Failed to take a snapshot of the {kind}, nothing was changed: {E}")
+                exit(1)
+            index.rebuild(entries)
+            # Several live names can be the same once normalised, the first one wins (hence reversed).
+            self.live[kind] = {
+                "exact": {entry["name"]: entry for entry in entries},
+                "names": {titled(entry["name"] or ""): entry for entry in reversed(entries)},
+                "emails": {entry["email"].lower(): entry for entry in entries if entry.get("email")},
+                "all": entries,
+            }
+            logger.info(f"Found {len(entries)} existing {kind}.")
+
+    def plan(self):
+        self.snapshot()
+        self.claimed = {"users": set(), "teams": set()}
+        self.stats = {
+            "teams": {"create": 0, "update": 0, "delete": 0},
+            "users": {"create": 0, "update": 0, "move": 0, "delete": 0},
+        }
+        self.changes = [change for team in self.roster() if (change := self.plan_team(team))]
+
+        self.deletions = {
+            "teams": [team for team in self.live["teams"]["all"] if team["id"] not in self.claimed["teams"]],
+            "users": [
+                user for user in self.live["users"]["all"]
+                if user["id"] not in self.claimed["users"] and user.get("type") != "admin"
+            ],
+        }
+        if self.delete:
+            self.stats["teams"]["delete"] = len(self.deletions["teams"])
+            self.stats["users"]["delete"] = len(self.deletions["users"])
+
+    def find(self, kind: str, name: str) -> dict:
+        """The live record with this name, an exact match winning over one that only matches once normalised."""
+        return self.live[kind]["exact"].get(name) or self.live[kind]["names"].get(titled(name))
+
+    def match(self, kind: str, name: str, email: str) -> dict:
+        """The live record with this name, else with this email (None if missing, False if it was already matched)."""
+        live = self.find(kind, name)
+        if live is None and email:
+            live = self.live[kind]["emails"].get(email.lower())
+        if live is not None and live["id"] in self.claimed[kind]:
+            logger.error(f"{kind[:-1].title()} {live['name']} (id {live['id']}) matches more than one entry of the roster, skipping {name}.")
+            return False
+        return live
+
+    def plan_team(self, team: TeamObject) -> dict:
+        """
+        Returns the changes of a team and its members:
+            {"team", "id", "create", "update", "members"}
+        where members is a list of (action, member, live user, detail):
+            ("create", member, None, None)
+            ("update", member, user, {field: (live, wanted)})
+            ("move", member, user, old team id or None)
+        """
+        live = self.match("teams", team.name, team.email)
+        if live is False:
+            return None
+
+        change = {"team": team, "id": None, "create": live is None, "update": {}, "members": []}
+        if live is None:
+            self.stats["teams"]["create"] += 1
+        else:
+            self.claimed["teams"].add(live["id"])
+            change["id"] = live["id"]
+            change["update"] = diff(live, {"name": team.name, **desired(team, TEAM_FIELDS)})
+            if change["update"]:
+                self.stats["teams"]["update"] += 1
+
+        for member in team.members:
+            email = getattr(member, "email", None)
+            # bulk-add renames members whose name was taken to name_Team-Name.
+            renamed = ConflictIndex.rename(member.name, team.name)
+            user = self.find("users", renamed)
+            if user is None or live is None or user.get("team_id") != live["id"] or user["id"] in self.claimed["users"]:
+                user = self.match("users", member.name, email)
+                if user is False:
+                    continue
+
+            if user is None:
+                change["members"].append(("create", member, None, None))
+                self.stats["users"]["create"] += 1
+                continue
+
+            self.claimed["users"].add(user["id"])
+            values = desired(member, USER_FIELDS)
+            if titled(user["name"] or "") not in (titled(member.name), titled(renamed)):
+                values["name"] = member.name
+            if (update := diff(user, values)):
+                change["members"].append(("update", member, user, update))
+                self.stats["users"]["update"] += 1
+            if live is None or user.get("team_id") != live["id"]:
+                change["members"].append(("move", member, user, user.get("team_id")))
+                self.stats["users"]["move"] += 1
+
+        if not change["create"] and not change["update"] and not change["members"]:
+            return None
+        return change
+
+    def show(self):
+        """Prints the plan as a diff: + create, ~ update, > move, - delete."""
+        team_names = {team["id"]: team["name"] for team in self.live["teams"]["all"]}
+        changes = lambda update: ", ".join(f"{field}: {old!r} -> {new!r}" for field, (old, new) in update.items())
+
+        for change in self.changes:
+            team = change["team"]
+            if change["create"]:
+                print(f"+ team {team.name!r}")
+            elif change["update"]:
+                print(f"~ team {team.name!r} (id {change['id']}): {changes(change['update'])}")
+            for action, member, user, detail in change["members"]:
+                if action == "create":
+                    print(f"+ user {member.name!r} in {team.name!r}")
+                elif action == "update":
+                    print(f"~ user {user['name']!r} (id {user['id']}): {changes(detail)}")
+                else:
+                    print(f"> user {user['name']!r} (id {user['id']}): {team_names.get(detail, '(no team)')!r} -> {team.name!r}")
+
+        if self.delete:
+            for kind in ("teams", "users"):
+                for entry in self.deletions[kind]:
+                    print(f"- {kind[:-1]} {entry['name']!r} (id {entry['id']})")
+
+        teams, users = self.stats["teams"], self.stats["users"]
+        logger.info(
+            f"Plan: {teams['create']} teams and {users['create']} users to create, "
+            f"{teams['update']} teams and {users['update']} users to update, {users['move']} users to move, "
+            f"{teams['delete']} teams and {users['delete']} users to delete."
+        )
+        if not self.delete and (self.deletions["teams"] or self.deletions["users"]):
+            logger.info(
+                f"{len(self.deletions['teams'])} teams and {len(self.deletions['users'])} users "
+                "are not in the roster (use --delete to remove them)."
+            )
+
+    def reconcile(self):
+        self.plan()
+        self.show()
+
+        if not any(self.stats["teams"].values()) and not any(self.stats["users"].values()):
+            logger.info("The instance already matches the roster.")
+            return
+
+        if not self.force:
+            logger.info("Dry run, use --force to apply the plan.")
+            return
+
+        self.apply()
+        if self.failed:
+            logger.error(f"{self.failed} changes failed, run reconcile again to retry them.")
+            exit(1)
+        logger.info("The instance now matches the roster.")
+
+    def apply(self):
+        """
+        Each team's changes form a chain (create/update the team, then its
+        members) that runs in order inside one worker; different teams
+        never touch the same user, so the chains run in parallel.
+        Deletions only start once every chain is done, so a user moved out
+        of a team that is going away is never lost with it.
+        """
+        th = TeamHandler(self.ctfd)
+        uh = UserHandler(self.ctfd)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for row in pool.map(lambda change: self.apply_team(change, th, uh), self.changes):
+                if row and row["members"] and self.output_file:
+                    with open(self.output_file, "a") as f:
+                        f.write(json.dumps(row) + "\n")
+
+        if not self.delete:
+            return
+
+        tasks = [(th.delete_team, team) for team in self.deletions["teams"]]
+        tasks += [(uh.delete_user, user) for user in self.deletions["users"]]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for (_, entry), ok in zip(tasks, pool.map(lambda task: task[0](task[1]["id"]), tasks)):
+                if not ok:
+                    self.fail(f"Failed to delete {entry['name']} (id {entry['id']})")
+
+    def fail(self, message: str):
+        logger.error(message)
+        with self.lock:
+            self.failed += 1
+
+    def apply_team(self, change: dict, th: TeamHandler, uh: UserHandler) -> dict:
+        """Applies the changes of one team, returns the credentials of the users it created."""
+        team = change["team"]
+        team_id = change["id"]
+        row = {"Name": team.name, "Email": team.email, "members": []}
+
+        try:
+            if change["create"]:
+                if not (created := th.create_team_from_dict(team.to_dict(), return_if_exists=False, mode=dict)):
+                    self.fail(f"Failed to create team {team.name}")
+                    return None
+                team_id = created["id"]
+                # Whatever the create request doesn't carry (e.g. hidden) is patched.
+                update = diff(created, desired(team, TEAM_FIELDS))
+            else:
+                update = change["update"]
+
+            if update and th.update_team_attribute(team_id, attributes={field: new for field, (_, new) in update.items()}, mode=dict) == None:
+                self.fail(f"Failed to update team {team.name}")
+
+            for action, member, user, detail in change["members"]:
+                if action == "update":
+                    if uh.update_user_attribute(user["id"], attributes={field: new for field, (_, new) in detail.items()}, mode=dict) == None:
+                        self.fail(f"Failed to update user {user['name']}")
+
+                elif action == "move":
+                    # The members are known from the snapshot, no lookups needed.
+                    if detail is not None and not th.remove_member(detail, user["id"], members=[user["id"]]):
+                        self.fail(f"Failed to remove {user['name']} from team {detail}")
+                        continue
+                    if th.add_member(team_id, user["id"], members=[]) == None:
+                        self.fail(f"Failed to add {user['name']} to {team.name}")
+
+                else:
+                    data = {**member.to_dict(), **desired(member, USER_FIELDS), "team_id": team_id}
+                    if not (created := uh.create_user_from_dict(data, return_if_exists=False, mode=dict)):
+                        self.fail(f"Failed to create user {member.name}")
+                        continue
+                    if created.get("team_id") != team_id and th.add_member(team_id, created["id"], members=[]) == None:
+                        self.fail(f"Failed to add {member.name} to {team.name}")
+                    if (update := diff(created, desired(member, USER_FIELDS))):
+                        if uh.update_user_attribute(created["id"], attributes={field: new for field, (_, new) in update.items()}, mode=dict) == None:
+                            self.fail(f"Failed to update user {member.name}")
+                    row["members"].append({"name": member.name, "password": member.password})
+        except Exception as E:
+            self.fail(f"An error occurred when reconciling team {team.name}: {E}")
+
+        return row
@@ -0,0 +1,83 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+class TokenBucket(object):
+
+    """Token bucket limiting the rate at which requests are sent.
+    Attributes:
+        rate: Tokens (requests) added per second, 0 disables the limit
+        burst: Maximum number of tokens that can be saved up
+    """
+
+    def __init__(self, rate: float = 0, burst: int = 10):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveLimiter(object):
+
+    """Limits the number of in-flight requests, adapting the limit to the server.
+    The limit grows additively while requests succeed and is halved
+    (at most once per `cooldown` seconds) when the server is throttling
+    or failing, so parallel jobs push it only as hard as it can sustain.
+    """
+
+    def __init__(self, limit: int = 10, min_limit: int = 1, cooldown: float = 1.0):
+        self.max_limit = max(min_limit, limit)
+        self.min_limit = min_limit
+        self.limit = float(self.max_limit)
+        self.cooldown = cooldown
+        self.inflight = 0
+        self.decreased = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.inflight >= int(self.limit):
+                self.cond.wait()
+            self.inflight += 1
+
+    def release(self, success: bool = True):
+        with self.cond:
+            self.inflight -= 1
+            if success:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif time.monotonic() - self.decreased > self.cooldown:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.decreased = time.monotonic()
+            self.cond.notify_all()
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 30) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def retry_after(value: str) -> float:
+    """Parses a Retry-After header (either seconds or an HTTP date)."""
+    if not value:
+        return 0
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,118 @@
+import argparse
+import cmd
+import os
+import shlex
+
+from .logger import logger
+from .utils import cache_dir
+
+class Shell(cmd.Cmd):
+
+    """Interactive shell: each line is a ctfd-cli command, without the global options.
+    Every command runs in this process, so the connection (and its pool),
+    the name -> id indexes and the health check are only set up once.
+    Attributes:
+        parser: The ctfd-cli argument parser, used for tab completion
+        execute: Callable(argv) running a command, returning its exit code
+    """
+
+    prompt = "ctfd> "
+    intro = "CTFd shell, type `help` for the commands and `exit` to leave (tab completes)."
+    history_length = 1000
+
+    def __init__(self, parser: argparse.ArgumentParser, execute):
+        super().__init__()
+        self.parser = parser
+        self.execute = execute
+        self.history = os.path.join(cache_dir(), "shell_history")
+
+    @staticmethod
+    def __subcommands__(parser: argparse.ArgumentParser) -> dict:
+        for action in parser._actions:
+            if isinstance(action, argparse._SubParsersAction):
+                return action.choices
+        return {}
+
+    def run(self):
+        try:
+            import readline
+            try:
+                readline.read_history_file(self.history)
+            except OSError:
+                pass
+            readline.set_history_length(self.history_length)
+            # Options start with dashes, which readline splits words on by default.
+            readline.set_completer_delims(" \t\n")
+        except ImportError:
+            readline = None
+
+        intro = self.intro
+        while True:
+            try:
+                self.cmdloop(intro)
+                break
+            except KeyboardInterrupt:
+                # Ctrl-C drops the current line, not the shell.
+                print()
+                intro = ""
+
+        if readline is not None:
+            try:
+                readline.write_history_file(self.history)
+            except OSError as E:
+                logger.debug(f"Unable to save the shell history: {E}")
+
+    def emptyline(self):
+        pass
+
+    def default(self, line: str):
+        try:
+            argv = shlex.split(line)
+        except ValueError as E:
+            logger.error(f"Invalid command: {E}")
+            return
+        code = self.execute(argv)
+        if code:
+            logger.debug(f"Exit code {code}")
+
+    def do_help(self, line: str):
+        """Shows the help of a command (`help user ban`), or the list of commands."""
+        self.execute(shlex.split(line) + ["--help"])
+        if not line:
+            print("Shell commands: help [command], exit")
+
+    def do_exit(self, line: str) -> bool:
+        """Leaves the shell."""
+        return True
+
+    do_quit = do_exit
+
+    def do_EOF(self, line: str) -> bool:
+        print()
+        return True
+
+    def completenames(self, text: str, *ignored) -> list:
+        names = list(self.__subcommands__(self.parser)) + ["help", "exit"]
+        return [name for name in names if name.startswith(text)]
+
+    def completedefault(self, text: str, line: str, begidx: int, endidx: int) -> list:
+        """Completes the subcommands, then the options of the innermost one."""
+        words = shlex.split(line[:begidx]) if line[:begidx].strip() else []
+        if words and words[0] == "help":
+            words = words[1:]
+
+        parser = self.parser
+        for word in words:
+            subcommands = self.__subcommands__(parser)
+            if word not in subcommands:
+                break
+            parser = subcommands[word]
+
+        subcommands = self.__subcommands__(parser)
+        if subcommands and not text.startswith("-"):
+            candidates = list(subcommands)
+        else:
+            candidates = [option for action in parser._actions for option in action.option_strings]
+        return [candidate + " " for candidate in candidates if candidate.startswith(text)]
+
+    complete_help = completedefault
@@ -0,0 +1,135 @@
+"""
+Transports send a single HTTP request for RequestHandler, which keeps the
+retries, rate limiting and metrics on top of them. Responses only need to
+provide what the handlers use: status_code, headers, content and json().
+
+    requests  A pooled requests.Session (HTTP/1.1, one request per connection at a time)
+    http2     An httpx.AsyncClient speaking HTTP/2, driven by an event loop
+              in a background thread: the requests of every thread are
+              multiplexed as streams over a few connections. HTTP/2 is
+              negotiated over https, falling back to HTTP/1.1
+    h2c       The same, speaking HTTP/2 directly (prior knowledge) over plain
+              http, for instances (or proxies) known to support it
+"""
+
+import importlib.util
+
+TRANSPORTS = ("requests", "http2", "h2c")
+
+class TransportError(Exception):
+    """A transport can't be used with these settings (missing dependency, plain http instance)."""
+
+class RequestsTransport(object):
+
+    """Pooled keep-alive requests.Session.
+    Attributes:
+        session: The session used for every request
+        network_errors: Exceptions meaning no response was received
+    """
+
+    def __init__(self, pool_size: int = 10, headers: dict = None):
+        # requests is by far the slowest import of the cli, so it is only
+        # loaded once a command actually talks to the instance.
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.exceptions import NewConnectionError
+
+        self.network_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+        self.ConnectTimeout = requests.exceptions.ConnectTimeout
+        self.NewConnectionError = NewConnectionError
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(headers or {})
+
+    def request(self, method: str, url: str, headers: dict, timeout: tuple, **kwargs):
+        return self.session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+
+    def unsent(self, error: Exception) -> bool:
+        """True when the request failed before it was sent, so the server can't have processed it."""
+        if isinstance(error, self.ConnectTimeout):
+            return True
+        # requests wraps the urllib3 error, which gives the reason of the failure.
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, self.NewConnectionError)
+
+    @staticmethod
+    def sent(r) -> int:
+        body = r.request.body
+        return len(body) if body else 0
+
+    def close(self):
+        self.session.close()
+
+class HTTP2Transport(object):
+
+    """httpx.AsyncClient with HTTP/2, shared by every thread.
+    Over https the protocol is negotiated (ALPN), falling back to HTTP/1.1
+    when the server doesn't offer HTTP/2. Plain http has no negotiation:
+    HTTP/2 is then only spoken when asked for (cleartext, prior knowledge).
+    Attributes:
+        loop: Event loop running the client, in a daemon thread
+        client: The httpx.AsyncClient
+        network_errors: Exceptions meaning no response was received
+    """
+
+    def __init__(self, pool_size: int = 10, headers: dict = None, cleartext: bool = False):
+        if importlib.util.find_spec("httpx") is None or importlib.util.find_spec("h2") is None:
+            raise TransportError("httpx and h2 are required for the http2 and h2c transports (pip install 'httpx[http2]')")
+        import httpx
+
+        # Only needed by this transport, which most runs don't use.
+        import asyncio
+        import threading
+
+        self.httpx = httpx
+        self.submit = asyncio.run_coroutine_threadsafe
+        self.network_errors = (httpx.TransportError,)
+        # Raised before anything was sent, the only ones retried for non-idempotent requests.
+        self.unsent_errors = (httpx.ConnectError, httpx.ConnectTimeout)
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="http2-transport", daemon=True)
+        self.thread.start()
+
+        async def create():
+            return httpx.AsyncClient(
+                http1=not cleartext,
+                http2=True,
+                headers=headers or {},
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+        self.client = self.submit(create(), self.loop).result()
+
+    def request(self, method: str, url: str, headers: dict, timeout: tuple, **kwargs):
+        connect, read = timeout
+        coroutine = self.client.request(method, url, headers=headers, timeout=self.httpx.Timeout(read, connect=connect), **kwargs)
+        return self.submit(coroutine, self.loop).result()
+
+    def unsent(self, error: Exception) -> bool:
+        """True when the request failed before it was sent, so the server can't have processed it."""
+        return isinstance(error, self.unsent_errors)
+
+    @staticmethod
+    def sent(r) -> int:
+        return len(r.request.content or b"")
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.submit(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+def get_transport(name: str, pool_size: int = 10, headers: dict = None, instance: str = ""):
+    if name == "requests":
+        return RequestsTransport(pool_size=pool_size, headers=headers)
+    if name == "http2":
+        if instance.startswith("http://"):
+            raise TransportError("The http2 transport needs an https instance URL to negotiate HTTP/2 (use h2c if the instance speaks HTTP/2 over plain http).")
+        return HTTP2Transport(pool_size=pool_size, headers=headers)
+    if name == "h2c":
+        return HTTP2Transport(pool_size=pool_size, headers=headers, cleartext=True)
+    raise ValueError(f"Invalid transport {name}. Must be one of: {', '.join(TRANSPORTS)}.")
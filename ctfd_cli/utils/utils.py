@@ -1,7 +1,10 @@
+import contextlib
 import os
-from dotenv import load_dotenv
 import random
 import string
+import sys
+
+_dotenv_loaded = False
 
 def random_string(length: int = 10) -> str:
     import random
@@ -9,10 +12,82 @@ def random_string(length: int = 10) -> str:
     return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
 
 def get_env(key: str, curr: str = None, default: str = None, err_msg: str = None) -> str:
-    load_dotenv()
+    # .env is only read once per run, the first time a setting is looked up.
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _dotenv_loaded = True
     if curr != None:
         return curr
     value = os.getenv(key, default)
     if value is None:
         raise Exception(err_msg)
-    return value
\ No newline at end of file
+    return value
+
+def boolean(value: str) -> bool:
+    """Parses the value of a boolean option (true/false, yes/no, 1/0)."""
+    text = value.strip().lower()
+    if text in ("1", "true", "yes", "y"):
+        return True
+    if text in ("0", "false", "no", "n"):
+        return False
+    raise ValueError(f"Invalid boolean {value!r}")
+
+def get_user_ids(args) -> list:
+    """
+    Returns the (unique) user ids given with --user-id, --user-ids or
+    --user-ids-file, None if none of them was.
+    Raises OSError when the file can't be read, ValueError for an invalid id.
+    """
+    if args.user_id != None:
+        raw = [str(args.user_id)]
+    elif args.user_ids != None:
+        raw = args.user_ids.split(",")
+    elif args.user_ids_file != None:
+        with open(args.user_ids_file, "r") as f:
+            raw = f.read().replace(",", "\n").split()
+    else:
+        return None
+    return list(dict.fromkeys(int(i) for i in raw if i.strip()))
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = "w", newline: str = None):
+    """Opens a temporary file next to `path` that is renamed over it once the
+    block completes, so a failed write never leaves a truncated file behind.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    while True:
+        tmp = os.path.join(directory, f".ctfd-cli-{random_string(8)}.tmp")
+        try:
+            # Created with the usual permissions: unlike mkstemp (0600), this mode goes through the umask.
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, mode, newline=newline) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def cache_dir() -> str:
+    """Returns (and creates) the directory used for on-disk caches.
+    Can be overridden using the CTFD_CLI_CACHE environment variable.
+    """
+    path = os.getenv("CTFD_CLI_CACHE") or os.path.join(
+        os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "ctfd-cli")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def discard_output(stream = None):
+    """Points stdout (or `stream`) at /dev/null once its reader went away
+    (BrokenPipeError, e.g. `| head`), so the writes that follow, and the
+    flush at exit, don't fail again.
+    """
+    stream = stream or sys.stdout
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, stream.fileno())
+    os.close(devnull)
@@ -0,0 +1,104 @@
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import mock_server
+
+class Mock(object):
+
+    """The benchmarks' mock CTFd, served from a thread of the test process.
+    Attributes:
+        url: Base url of the server
+        api: Its API (state, throttle, ...), also used to set up data directly
+    """
+
+    def __init__(self):
+        self.server = mock_server.serve(port=0)
+        self.api = self.server.RequestHandlerClass.api
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def call(self, method: str, path: str, data: dict = None) -> dict:
+        """Calls the API without going through HTTP (nor being counted)."""
+        _, body, _ = self.api.respond(method, path, {"authorization": "Token test"}, json.dumps(data or {}).encode())
+        return body
+
+    def add(self, kind: str, **fields) -> dict:
+        return self.call("POST", f"/api/v1/{kind}", fields)["data"]
+
+    def delete(self, kind: str, _id: int):
+        self.call("DELETE", f"/api/v1/{kind}/{_id}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def mock():
+    server = Mock()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def ctfd(mock, tmp_path, monkeypatch):
+    """A CTFd connected to the mock, with its caches (indexes, mirror) in tmp_path."""
+    monkeypatch.setenv("CTFD_CLI_CACHE", str(tmp_path / "cache"))
+    from ctfd_cli import CTFd
+
+    instance = CTFd(mock.url, "test", index_ttl=0, health_ttl=0, retries=0)
+    yield instance
+    instance.handler.close()
+
+class Dropping(socketserver.BaseRequestHandler):
+
+    """Reads a request, then closes the connection without answering (as if it dropped after processing it)."""
+
+    def handle(self):
+        data = b""
+        while b"\r\n\r\n" not in data:
+            if not (chunk := self.request.recv(65536)):
+                return
+            data += chunk
+        with self.server.lock:
+            self.server.received += 1
+
+@pytest.fixture
+def dropping():
+    """Server dropping every request it receives; `url`, and `received` counts them."""
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Dropping)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.received = 0
+    server.url = "http://127.0.0.1:%d" % server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def silent():
+    """Url of a server accepting connections (in the backlog) but never answering."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    yield "http://127.0.0.1:%d" % sock.getsockname()[1]
+    sock.close()
+
+@pytest.fixture
+def refused():
+    """Url nothing listens on."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return "http://127.0.0.1:%d" % port
@@ -0,0 +1,109 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from ctfd_cli.utils.batch import Batch, to_argv
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ctfd-cli.py")
+
+@pytest.fixture(scope="module")
+def parse():
+    spec = importlib.util.spec_from_file_location("ctfd_cli_main", CLI)
+    cli = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cli)
+    return cli.parser.parse_args
+
+def run(tmp_path, ctfd, parse, lines: list, workers: int = 8) -> tuple:
+    """Runs the lines as a batch; returns (success, results by line)."""
+    path, out = tmp_path / "batch.txt", tmp_path / "results.jsonl"
+    path.write_text("".join(line + "\n" for line in lines))
+    ok = Batch(str(path), ctfd, parse, output_file=str(out), workers=workers).run()
+    return ok, [json.loads(line) for line in out.read_text().splitlines()]
+
+def test_json_lines_become_cli_arguments():
+    assert to_argv('user ban --user-id 3') == ["user", "ban", "--user-id", "3"]
+    assert to_argv(json.dumps({"op": "team add-member", "team_id": 1, "user_ids": [3, 4], "workers": None})) == [
+        "team", "add-member", "--team-id", "1", "--user-ids", "3,4"]
+    assert to_argv(json.dumps({"op": "user create", "name": "a b", "hidden": True, "banned": False})) == [
+        "user", "create", "--name", "a b", "--hidden", "true", "--banned", "false"]
+    assert to_argv(json.dumps({"op": "user update", "user_id": 2, "attributes": {"country": "PK"}})) == [
+        "user", "update", "--user-id", "2", "--attributes", '{"country": "PK"}']
+
+def test_operations_on_an_entity_run_in_order(mock, ctfd, parse, tmp_path):
+    alice, bob = mock.add("users", name="alice"), mock.add("users", name="bob")
+    # Responses take a random time, so operations running out of order would show.
+    mock.api.jitter = 0.02
+
+    lines = []
+    for i in range(15):
+        for user, prefix in ((alice, "A"), (bob, "B")):
+            lines.append(json.dumps({"op": "user update", "user_id": user["id"], "attributes": {"country": f"{prefix}{i}"}}))
+    ok, results = run(tmp_path, ctfd, parse, lines)
+
+    assert ok and len(results) == 30
+    assert mock.api.state.users[alice["id"]]["country"] == "A14"
+    assert mock.api.state.users[bob["id"]]["country"] == "B14"
+    # Each user's results come back in the order of the file, the two users interleaved.
+    for parity in (0, 1):
+        numbers = [result["line"] for result in results if result["line"] % 2 != parity]
+        assert numbers == sorted(numbers)
+
+def test_member_changes_are_ordered_with_the_user(mock, ctfd, parse, tmp_path):
+    team, user = mock.add("teams", name="Alpha"), mock.add("users", name="alice")
+    mock.api.jitter = 0.02
+
+    lines = [
+        f"team add-member --team-id {team['id']} --user-id {user['id']}",
+        f"user get --user-id {user['id']}",
+        f"team del-member --team-id {team['id']} --user-id {user['id']}",
+        f"user get --user-id {user['id']}",
+        f"team add-member --team-id {team['id']} --user-id {user['id']}",
+    ]
+    ok, results = run(tmp_path, ctfd, parse, lines)
+
+    assert ok
+    assert [result["line"] for result in results] == [1, 2, 3, 4, 5]
+    assert [results[i]["result"]["team_id"] for i in (1, 3)] == [team["id"], None]
+    assert mock.api.state.teams[team["id"]]["members"] == [user["id"]]
+
+def test_failures_are_reported_per_line(mock, ctfd, parse, tmp_path):
+    user = mock.add("users", name="alice")
+    ok, results = run(tmp_path, ctfd, parse, [
+        "# comment",
+        "",
+        f"user get --user-id {user['id']}",
+        "user frobnicate --user-id 1",
+        "user list",
+        "user get --user-id 999",
+    ])
+
+    assert not ok
+    by_line = {result["line"]: result for result in results}
+    assert sorted(by_line) == [3, 4, 5, 6]
+    assert by_line[3]["ok"] and by_line[3]["result"]["name"] == "alice"
+    assert not by_line[4]["ok"] and "invalid choice" in by_line[4]["error"]
+    assert not by_line[5]["ok"] and "can't be used in a batch" in by_line[5]["error"]
+    assert not by_line[6]["ok"]
+
+@pytest.mark.parametrize("lines, code", [
+    (["user get --user-id 1"], 0),
+    (["user get --user-id 1", "user get --user-id 999"], 1),
+    (["user get --user-id 1", "user get --user-id nope"], 1),
+])
+def test_exit_code(mock, tmp_path, lines, code):
+    mock.add("users", name="alice")
+    path = tmp_path / "batch.txt"
+    path.write_text("".join(line + "\n" for line in lines))
+
+    process = subprocess.run(
+        [sys.executable, CLI, "--ctfd-instance", mock.url, "--ctfd-token", "test", "--health-ttl", "0", "batch", "-f", str(path)],
+        cwd=tmp_path, env={**os.environ, "CTFD_CLI_CACHE": str(tmp_path / "cache")}, capture_output=True, text=True, timeout=60,
+    )
+    assert process.returncode == code, process.stderr
+    # Invalid lines are reported as they are read, before the operations complete.
+    results = sorted((json.loads(line) for line in process.stdout.splitlines()), key=lambda result: result["line"])
+    assert [result["ok"] for result in results] == [True] + [False] * (len(lines) - 1)
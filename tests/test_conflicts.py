@@ -0,0 +1,38 @@
+from ctfd_cli.utils.bulker import BulkAdd
+from ctfd_cli.utils.conflicts import ConflictIndex
+
+def index(entries: list) -> tuple:
+    conflicts = ConflictIndex()
+    teams = [BulkAdd.normalise(entry) for entry in entries]
+    for position, team in enumerate(teams):
+        conflicts.add(position, team)
+    return conflicts, teams
+
+def test_the_first_team_keeps_its_name_and_email():
+    conflicts, _ = index([
+        {"name": "Alpha", "email": "alpha@x.io"},
+        {"name": "alpha"},
+        {"name": "Beta", "email": "ALPHA@x.io"},
+        {"name": "Gamma", "email": "gamma@x.io, other@x.io"},
+    ])
+    assert conflicts.dropped_teams == {1, 2}
+    assert [conflict["type"] for conflict in conflicts.conflicts] == ["team_name", "team_email"]
+
+def test_members_are_renamed_or_dropped():
+    conflicts, teams = index([
+        {"name": "Alpha", "members": [{"name": "sam", "email": "sam@x.io"}, {"name": "kim", "email": "kim@x.io"}]},
+        {"name": "Beta", "members": [{"name": "sam"}, {"name": "lee", "email": "KIM@x.io"}]},
+        {"name": "Gamma Ray", "members": [{"name": "sam"}, {"name": "sam"}]},
+    ])
+    assert conflicts.renames == {(1, 0): "Sam_Beta", (2, 0): "Sam_Gamma-Ray"}
+    # Same email as kim, and a second rename of sam into the same team.
+    assert conflicts.dropped_members == {(1, 1), (2, 1)}
+
+    resolved = [BulkAdd.resolve(conflicts, position, team) for position, team in enumerate(teams)]
+    assert [[member.name for member in team.members] for team in resolved] == [
+        ["Sam", "Kim"], ["Sam_Beta"], ["Sam_Gamma-Ray"],
+    ]
+
+def test_dropped_teams_are_not_resolved():
+    conflicts, teams = index([{"name": "Alpha"}, {"name": "Alpha", "members": ["sam"]}])
+    assert BulkAdd.resolve(conflicts, 1, teams[1]) is None
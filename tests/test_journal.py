@@ -0,0 +1,56 @@
+import json
+
+from ctfd_cli.utils.bulker import BulkAdd
+from ctfd_cli.utils.journal import Journal
+
+def write_input(path, teams: list):
+    path.write_text("".join(json.dumps(team) + "\n" for team in teams))
+
+def rows(path) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_resume_reuses_what_the_interrupted_run_created(mock, ctfd, tmp_path):
+    input_file, output = tmp_path / "teams.jsonl", tmp_path / "out.jsonl"
+    write_input(input_file, [{"name": "Team A", "members": [
+        {"name": "Alice", "email": "alice@x.io"},
+        {"name": "Bob", "email": "bob@x.io"},
+    ]}])
+
+    # Left behind by a crash: the team and its first user exist, the user isn't a member yet.
+    team = mock.add("teams", name="Team A")
+    alice = mock.add("users", name="Alice", email="alice@x.io")
+    with open(f"{output}.journal", "w") as f:
+        f.write(json.dumps({"event": "team", "team": "Team A", "id": team["id"]}) + "\n")
+        f.write(json.dumps({"event": "user", "team": "Team A", "key": "Alice", "id": alice["id"], "name": "Alice", "password": "from-journal"}) + "\n")
+        f.write('{"event": "member", "te')
+
+    BulkAdd(str(input_file), "jsonl", "json", str(output), force=True, ctfd=ctfd).add()
+
+    state = mock.api.state
+    assert len(state.teams) == 1 and len(state.users) == 2
+    bob = next(user for user in state.users.values() if user["name"] == "Bob")
+    assert state.teams[team["id"]]["members"] == [alice["id"], bob["id"]]
+
+    [row] = rows(output)
+    assert row["Name"] == "Team A"
+    assert row["members"][0] == {"name": "Alice", "password": "from-journal"}
+    assert Journal(f"{output}.journal").done("Team A")
+
+def test_completed_teams_are_not_added_again(mock, ctfd, tmp_path):
+    input_file, output = tmp_path / "teams.jsonl", tmp_path / "out.jsonl"
+    write_input(input_file, [
+        {"name": f"Team {i}", "members": [{"name": f"user{i}", "email": f"user{i}@x.io"}]}
+        for i in range(3)
+    ])
+
+    BulkAdd(str(input_file), "jsonl", "json", str(output), force=True, ctfd=ctfd).add()
+    requests = mock.api.state.requests
+
+    rerun = BulkAdd(str(input_file), "jsonl", "json", str(output), force=True, ctfd=ctfd)
+    rerun.add()
+
+    assert rerun.logged == 3
+    assert len(rows(output)) == 3
+    assert len(mock.api.state.users) == 3
+    # Only the snapshot (one page of users, one of teams).
+    assert mock.api.state.requests - requests == 2
@@ -0,0 +1,87 @@
+import pytest
+
+from ctfd_cli.utils.handler import Mode, RequestHandler
+from ctfd_cli.utils.metrics import BUCKETS, Metrics, endpoint
+
+@pytest.mark.parametrize("url, expected", [
+    ("http://ctfd.io/api/v1/teams/12/members?page=2", "/api/v1/teams/{id}/members"),
+    ("http://ctfd.io/api/v1/users/3", "/api/v1/users/{id}"),
+    ("http://ctfd.io/api/v1/users/me", "/api/v1/users/me"),
+    ("http://ctfd.io/api/v1/users?page=3&per_page=50", "/api/v1/users"),
+    ("http://ctfd.io", "/"),
+])
+def test_ids_are_folded(url, expected):
+    assert endpoint(url) == expected
+
+def sample() -> Metrics:
+    metrics = Metrics()
+    metrics.record("GET", "http://ctfd.io/api/v1/teams/1", 200, 0.004, 0, 100)
+    metrics.record("GET", "http://ctfd.io/api/v1/teams/2", 429, 0.02, 0, 10)
+    metrics.record("GET", "http://ctfd.io/api/v1/teams/2", 200, 0.3, 0, 100, retry=True)
+    metrics.record("GET", "http://ctfd.io/api/v1/teams/3", None, 60.0)
+    metrics.record("POST", "http://ctfd.io/api/v1/users", 200, 0.05, 40, 200)
+    return metrics
+
+def test_attempts_are_folded_per_endpoint():
+    data = sample().to_dict()
+    assert (data["requests"], data["retries"], data["errors"]) == (5, 1, 1)
+    assert data["bytes"] == {"sent": 40, "received": 410}
+
+    teams = next(entry for entry in data["endpoints"] if entry["endpoint"] == "/api/v1/teams/{id}")
+    assert teams["method"] == "GET"
+    assert teams["count"] == 4
+    assert teams["statuses"] == {"200": 2, "429": 1}
+    assert teams["seconds"]["max"] == 60.0
+    assert teams["buckets"]["0.005"] == 1 and teams["buckets"]["0.025"] == 1
+    assert teams["buckets"]["0.5"] == 1 and teams["buckets"]["+Inf"] == 1
+    assert sum(teams["buckets"].values()) == teams["count"]
+
+def test_quantiles_are_bucket_bounds():
+    metrics = Metrics()
+    for seconds in [0.001] * 90 + [0.2] * 10:
+        metrics.record("GET", "http://ctfd.io/api/v1/users", 200, seconds)
+    [users] = metrics.to_dict()["endpoints"]
+    # The upper bound of the bucket, capped by the slowest attempt.
+    assert users["seconds"]["p50"] == 0.005
+    assert users["seconds"]["p95"] == 0.2
+
+def test_prometheus_export():
+    lines = sample().to_prometheus().splitlines()
+    labels = 'method="GET",endpoint="/api/v1/teams/{id}"'
+
+    buckets = [line for line in lines if line.startswith(f"ctfd_cli_request_duration_seconds_bucket{{{labels},")]
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert len(buckets) == len(BUCKETS) + 1
+    assert counts == sorted(counts) and counts[-1] == 4
+    assert buckets[-1].startswith(f'ctfd_cli_request_duration_seconds_bucket{{{labels},le="+Inf"}}')
+
+    assert f"ctfd_cli_request_duration_seconds_count{{{labels}}} 4" in lines
+    assert f"ctfd_cli_request_duration_seconds_sum{{{labels}}} 60.324000" in lines
+    assert f'ctfd_cli_requests_total{{{labels},status="429"}} 1' in lines
+    assert f"ctfd_cli_request_retries_total{{{labels}}} 1" in lines
+    assert f"ctfd_cli_request_errors_total{{{labels}}} 1" in lines
+    assert 'ctfd_cli_request_sent_bytes_total{method="POST",endpoint="/api/v1/users"} 40' in lines
+    assert "# TYPE ctfd_cli_request_duration_seconds histogram" in lines
+    assert all(line.startswith("#") or line.startswith("ctfd_cli_") for line in lines)
+
+def test_requests_are_recorded(mock):
+    handler = RequestHandler(retries=0)
+    try:
+        r = handler.MakeRequest(Mode.POST, f"{mock.url}/api/v1/users", "test", json={"name": "alice"})
+        handler.MakeRequest(Mode.GET, f"{mock.url}/api/v1/users/{r.json()['data']['id']}", "test")
+    finally:
+        handler.close()
+
+    data = handler.metrics.to_dict()
+    assert [(entry["method"], entry["endpoint"], entry["count"]) for entry in data["endpoints"]] == [
+        ("POST", "/api/v1/users", 1), ("GET", "/api/v1/users/{id}", 1),
+    ]
+    assert data["bytes"]["sent"] == len(b'{"name": "alice"}')
+    assert data["bytes"]["received"] > 0
+
+def test_summary_lists_every_endpoint():
+    summary = sample().summary().splitlines()
+    assert summary[0].split()[:3] == ["METHOD", "ENDPOINT", "COUNT"]
+    # Slowest endpoint (total time) first.
+    assert summary[1].split()[:3] == ["GET", "/api/v1/teams/{id}", "4"]
+    assert summary[-1].startswith("5 requests (1 retries, 1 errors)")
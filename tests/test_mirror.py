@@ -0,0 +1,55 @@
+import pytest
+
+from ctfd_cli.utils.mirror import Mirror
+
+@pytest.fixture
+def mirror(tmp_path):
+    mirror = Mirror(str(tmp_path / "mirror.db"))
+    yield mirror
+    mirror.close()
+
+def add_users(mock, start: int, count: int):
+    for i in range(start, start + count):
+        mock.add("users", name=f"user{i}", email=f"user{i}@x.io")
+
+def sync(mirror, mock, ctfd, **kwargs) -> dict:
+    pages = lambda start: ctfd.handler.Paginate(
+        f"{ctfd.ctfd_instance}/api/v1/users?view=admin", ctfd.ctfd_token, per_page=50, start=start, strict=True)
+    return mirror.sync("users", pages, per_page=50, **kwargs)
+
+def test_full_then_incremental_sync(mock, ctfd, mirror):
+    add_users(mock, 0, 120)
+    stats = sync(mirror, mock, ctfd)
+    assert stats == {"mode": "full", "pages": 3, "fetched": 120, "deleted": 0, "total": 120}
+
+    # Only the page holding the last mirrored user and the ones after it.
+    add_users(mock, 120, 40)
+    requests = mock.api.state.requests
+    stats = sync(mirror, mock, ctfd)
+    assert stats == {"mode": "incremental", "pages": 2, "fetched": 60, "deleted": 0, "total": 160}
+    assert mock.api.state.requests - requests == 2
+    assert mirror.find("users", name="user159")["email"] == "user159@x.io"
+
+def test_deletions_before_the_last_page_fall_back_to_a_full_sync(mock, ctfd, mirror):
+    add_users(mock, 0, 150)
+    sync(mirror, mock, ctfd)
+
+    mock.delete("users", 10)
+    stats = sync(mirror, mock, ctfd)
+    assert stats["mode"] == "full"
+    assert stats["deleted"] == 1 and stats["total"] == 149
+    assert mirror.get("users", 10) is None
+
+def test_deletions_in_the_last_page_are_seen_incrementally(mock, ctfd, mirror):
+    add_users(mock, 0, 120)
+    sync(mirror, mock, ctfd)
+
+    mock.delete("users", 119)
+    stats = sync(mirror, mock, ctfd)
+    assert stats["mode"] == "incremental"
+    assert stats["deleted"] == 1 and stats["total"] == 119
+
+def test_forced_full_sync(mock, ctfd, mirror):
+    add_users(mock, 0, 60)
+    sync(mirror, mock, ctfd)
+    assert sync(mirror, mock, ctfd, full=True)["mode"] == "full"
@@ -0,0 +1,63 @@
+import pytest
+
+from ctfd_cli.utils.query import Query, compile_filter
+
+RECORDS = [
+    {"id": 1, "name": "Alice", "email": "alice@Example.com", "country": "FR", "score": 30, "banned": False},
+    {"id": 2, "name": "bob", "email": "bob@uni.edu", "country": None, "score": 5, "banned": True},
+    {"id": 3, "name": "Carol", "email": "carol@example.com", "country": "DE", "score": "12", "banned": False},
+    {"id": 4, "name": "dave", "email": None, "country": "", "banned": False},
+]
+
+def ids(expr: str) -> list:
+    predicate = compile_filter(expr)
+    return [record["id"] for record in RECORDS if predicate(record)]
+
+@pytest.mark.parametrize("expr, expected", [
+    ("name=alice", [1]),
+    ("name = BOB", [2]),
+    ("banned=true", [2]),
+    ("country=null", [2, 4]),
+    ("country!=null", [1, 3]),
+    ("name!=alice", [2, 3, 4]),
+    ("email~@example\\.com$", [1, 3]),
+    ("email!~example", [2, 4]),
+    ("score>10", [1, 3]),
+    ("score>=30", [1]),
+    ("score<12", [2]),
+    ("score<=12", [2, 3]),
+    ("email_domain=example.com", [1, 3]),
+    ("email_domain=null", [4]),
+])
+def test_filters(expr, expected):
+    assert ids(expr) == expected
+
+@pytest.mark.parametrize("expr", ["name", "=alice", "1name=x", "name~(", "score>ten"])
+def test_invalid_filters_raise(expr):
+    with pytest.raises(ValueError):
+        compile_filter(expr)
+
+def test_filters_are_anded():
+    query = Query("users", where=["email_domain=example.com", "score>20"], fields=["id"])
+    assert list(query.run(RECORDS)) == [{"id": 1}]
+
+def test_group_by_counts():
+    query = Query("users", group_by=["email_domain"])
+    assert query.fields == ["email_domain", "count"]
+    assert list(query.run(RECORDS)) == [
+        {"email_domain": "example.com", "count": 2},
+        {"email_domain": "uni.edu", "count": 1},
+        {"email_domain": None, "count": 1},
+    ]
+
+def test_sort_puts_missing_values_last():
+    query = Query("users", fields=["id", "score"], sort="score")
+    assert [row["id"] for row in query.run(RECORDS)] == [2, 1, 3, 4]
+
+    query = Query("users", fields=["id", "score"], sort="score", descending=True)
+    assert [row["id"] for row in query.run(RECORDS)] == [3, 1, 2, 4]
+
+def test_limit():
+    query = Query("users", fields=["id"], sort="id", descending=True, limit=2)
+    assert list(query.run(RECORDS)) == [{"id": 4}, {"id": 3}]
+    assert list(Query("users", limit=0).run(RECORDS)) == []
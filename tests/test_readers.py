@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from ctfd_cli.utils.readers import read_json
+
+DOCUMENTS = [
+    [],
+    [{"name": "Alpha", "members": [{"name": "sam"}, {"name": "kim", "email": "kim@x.io"}]}, {"name": "Beta"}],
+    [{"name": "a ] b, c", "note": "\"quoted\" [x]"}, {"name": "Équipe ünïcödé ☃"}, 1, "two", None, [3, [4]]],
+    [{"name": f"Team {i}", "members": [{"name": f"user{i}_{j}"} for j in range(i % 4)]} for i in range(200)],
+]
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 1 << 16])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_read_json_matches_json_load(tmp_path, document, chunk_size, indent):
+    path = tmp_path / "teams.json"
+    path.write_text("\n  " + json.dumps(document, indent=indent, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    with open(path) as f:
+        expected = json.load(f)
+    assert list(read_json(str(path), chunk_size=chunk_size)) == expected
+
+def test_a_single_object_is_yielded_as_is(tmp_path):
+    path = tmp_path / "team.json"
+    path.write_text(json.dumps({"name": "Alpha", "members": ["sam"]}, indent=4))
+    assert list(read_json(str(path), chunk_size=4)) == [{"name": "Alpha", "members": ["sam"]}]
+
+@pytest.mark.parametrize("text", ['[{"name": "Alpha"}, {"name": "Be', '[{"name": "Alpha"}', '[{"name": "Alpha"}, {'])
+def test_truncated_array_raises(tmp_path, text):
+    path = tmp_path / "teams.json"
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        list(read_json(str(path), chunk_size=8))
@@ -0,0 +1,66 @@
+import json
+
+from ctfd_cli.utils.reconcile import Reconcile
+
+def plan(tmp_path, ctfd, roster: list, delete: bool = True) -> Reconcile:
+    path = tmp_path / "roster.json"
+    path.write_text(json.dumps(roster))
+    reconcile = Reconcile(str(path), "", ctfd, delete=delete)
+    reconcile.plan()
+    return reconcile
+
+def team_with(mock, name: str, *users: dict) -> dict:
+    team = mock.add("teams", name=name)
+    for user in users:
+        mock.add("users", team_id=team["id"], **user)
+    return team
+
+def test_names_are_matched_once_normalised(mock, ctfd, tmp_path):
+    team_with(mock, "red team", {"name": "alice"}, {"name": "bob smith", "email": "bob@x.io"})
+
+    reconcile = plan(tmp_path, ctfd, [{"name": "RED TEAM", "members": ["alice", {"name": "Bob Smith", "email": "BOB@x.io"}]}])
+    assert reconcile.changes == []
+    assert reconcile.deletions == {"teams": [], "users": []}
+    assert reconcile.stats == {
+        "teams": {"create": 0, "update": 0, "delete": 0},
+        "users": {"create": 0, "update": 0, "move": 0, "delete": 0},
+    }
+
+def test_an_exact_name_wins_over_a_normalised_one(mock, ctfd, tmp_path):
+    team_with(mock, "blue", {"name": "carol"}, {"name": "Carol"})
+
+    reconcile = plan(tmp_path, ctfd, [{"name": "Blue", "members": ["carol"]}])
+    [deleted] = reconcile.deletions["users"]
+    assert deleted["name"] == "carol"
+
+def test_renames_moves_creates_and_deletions(mock, ctfd, tmp_path):
+    red = team_with(mock, "Red", {"name": "Old Name", "email": "dan@x.io"}, {"name": "Eve"})
+    team_with(mock, "Blue", {"name": "Frank"})
+    mock.add("users", name="Mallory")
+
+    reconcile = plan(tmp_path, ctfd, [
+        {"name": "Red", "members": [{"name": "New Name", "email": "dan@x.io"}, "Frank", "Grace"]},
+    ])
+
+    [change] = reconcile.changes
+    assert change["id"] == red["id"] and not change["create"]
+    actions = [(action, member.name, detail) for action, member, _, detail in change["members"]]
+    assert actions == [
+        ("update", "New Name", {"name": ("Old Name", "New Name")}),
+        ("move", "Frank", 2),
+        ("create", "Grace", None),
+    ]
+    assert [team["name"] for team in reconcile.deletions["teams"]] == ["Blue"]
+    assert sorted(user["name"] for user in reconcile.deletions["users"]) == ["Eve", "Mallory"]
+    assert reconcile.stats["users"] == {"create": 1, "update": 1, "move": 1, "delete": 2}
+
+def test_members_renamed_by_bulk_add_are_matched(mock, ctfd, tmp_path):
+    team_with(mock, "Alpha", {"name": "Sam"})
+    team_with(mock, "Beta Team", {"name": "Sam_Beta-Team"})
+
+    reconcile = plan(tmp_path, ctfd, [
+        {"name": "Alpha", "members": ["sam"]},
+        {"name": "Beta Team", "members": ["sam"]},
+    ])
+    assert reconcile.changes == []
+    assert reconcile.deletions == {"teams": [], "users": []}
@@ -0,0 +1,95 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+from ctfd_cli.utils import handler as handler_module
+from ctfd_cli.utils.handler import Mode, RequestHandler
+from ctfd_cli.utils.scheduler import AdaptiveLimiter, retry_after
+
+@pytest.fixture
+def handler(monkeypatch):
+    # Only the Retry-After of the responses is waited for.
+    monkeypatch.setattr(handler_module, "backoff", lambda attempt: 0)
+    handler = RequestHandler(pool_size=4, timeout=(1, 2), retries=3)
+    yield handler
+    handler.close()
+
+def attempts(handler) -> list:
+    """Status of every attempt made by `handler` (None when no response was received)."""
+    statuses = []
+    handler.hooks.append(lambda method, url, status, *_: statuses.append(status))
+    return statuses
+
+def test_throttled_requests_wait_for_retry_after(mock, handler):
+    mock.api.throttle, mock.api.retry_after = 1.0, 0.1
+    statuses = attempts(handler)
+    handler.hooks.append(lambda *_: len(statuses) == 2 and setattr(mock.api, "throttle", 0))
+
+    start = time.perf_counter()
+    r = handler.MakeRequest(Mode.GET, f"{mock.url}/api/v1/users", "test")
+    assert r.status_code == 200
+    assert statuses == [429, 429, 200]
+    assert time.perf_counter() - start >= 0.2
+    assert handler.metrics.to_dict()["retries"] == 2
+    assert handler.limiter.inflight == 0
+
+def test_the_last_response_is_returned_once_out_of_retries(mock, handler):
+    mock.api.throttle, mock.api.retry_after = 1.0, 0.01
+    statuses = attempts(handler)
+
+    r = handler.MakeRequest(Mode.GET, f"{mock.url}/api/v1/users", "test")
+    assert r.status_code == 429
+    assert statuses == [429] * 4
+    # Halved by the throttling, at most once per cooldown.
+    assert handler.limiter.limit < 4 and handler.limiter.inflight == 0
+
+def test_throttled_posts_are_retried(mock, handler):
+    mock.api.throttle, mock.api.retry_after = 1.0, 0.01
+    statuses = attempts(handler)
+    handler.hooks.append(lambda *_: setattr(mock.api, "throttle", 0))
+
+    r = handler.MakeRequest(Mode.POST, f"{mock.url}/api/v1/users", "test", json={"name": "alice"})
+    assert r.status_code == 200
+    assert statuses == [429, 200]
+    assert len(mock.api.state.users) == 1
+
+def test_sent_posts_are_not_retried(dropping, handler):
+    statuses = attempts(handler)
+    assert handler.MakeRequest(Mode.POST, f"{dropping.url}/api/v1/users", "test", json={"name": "alice"}) is None
+    assert statuses == [None]
+    assert dropping.received == 1
+    assert handler.limiter.inflight == 0
+
+def test_dropped_gets_are_retried(dropping, handler):
+    statuses = attempts(handler)
+    assert handler.MakeRequest(Mode.GET, f"{dropping.url}/api/v1/users", "test") is None
+    assert statuses == [None] * 4
+    assert dropping.received == 4
+
+def test_unsent_posts_are_retried(refused, handler):
+    statuses = attempts(handler)
+    assert handler.MakeRequest(Mode.POST, f"{refused}/api/v1/users", "test", json={"name": "alice"}) is None
+    assert statuses == [None] * 4
+    assert handler.metrics.to_dict()["errors"] == 4
+    assert handler.limiter.inflight == 0
+
+@pytest.mark.parametrize("value, low, high", [
+    (None, 0, 0), ("", 0, 0), ("2", 2, 2), ("0.5", 0.5, 0.5), ("-3", 0, 0), ("soon", 0, 0),
+    (formatdate(0, usegmt=True), 0, 0),
+])
+def test_retry_after(value, low, high):
+    assert low <= retry_after(value) <= high
+
+def test_retry_after_http_date():
+    assert 25 <= retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+
+def test_limiter_grows_back_after_halving():
+    limiter = AdaptiveLimiter(limit=8, cooldown=0)
+    limiter.acquire()
+    limiter.release(success=False)
+    assert limiter.limit == 4
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(success=True)
+    assert limiter.limit == 8 and limiter.inflight == 0
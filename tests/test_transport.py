@@ -0,0 +1,69 @@
+import importlib.util
+import threading
+
+import pytest
+
+import mock_server
+from ctfd_cli.utils import transport
+from ctfd_cli.utils.transport import HTTP2Transport, RequestsTransport, TransportError, get_transport
+
+def failure(client, method: str, url: str) -> Exception:
+    """The network error raised by a request of `client`."""
+    with pytest.raises(client.network_errors) as error:
+        client.request(method, url, headers={}, timeout=(0.5, 0.5), json={"name": "alice"})
+    return error.value
+
+@pytest.fixture
+def requests_transport():
+    client = get_transport("requests")
+    yield client
+    client.close()
+
+@pytest.fixture
+def http2_transport():
+    pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+    client = get_transport("h2c")
+    yield client
+    client.close()
+
+@pytest.fixture
+def h2c():
+    """Url of the mock server speaking HTTP/2 over plain http."""
+    pytest.importorskip("h2")
+    server = mock_server.serve(port=0, http2=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+
+def test_selection():
+    client = get_transport("requests", instance="http://ctfd.io")
+    assert isinstance(client, RequestsTransport)
+    client.close()
+    with pytest.raises(ValueError):
+        get_transport("http3")
+
+def test_http2_needs_https():
+    with pytest.raises(TransportError, match="h2c"):
+        get_transport("http2", instance="http://ctfd.io")
+
+def test_http2_needs_httpx(monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(transport.importlib.util, "find_spec", lambda name, *args: None if name == "httpx" else find_spec(name, *args))
+    with pytest.raises(TransportError, match="httpx"):
+        get_transport("h2c")
+
+def test_requests_unsent(requests_transport, refused, dropping, silent):
+    assert requests_transport.unsent(failure(requests_transport, "POST", refused))
+    assert not requests_transport.unsent(failure(requests_transport, "POST", dropping.url))
+    assert not requests_transport.unsent(failure(requests_transport, "POST", silent))
+
+def test_http2_unsent(http2_transport, refused, silent):
+    assert http2_transport.unsent(failure(http2_transport, "POST", refused))
+    assert not http2_transport.unsent(failure(http2_transport, "POST", silent))
+
+def test_h2c_speaks_http2(http2_transport, h2c):
+    r = http2_transport.request("POST", f"{h2c}/api/v1/users", headers={"Authorization": "Token test"}, timeout=(1, 1), json={"name": "alice"})
+    assert r.status_code == 200 and r.http_version == "HTTP/2"
+    assert r.json()["data"]["name"] == "alice"
+    assert HTTP2Transport.sent(r) == len(b'{"name":"alice"}')